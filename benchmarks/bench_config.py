@@ -0,0 +1,131 @@
+"""
+Memory benchmark of the topic configurations held while the application
+runs: the schema classes the configuration file is read into, against the
+compact runtime form they are lowered into, each with the routing index
+compiled from them.
+
+Reports the bytes held per topic, measured with tracemalloc, and the seconds
+taken, without tracemalloc, to read, lower and index the configurations and
+to load them from a snapshot. Topics share one of --options distinct sets of options, as
+generated configurations usually do.
+
+Usage:
+    python -m benchmarks.bench_config [--sizes 1000 10000 50000] [--options 10] [--json]
+"""
+
+import argparse
+import gc
+import json
+import pickle
+import time
+import tracemalloc
+
+from nsp_ntfy.app.data.data_classes import NtfyModuleConfig
+from nsp_ntfy.app.data.runtime import lower_configuration
+from nsp_ntfy.app.main import build_routing_index
+from nsp_ntfy.app.request import encode_headers
+
+
+def build_document(size: int, options: int) -> dict:
+    return {
+        "logging": {"file": "bench.log"},
+        "configurations": [
+            {
+                "mqtt_topic": f"nsp/device-{index}/events",
+                "ntfy": {
+                    "topic": f"night-sky-{index}",
+                    "options": {
+                        "title": f"Night Sky Pi {index % options}",
+                        "priority": 3 + index % 3,
+                        "tags": ["telescope", f"camera-{index % options}"],
+                    },
+                },
+                "coalesce": {"window_ms": 5000, "max_messages": 20},
+            }
+            for index in range(size)
+        ],
+    }
+
+
+def held() -> int:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def load(text: str, lower: bool):
+    started = time.perf_counter()
+    configuration = NtfyModuleConfig.from_dict(json.loads(text))
+    read = time.perf_counter()
+    if lower:
+        lower_configuration(configuration)
+    lowered = time.perf_counter()
+    index = build_routing_index(configuration)
+    indexed = time.perf_counter()
+    return configuration, index, (read - started, lowered - read, indexed - lowered)
+
+
+def measure(text: str, size: int, lower: bool) -> dict:
+    encode_headers.cache_clear()
+    configuration, index, (read, lowered, indexed) = load(text, lower)
+    snapshot = pickle.dumps(configuration, pickle.HIGHEST_PROTOCOL)
+    loading = time.perf_counter()
+    pickle.loads(snapshot)
+    loaded = time.perf_counter()
+    del configuration, index
+
+    encode_headers.cache_clear()
+    tracemalloc.start()
+    baseline = held()
+    configuration = NtfyModuleConfig.from_dict(json.loads(text))
+    if lower:
+        lower_configuration(configuration)
+    configuration_bytes = held() - baseline
+    index = build_routing_index(configuration)
+    index_bytes = held() - baseline - configuration_bytes
+    tracemalloc.stop()
+    del configuration, index
+    return {
+        "topics": size,
+        "form": "runtime" if lower else "schema",
+        "config_bytes_per_topic": round(configuration_bytes / size),
+        "index_bytes_per_topic": round(index_bytes / size),
+        "total_bytes_per_topic": round((configuration_bytes + index_bytes) / size),
+        "read_s": round(read, 3),
+        "lower_s": round(lowered, 3),
+        "index_s": round(indexed, 3),
+        "snapshot_bytes": len(snapshot),
+        "snapshot_load_s": round(loaded - loading, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--options", type=int, default=10)
+    parser.add_argument("--json", action="store_true")
+    arguments = parser.parse_args()
+
+    results = []
+    for size in arguments.sizes:
+        text = json.dumps(build_document(size, arguments.options))
+        results.append(measure(text, size, lower=False))
+        results.append(measure(text, size, lower=True))
+    if arguments.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(
+        f"{'topics':>8} {'form':>8} {'config B':>9} {'index B':>8} {'total B':>8} "
+        f"{'read s':>7} {'lower s':>8} {'index s':>8} {'snap load s':>12}"
+    )
+    for result in results:
+        print(
+            f"{result['topics']:>8} {result['form']:>8} "
+            f"{result['config_bytes_per_topic']:>9} {result['index_bytes_per_topic']:>8} "
+            f"{result['total_bytes_per_topic']:>8} {result['read_s']:>7.3f} "
+            f"{result['lower_s']:>8.3f} {result['index_s']:>8.3f} "
+            f"{result['snapshot_load_s']:>12.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+End-to-end benchmark of the whole pipeline: messages are published to an
+in-process fake MQTT broker, received and forwarded by run(), and accepted
+by an in-process fake ntfy server.
+
+Reports the delivered messages per second, the p50/p99/max latency from publish
+to the notification arriving at ntfy, and the peak RSS of the process, which
+includes the fakes. Each invocation runs one scenario, since run() keeps its
+state in module globals.
+
+Usage:
+    python -m benchmarks.bench_pipeline [--messages 2000] [--rate 0] [--topics 10]
+        [--latency 0.0] [--error-rate 0.0] [--workers 2] [--async] [--json]
+        [--log-level WARNING] [--log-size 10485760] [--structured-logs]
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import signal
+import tempfile
+import threading
+import time
+from importlib import metadata
+
+from nsp_ntfy.app.main import run
+
+from .fakes import BackgroundLoop, FakeBroker, FakeNtfy
+
+
+def write_configuration(directory: str, arguments, broker: FakeBroker, ntfy: FakeNtfy):
+    logging_config = {
+        "path": directory,
+        "level": arguments.log_level,
+        "format": {"date": "%Y-%m-%d %H:%M:%S", "output": "%(asctime)s %(message)s"},
+        "rotation": {"size": arguments.log_size, "backup": 1},
+    }
+    module_config = {
+        "logging": {"file": "bench.log", "structured": arguments.structured_logs},
+        "server": ntfy.url,
+        "dispatch": {"workers": arguments.workers, "queue_size": arguments.queue_size},
+        "http": {"pool_size": arguments.workers, "max_in_flight": arguments.in_flight},
+        "retry": {"max_attempts": 5, "base_delay": 0.05, "max_delay": 1.0},
+        "configurations": [
+            {"mqtt_topic": f"bench/{index}", "ntfy": {"topic": f"bench{index}"}}
+            for index in range(arguments.topics)
+        ],
+    }
+    nsp_config = {
+        "device": {
+            "name": "bench",
+            "mqtt": {"enabled": True, "host": broker.host, "port": broker.port},
+        },
+        "logging": logging_config,
+    }
+    module_path = os.path.join(directory, "module.json")
+    nsp_path = os.path.join(directory, "nsp.json")
+    with open(module_path, "w") as file:
+        json.dump(module_config, file)
+    with open(nsp_path, "w") as file:
+        json.dump(nsp_config, file)
+    return module_path, nsp_path
+
+
+def drive(arguments, broker: FakeBroker, ntfy: FakeNtfy, published: dict):
+    deadline = time.monotonic() + arguments.timeout
+    while broker.subscriptions < arguments.topics:
+        if time.monotonic() > deadline:
+            break
+        time.sleep(0.01)
+    interval = 1 / arguments.rate if arguments.rate else 0
+    start = time.perf_counter()
+    for sequence in range(arguments.messages):
+        if interval:
+            wait = start + sequence * interval - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        message = f"bench {sequence}"
+        published[message] = time.perf_counter()
+        broker.publish(
+            f"bench/{sequence % arguments.topics}",
+            json.dumps({"notification": message}).encode("utf-8"),
+        )
+    while len(ntfy.received) < arguments.messages and time.monotonic() < deadline:
+        time.sleep(0.01)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def bench(arguments) -> dict:
+    background = BackgroundLoop()
+    broker = FakeBroker(background)
+    ntfy = FakeNtfy(background, arguments.latency, arguments.error_rate)
+    broker.start()
+    ntfy.start()
+    published = {}
+    with tempfile.TemporaryDirectory() as directory:
+        module_path, nsp_path = write_configuration(directory, arguments, broker, ntfy)
+        driver = threading.Thread(
+            target=drive,
+            args=(arguments, broker, ntfy, published),
+            daemon=True,
+        )
+        driver.start()
+        run(
+            argparse.Namespace(
+                configuration=module_path,
+                nsp_configuration=nsp_path,
+                async_mode=arguments.async_mode,
+                snapshot=None,
+            )
+        )
+        driver.join()
+        broker.stop()
+        ntfy.stop()
+        background.stop()
+
+    latencies = sorted(
+        received - published[message]
+        for message, received in ntfy.received.items()
+        if message in published
+    )
+    first = min(published.values(), default=0.0)
+    last = max(ntfy.received.values(), default=first)
+    duration = last - first
+    try:
+        version = metadata.version("nsp-ntfy")
+    except metadata.PackageNotFoundError:
+        version = None
+    return {
+        "version": version,
+        "python": platform.python_version(),
+        "mode": "async" if arguments.async_mode else "threads",
+        "messages": arguments.messages,
+        "topics": arguments.topics,
+        "rate": arguments.rate,
+        "workers": arguments.workers,
+        "ntfy_latency_s": arguments.latency,
+        "error_rate": arguments.error_rate,
+        "delivered": len(latencies),
+        "requests": ntfy.requests,
+        "errors": ntfy.errors,
+        "duration_s": duration,
+        "messages_per_second": len(latencies) / duration if duration else None,
+        "latency_p50_ms": (percentile(latencies, 0.5) * 1000 if latencies else None),
+        "latency_p99_ms": (percentile(latencies, 0.99) * 1000 if latencies else None),
+        "latency_max_ms": latencies[-1] * 1000 if latencies else None,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument(
+        "--rate", type=float, default=0, help="messages per second, 0 for unlimited"
+    )
+    parser.add_argument("--topics", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=100000)
+    parser.add_argument("--in-flight", type=int, default=100)
+    parser.add_argument("--async", dest="async_mode", action="store_true")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument(
+        "--log-size", type=int, default=10485760, help="bytes before the log rotates"
+    )
+    parser.add_argument("--structured-logs", action="store_true")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--json", action="store_true")
+    arguments = parser.parse_args()
+
+    result = bench(arguments)
+    if arguments.json:
+        print(json.dumps(result, indent=2))
+        return
+    for name, value in result.items():
+        print(f"{name:>20} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Micro-benchmark comparing topic lookup cost of a linear scan over the
+configured topics against the RoutingIndex.
+
+Usage:
+    python -m benchmarks.bench_routing [--sizes 10 1000 100000] [--lookups 20000]
+"""
+
+import argparse
+import json
+import random
+import timeit
+
+from nsp_ntfy.app.data.data_classes import Ntfy, TopicConfig
+from nsp_ntfy.app.routing import RoutingIndex
+
+
+def linear_lookup(configurations, topic):
+    for configuration in configurations:
+        if configuration.mqtt_topic == topic:
+            return configuration
+    return None
+
+
+def build_configurations(size: int, wildcards: int):
+    configurations = [
+        TopicConfig(mqtt_topic=f"nsp/device-{i}/events", ntfy=Ntfy(topic=f"t{i}"))
+        for i in range(size - wildcards)
+    ]
+    configurations += [
+        TopicConfig(mqtt_topic=f"nsp/+/wildcard-{i}", ntfy=Ntfy(topic=f"w{i}"))
+        for i in range(wildcards)
+    ]
+    return configurations
+
+
+def bench(size: int, lookups: int, wildcards: int):
+    configurations = build_configurations(size, wildcards)
+    index = RoutingIndex((c.mqtt_topic, c) for c in configurations)
+    literal_topics = [c.mqtt_topic for c in configurations if "+" not in c.mqtt_topic]
+    topics = [random.choice(literal_topics) for _ in range(lookups)]
+
+    linear = timeit.timeit(
+        lambda: [linear_lookup(configurations, t) for t in topics], number=1
+    )
+    indexed = timeit.timeit(lambda: [index.match(t) for t in topics], number=1)
+    return {
+        "topics": size,
+        "wildcards": wildcards,
+        "lookups": lookups,
+        "linear_ns_per_lookup": linear / lookups * 1e9,
+        "index_ns_per_lookup": indexed / lookups * 1e9,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000])
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--wildcards", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    arguments = parser.parse_args()
+
+    random.seed(0)
+    results = [
+        bench(size, arguments.lookups, min(arguments.wildcards, size - 1))
+        for size in arguments.sizes
+    ]
+    if arguments.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'topics':>8} {'wildcards':>9} {'linear ns':>12} {'index ns':>10}")
+    for result in results:
+        print(
+            f"{result['topics']:>8} {result['wildcards']:>9} "
+            f"{result['linear_ns_per_lookup']:>12.0f} {result['index_ns_per_lookup']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
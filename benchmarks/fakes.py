@@ -0,0 +1,246 @@
+"""
+In-process stand-ins for an MQTT broker and a ntfy server, used by the
+end-to-end benchmarks. Both run on an asyncio event loop in a background
+thread so that the application under test can run on the main thread.
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from paho.mqtt.client import topic_matches_sub
+
+CONNECT = 1
+PUBLISH = 3
+SUBSCRIBE = 8
+UNSUBSCRIBE = 10
+PINGREQ = 12
+DISCONNECT = 14
+
+
+class BackgroundLoop:
+    """
+    An asyncio event loop running on a daemon thread.
+    """
+
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="bench-loop", daemon=True
+        )
+        self._thread.start()
+
+    def run(self, coroutine, timeout: Optional[float] = None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def call(self, callback, *args) -> None:
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def stop(self) -> None:
+        self.run(self._cancel_tasks())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    async def _cancel_tasks(self) -> None:
+        tasks = [
+            task for task in asyncio.all_tasks() if task is not asyncio.current_task()
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _remaining_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def _packet(header: int, body: bytes) -> bytes:
+    return bytes([header]) + _remaining_length(len(body)) + body
+
+
+def _string(data: bytes, position: int) -> Tuple[str, int]:
+    length = int.from_bytes(data[position : position + 2], "big")
+    end = position + 2 + length
+    return data[position + 2 : end].decode("utf-8"), end
+
+
+class FakeBroker:
+    """
+    A minimal MQTT 3.1.1 broker supporting QoS 0 subscriptions, enough for
+    paho to connect, subscribe and receive messages.
+    """
+
+    def __init__(self, background: BackgroundLoop, host: str = "127.0.0.1") -> None:
+        self.background = background
+        self.host = host
+        self.port: int = None
+        self._server: asyncio.AbstractServer = None
+        self._clients: Dict[asyncio.StreamWriter, List[str]] = {}
+
+    def start(self) -> None:
+        self._server = self.background.run(
+            asyncio.start_server(self._serve, self.host, 0)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def stop(self) -> None:
+        self._server.close()
+
+    @property
+    def subscriptions(self) -> int:
+        return sum(len(filters) for filters in list(self._clients.values()))
+
+    def publish(self, topic: str, payload: bytes) -> None:
+        """
+        Publishes a message to every matching subscriber. Safe to call from any thread.
+        """
+        self.background.call(self._publish, topic, payload)
+
+    def _publish(self, topic: str, payload: bytes) -> None:
+        name = topic.encode("utf-8")
+        packet = _packet(PUBLISH << 4, len(name).to_bytes(2, "big") + name + payload)
+        for writer, filters in self._clients.items():
+            if any(topic_matches_sub(sub, topic) for sub in filters):
+                writer.write(packet)
+
+    async def _serve(self, reader, writer) -> None:
+        filters: List[str] = []
+        self._clients[writer] = filters
+        try:
+            while True:
+                header = (await reader.readexactly(1))[0]
+                length, multiplier = 0, 1
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length)
+                kind = header >> 4
+                if kind == CONNECT:
+                    writer.write(b"\x20\x02\x00\x00")
+                elif kind == SUBSCRIBE:
+                    position, granted = 2, bytearray()
+                    while position < len(body):
+                        topic, position = _string(body, position)
+                        position += 1
+                        filters.append(topic)
+                        granted.append(0)
+                    writer.write(_packet(0x90, body[:2] + bytes(granted)))
+                elif kind == UNSUBSCRIBE:
+                    position = 2
+                    while position < len(body):
+                        topic, position = _string(body, position)
+                        if topic in filters:
+                            filters.remove(topic)
+                    writer.write(_packet(0xB0, body[:2]))
+                elif kind == PUBLISH:
+                    topic, position = _string(body, 0)
+                    qos = (header >> 1) & 3
+                    if qos:
+                        packet_id = body[position : position + 2]
+                        position += 2
+                        writer.write(_packet(0x40 if qos == 1 else 0x50, packet_id))
+                    self._publish(topic, body[position:])
+                elif kind == PINGREQ:
+                    writer.write(b"\xd0\x00")
+                elif kind == DISCONNECT:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self._clients[writer]
+            writer.close()
+
+
+class FakeNtfy:
+    """
+    A ntfy stand-in that accepts published notifications over keep-alive
+    HTTP/1.1, with injected latency and errors.
+
+    Attributes:
+        latency (float): The seconds to wait before responding.
+        error_rate (float): The fraction of requests answered with a 500.
+        received (Dict[str, float]): The time.perf_counter() each accepted message body first arrived.
+    """
+
+    def __init__(
+        self,
+        background: BackgroundLoop,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+    ) -> None:
+        self.background = background
+        self.latency = latency
+        self.error_rate = error_rate
+        self.host = host
+        self.port: int = None
+        self.requests = 0
+        self.errors = 0
+        self.received: Dict[str, float] = {}
+        self._random = random.Random(seed)
+        self._server: asyncio.AbstractServer = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> None:
+        self._server = self.background.run(
+            asyncio.start_server(self._serve, self.host, 0)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def stop(self) -> None:
+        self._server.close()
+
+    async def _serve(self, reader, writer) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                headers = {
+                    name.strip().lower(): value.strip()
+                    for name, _, value in (line.partition(":") for line in lines[1:])
+                    if name
+                }
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if self._random.random() < self.error_rate:
+                    self.errors += 1
+                    status, content = (
+                        "500 Internal Server Error",
+                        b'{"error":"injected"}',
+                    )
+                else:
+                    message = body.decode("utf-8")
+                    self.received.setdefault(message, time.perf_counter())
+                    status = "200 OK"
+                    content = json.dumps(
+                        {"event": "message", "topic": lines[0].split()[1][1:]}
+                    ).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(content)}\r\n\r\n".encode("latin-1")
+                    + content
+                )
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
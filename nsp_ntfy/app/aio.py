@@ -0,0 +1,543 @@
+import asyncio
+import logging
+import re
+import ssl
+import threading
+import time
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Set, Tuple
+from urllib.parse import urlsplit
+
+import paho.mqtt.client as mqtt
+
+from .data.data_classes import HttpConfig
+from .metrics import Metrics
+from .request import NtfyRequest
+from .retry import CircuitBreakers, Outcome, Result, classify_status
+
+Address = Tuple[str, str, int]
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+_UNSAFE = re.compile(rb"[\r\n\x00]")
+
+
+class InvalidHeader(ValueError):
+    """
+    Raised for a request header whose name or value would break the request,
+    such as one containing a line break.
+    """
+
+
+class AsyncHttpClient:
+    """
+    A minimal non-blocking HTTP/1.1 client for posting notifications to ntfy.
+
+    Connections are opened per request as needed and, when keep alive is
+    enabled, up to the pool size of them are kept open per server and reused.
+    A kept connection that the server closed in the meantime is replaced
+    transparently.
+
+    Attributes:
+        config (HttpConfig): The HTTP connection configuration.
+    """
+
+    def __init__(self, config: HttpConfig) -> None:
+        self.config = config
+        self._idle: Dict[Address, List[Connection]] = {}
+        self._ssl: ssl.SSLContext = None
+
+    async def post(
+        self, url: str, body: bytes, headers: Mapping[str, bytes]
+    ) -> Tuple[int, Dict[str, str]]:
+        """
+        Posts a body to a URL.
+
+        Args:
+            url (str): The URL to post to.
+            body (bytes): The request body.
+            headers (Mapping[str, bytes]): The request headers.
+
+        Returns:
+            Tuple[int, Dict[str, str]]: The status code and headers of the response.
+
+        Raises:
+            InvalidHeader: If a header contains a line break or a NUL character.
+            TimeoutError: If connecting or reading the response takes too long.
+            OSError: If the connection fails.
+            asyncio.IncompleteReadError: If the server closes the connection mid response.
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        address = (
+            scheme,
+            parts.hostname,
+            parts.port or (443 if scheme == "https" else 80),
+        )
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        request = self._encode(parts.netloc, path, body, headers)
+        connection = self._acquire(address)
+        if connection is not None:
+            try:
+                return await self._exchange(address, connection, request)
+            except (ConnectionError, asyncio.IncompleteReadError) as error:
+                if isinstance(error, asyncio.IncompleteReadError) and error.partial:
+                    raise
+                logging.debug("kept connection to %s closed, reconnecting", address[1])
+        connection = await self._open(address)
+        return await self._exchange(address, connection, request)
+
+    async def close(self) -> None:
+        """
+        Closes every kept connection.
+
+        Returns:
+            None
+        """
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for _, writer in connections:
+                writer.close()
+        for connections in idle.values():
+            for _, writer in connections:
+                try:
+                    await writer.wait_closed()
+                except OSError:
+                    pass
+
+    def _encode(
+        self, host: str, path: str, body: bytes, headers: Mapping[str, bytes]
+    ) -> bytes:
+        lines = [
+            f"POST {path} HTTP/1.1",
+            f"Host: {host}",
+            f"Content-Length: {len(body)}",
+            "User-Agent: nsp-ntfy",
+        ]
+        if not self.config.keep_alive:
+            lines.append("Connection: close")
+        head = "".join(f"{line}\r\n" for line in lines).encode("latin-1")
+        for name, value in headers.items():
+            encoded = name.encode("latin-1")
+            if _UNSAFE.search(encoded) or _UNSAFE.search(value) or b":" in encoded:
+                raise InvalidHeader(f"invalid value for header {name!r}")
+            head += encoded + b": " + value + b"\r\n"
+        return head + b"\r\n" + body
+
+    def _acquire(self, address: Address) -> Optional[Connection]:
+        connections = self._idle.get(address)
+        while connections:
+            reader, writer = connections.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            writer.close()
+        return None
+
+    def _release(self, address: Address, connection: Connection) -> None:
+        connections = self._idle.setdefault(address, [])
+        if len(connections) < self.config.pool_size:
+            connections.append(connection)
+        else:
+            connection[1].close()
+
+    async def _open(self, address: Address) -> Connection:
+        scheme, host, port = address
+        context = None
+        if scheme == "https":
+            if self._ssl is None:
+                self._ssl = ssl.create_default_context()
+            context = self._ssl
+        return await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=context),
+            self.config.connect_timeout,
+        )
+
+    async def _exchange(
+        self, address: Address, connection: Connection, request: bytes
+    ) -> Tuple[int, Dict[str, str]]:
+        reader, writer = connection
+        try:
+            writer.write(request)
+            status, headers, reusable = await asyncio.wait_for(
+                self._respond(reader, writer), self.config.read_timeout
+            )
+        except BaseException:
+            writer.close()
+            raise
+        if reusable and self.config.keep_alive:
+            self._release(address, connection)
+        else:
+            writer.close()
+        return status, headers
+
+    async def _respond(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> Tuple[int, Dict[str, str], bool]:
+        await writer.drain()
+        status_line = await reader.readuntil(b"\r\n")
+        status = int(status_line.split(None, 2)[1])
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().title()] = value.strip()
+        reusable = headers.get("Connection", "").lower() != "close"
+        if headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if not size:
+                    break
+                await reader.readexactly(size + 2)
+            while await reader.readuntil(b"\r\n") != b"\r\n":
+                pass
+        elif "Content-Length" in headers:
+            await reader.readexactly(int(headers["Content-Length"]))
+        elif status not in (204, 304):
+            await reader.read()
+            reusable = False
+        return status, headers, reusable
+
+
+class AsyncioHelper:
+    """
+    Drives a paho MQTT client from an asyncio event loop, reading and writing
+    its socket when the loop reports it ready instead of from a network thread.
+
+    Attributes:
+        loop (asyncio.AbstractEventLoop): The event loop driving the client.
+        client (mqtt.Client): The MQTT client.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, client: mqtt.Client) -> None:
+        self.loop = loop
+        self.client = client
+        self._misc: asyncio.Task = None
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock) -> None:
+        """
+        Watches the socket of a new connection for reads and starts the keep alive loop.
+
+        Returns:
+            None
+        """
+        self.loop.add_reader(sock, client.loop_read)
+        self._misc = self.loop.create_task(self._misc_loop())
+
+    def on_socket_close(self, client, userdata, sock) -> None:
+        """
+        Stops watching the socket of a closed connection.
+
+        Returns:
+            None
+        """
+        self.loop.remove_reader(sock)
+        if self._misc is not None:
+            self._misc.cancel()
+            self._misc = None
+
+    def on_socket_register_write(self, client, userdata, sock) -> None:
+        """
+        Watches the socket for writes while the client has data to send.
+
+        Returns:
+            None
+        """
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock) -> None:
+        """
+        Stops watching the socket for writes once the client has sent its data.
+
+        Returns:
+            None
+        """
+        self.loop.remove_writer(sock)
+
+    async def _misc_loop(self) -> None:
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+
+class AsyncEngine:
+    """
+    Runs the MQTT clients and sends notifications on a single asyncio event
+    loop, so that many notifications can be in flight at once without a
+    thread each.
+
+    Notifications may be handed to the engine from any thread. Each attempt is
+    sent once and its outcome passed to the outcome callback, which decides on
+    retries in the same way as for the threaded mode.
+
+    Attributes:
+        config (HttpConfig): The HTTP connection configuration.
+        breakers (CircuitBreakers): The circuit breakers of the ntfy servers.
+        on_outcome (Callable): Called with the request, message, attempt and outcome of each attempt.
+        metrics (Metrics): Records the duration and result of each attempt when set.
+    """
+
+    RECONNECT_DELAY = 1.0
+    MAX_RECONNECT_DELAY = 60.0
+    DISCONNECT_TIMEOUT = 1.0
+
+    def __init__(
+        self,
+        config: HttpConfig,
+        breakers: CircuitBreakers,
+        on_outcome: Callable[[NtfyRequest, str, int, Outcome], None],
+        metrics: Metrics = None,
+    ) -> None:
+        self.config = config
+        self.breakers = breakers
+        self.on_outcome = on_outcome
+        self.metrics = metrics
+        self._http = AsyncHttpClient(config)
+        self._loop: asyncio.AbstractEventLoop = None
+        self._thread: int = None
+        self._stopping: asyncio.Event = None
+        self._disconnecting: Dict[mqtt.Client, asyncio.Future] = None
+        self._semaphore: asyncio.Semaphore = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._reconnect_delays: Dict[mqtt.Client, float] = {}
+        self._disconnect_handlers: Dict[mqtt.Client, Callable] = {}
+        self.in_flight = 0
+        self.completed = 0
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether the event loop is running and accepting notifications.
+        """
+        return (
+            self._loop is not None
+            and self._loop.is_running()
+            and not self._stopping.is_set()
+        )
+
+    def run(self, clients: Sequence[mqtt.Client], start: Callable[[], None]) -> None:
+        """
+        Runs the event loop on the calling thread until the engine is stopped.
+
+        Args:
+            clients (Sequence[mqtt.Client]): The MQTT clients to drive, one for each broker.
+            start (Callable[[], None]): Connects and subscribes the clients, called once the loop is running.
+
+        Returns:
+            None
+        """
+        asyncio.run(self._main(clients, start))
+
+    def stop(self) -> None:
+        """
+        Stops the engine, disconnecting the clients and waiting for the
+        notifications in flight. Safe to call from any thread or a signal handler.
+
+        Returns:
+            None
+        """
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    def attempt(self, request: NtfyRequest, message: str, attempt: int) -> None:
+        """
+        Starts an attempt to send a notification on the event loop.
+
+        Args:
+            request (NtfyRequest): The compiled request.
+            message (str): The notification message.
+            attempt (int): The number of this attempt.
+
+        Returns:
+            None
+        """
+        self.call(self._spawn, request, message, attempt)
+
+    def reconnect_later(self, client: mqtt.Client) -> None:
+        """
+        Retries connecting a client that couldn't connect, backing off like
+        a client that lost its connection.
+
+        Args:
+            client (mqtt.Client): The MQTT client.
+
+        Returns:
+            None
+        """
+        self.call(self._schedule_reconnect, client)
+
+    def call(self, callback: Callable, *args) -> None:
+        """
+        Runs a callback on the event loop thread, immediately when already on it.
+        The MQTT client must only be used from the event loop thread.
+
+        Args:
+            callback (Callable): The function to call.
+            *args: The arguments to pass to the function.
+
+        Returns:
+            None
+        """
+        if threading.get_ident() == self._thread:
+            callback(*args)
+        else:
+            self._loop.call_soon_threadsafe(callback, *args)
+
+    async def deliver(self, request: NtfyRequest, message: str) -> Outcome:
+        """
+        Sends a notification message to ntfy once, unless the circuit breaker of
+        the server is open.
+
+        Args:
+            request (NtfyRequest): The compiled request.
+            message (str): The notification message.
+
+        Returns:
+            Outcome: The classified outcome of the attempt.
+        """
+        breaker = self.breakers.get(request.server)
+        if not breaker.allow():
+            logging.debug(
+                "circuit open for %s, not sending notification", request.server
+            )
+            if self.metrics is not None:
+                self.metrics.fail(Result.CIRCUIT_OPEN)
+            return Outcome(Result.CIRCUIT_OPEN)
+        async with self._semaphore:
+            self.in_flight += 1
+            logging.debug("sending notification to ntfy %s", message)
+            started = time.perf_counter()
+            try:
+                status, headers = await self._http.post(
+                    request.url, message.encode("utf-8"), request.headers
+                )
+            except (InvalidHeader, UnicodeEncodeError) as error:
+                outcome = Outcome(Result.REJECTED)
+                logging.error("not sending notification to ntfy: %s", error)
+            except TimeoutError:
+                outcome = Outcome(Result.TIMEOUT)
+                logging.warning("failed to send notification to ntfy: timed out")
+            except (
+                OSError,
+                ValueError,
+                asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError,
+            ) as error:
+                outcome = Outcome(Result.CONNECT_ERROR)
+                logging.warning("failed to send notification to ntfy: %r", error)
+            except Exception:
+                outcome = Outcome(Result.REJECTED)
+                logging.exception("not sending notification to ntfy")
+            else:
+                outcome = classify_status(status, headers)
+                if outcome.result is Result.SENT:
+                    logging.info("notification sent to ntfy")
+                elif outcome.result is Result.REJECTED:
+                    logging.error(
+                        "ntfy rejected notification, status %s", outcome.status
+                    )
+                else:
+                    logging.warning("ntfy unavailable, status %s", outcome.status)
+            finally:
+                self.in_flight -= 1
+        breaker.record(outcome)
+        if self.metrics is not None:
+            self.metrics.record(outcome.result, started)
+        return outcome
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Reports the engine counters.
+
+        Returns:
+            Dict[str, int]: The pending, in flight and completed notification counts.
+        """
+        return {
+            "pending": len(self._tasks),
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+        }
+
+    async def _main(
+        self, clients: Sequence[mqtt.Client], start: Callable[[], None]
+    ) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._thread = threading.get_ident()
+        self._stopping = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.config.max_in_flight)
+        for client in clients:
+            AsyncioHelper(self._loop, client)
+            self._disconnect_handlers[client] = client.on_disconnect
+            client.on_disconnect = self._on_disconnect
+            self._reconnect_delays[client] = self.RECONNECT_DELAY
+        try:
+            start()
+            await self._stopping.wait()
+            self._disconnecting = {
+                client: self._loop.create_future()
+                for client in clients
+                if client.is_connected()
+            }
+            for client in self._disconnecting:
+                client.disconnect()
+            if self._disconnecting:
+                _, pending = await asyncio.wait(
+                    self._disconnecting.values(), timeout=self.DISCONNECT_TIMEOUT
+                )
+                if pending:
+                    logging.warning("timed out disconnecting from MQTT broker")
+            if self._tasks:
+                await asyncio.wait(
+                    self._tasks,
+                    timeout=self.config.connect_timeout + self.config.read_timeout,
+                )
+        finally:
+            await self._http.close()
+
+    def _spawn(self, request: NtfyRequest, message: str, attempt: int) -> None:
+        task = self._loop.create_task(self._attempt(request, message, attempt))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _attempt(self, request: NtfyRequest, message: str, attempt: int) -> None:
+        outcome = await self.deliver(request, message)
+        self.completed += 1
+        try:
+            self.on_outcome(request, message, attempt, outcome)
+        except Exception:
+            logging.exception("failed to handle the outcome of a notification")
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties) -> None:
+        handler = self._disconnect_handlers.get(client)
+        if handler is not None:
+            handler(client, userdata, flags, reason_code, properties)
+        if self._disconnecting is not None:
+            future = self._disconnecting.get(client)
+            if future is not None and not future.done():
+                future.set_result(reason_code)
+            return
+        logging.warning(f"disconnected from MQTT broker, {reason_code}")
+        self._schedule_reconnect(client)
+
+    def _schedule_reconnect(self, client: mqtt.Client) -> None:
+        self._loop.call_later(self._reconnect_delays[client], self._reconnect, client)
+
+    def _reconnect(self, client: mqtt.Client) -> None:
+        if self._stopping.is_set():
+            return
+        try:
+            client.reconnect()
+        except OSError as error:
+            if client.on_connect_fail is not None:
+                client.on_connect_fail(client, client.user_data_get())
+            delay = min(self._reconnect_delays[client] * 2, self.MAX_RECONNECT_DELAY)
+            self._reconnect_delays[client] = delay
+            logging.warning(
+                f"failed to reconnect to MQTT broker, retrying in {delay:.0f}s: {error}"
+            )
+            self._loop.call_later(delay, self._reconnect, client)
+        else:
+            self._reconnect_delays[client] = self.RECONNECT_DELAY
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .data.data_classes import AttachmentConfig
+from .payload import parse_path
+from .startup import lazy_import
+
+futures = lazy_import("concurrent.futures")
+subprocess = lazy_import("subprocess")
+tempfile = lazy_import("tempfile")
+
+REJECT_REASONS = ("not_text", "outside", "not_file", "too_large")
+_LINE_BREAK = re.compile(r"\r\n|[\r\n]")
+_CONTROL = re.compile(r"[\x00-\x1f\x7f]")
+
+
+class Upload:
+    """
+    A capture file opened to be streamed to ntfy as an attachment.
+
+    Attributes:
+        file: The open binary file, read in chunks while the request is sent.
+        filename (str): The file name shown by ntfy.
+        size (int): The size of the file in bytes.
+    """
+
+    __slots__ = ("file", "filename", "size")
+
+    def __init__(self, file, filename: str, size: int) -> None:
+        self.file = file
+        self.filename = filename
+        self.size = size
+
+    def headers(self, message: str) -> Dict[str, bytes]:
+        """
+        Builds the headers carrying the file name and the message, since the
+        body of the request is the file. Line breaks in the message are
+        escaped as ntfy expects and other control characters are dropped, so
+        neither header can end early.
+
+        Args:
+            message (str): The notification message.
+
+        Returns:
+            Dict[str, bytes]: The encoded headers.
+        """
+        return {
+            "Filename": _CONTROL.sub("", self.filename).encode("utf-8"),
+            "Message": _CONTROL.sub("", _LINE_BREAK.sub(r"\\n", message)).encode(
+                "utf-8"
+            ),
+        }
+
+
+class Attachments:
+    """
+    Attaches the capture files named in MQTT payloads to notifications.
+
+    Only regular files within the configured directories are attached, so a
+    payload can't send any other file on the host. Files are streamed from
+    disk while the request is sent and never read into memory as a whole.
+    Images can be shrunk by a command run in a separate process, and the
+    uploads run on a small pool of threads that caps how many are sent at
+    once.
+
+    Attributes:
+        config (AttachmentConfig): The attachment configuration.
+        attached (int): The number of captures uploaded.
+        downscaled (int): The number of captures shrunk before uploading.
+        downscale_failed (int): The number of captures that couldn't be shrunk and were attached as they are.
+        rejected (Dict[str, int]): The number of captures not attached for each reason.
+    """
+
+    def __init__(self, config: AttachmentConfig) -> None:
+        self.config = config
+        self.attached = 0
+        self.downscaled = 0
+        self.downscale_failed = 0
+        self.rejected: Dict[str, int] = dict.fromkeys(REJECT_REASONS, 0)
+        self._segments = parse_path(config.field)
+        self._directories = tuple(
+            os.path.join(os.path.realpath(directory), "")
+            for directory in config.directories
+        )
+        self._executor: futures.ThreadPoolExecutor = None
+        self._lock = threading.Lock()
+
+    def locate(self, document: Any) -> Optional[str]:
+        """
+        Finds the capture file named in a decoded payload.
+
+        Args:
+            document (Any): The decoded payload.
+
+        Returns:
+            Optional[str]: The resolved path of the capture, or None if the payload names none that may be attached.
+        """
+        value = document
+        try:
+            for segment in self._segments:
+                value = value[segment]
+        except (KeyError, IndexError, TypeError):
+            return None
+        if not isinstance(value, str):
+            return self._reject("not_text")
+        path = os.path.realpath(value)
+        if not path.startswith(self._directories):
+            logging.warning("not attaching %s, outside the capture directories", value)
+            return self._reject("outside")
+        if not os.path.isfile(path):
+            logging.warning("not attaching %s, not a file", value)
+            return self._reject("not_file")
+        return path
+
+    @contextlib.contextmanager
+    def open(self, path: str) -> Iterator[Optional[Upload]]:
+        """
+        Opens a capture to be uploaded, shrinking it first when configured.
+
+        Args:
+            path (str): The resolved path of the capture.
+
+        Yields:
+            Optional[Upload]: The opened capture, or None if it can't be attached.
+        """
+        with contextlib.ExitStack() as stack:
+            source = path
+            downscale = self.config.downscale
+            if downscale is not None and path.lower().endswith(
+                tuple(downscale.suffixes)
+            ):
+                directory = stack.enter_context(tempfile.TemporaryDirectory())
+                shrunk = self._downscale(path, directory)
+                if shrunk is not None:
+                    source = shrunk
+            try:
+                file = stack.enter_context(open(source, "rb"))
+            except OSError as error:
+                logging.warning("not attaching %s: %s", path, error)
+                self._reject("not_file")
+                yield None
+                return
+            size = os.fstat(file.fileno()).st_size
+            if size > self.config.max_size:
+                logging.warning(
+                    f"not attaching {path}, {size} bytes is over the limit of {self.config.max_size}"
+                )
+                self._reject("too_large")
+                yield None
+                return
+            with self._lock:
+                self.attached += 1
+            yield Upload(file, os.path.basename(path), size)
+
+    def submit(self, job: Callable, *args) -> None:
+        """
+        Runs an upload on the upload threads, which send at most the
+        configured number of captures at once.
+
+        Args:
+            job (Callable): The function sending the upload.
+            *args: The arguments to pass to the function.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = futures.ThreadPoolExecutor(
+                    max_workers=self.config.max_concurrent,
+                    thread_name_prefix="nsp-ntfy-upload",
+                )
+            executor = self._executor
+        executor.submit(self._run, job, *args)
+
+    def stop(self) -> None:
+        """
+        Waits for the uploads in progress and stops the upload threads.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Reports the attached, shrunk and rejected counts.
+
+        Returns:
+            Dict[str, int]: The counts of captures by what happened to them.
+        """
+        stats = {
+            "attached": self.attached,
+            "downscaled": self.downscaled,
+            "downscale_failed": self.downscale_failed,
+        }
+        stats.update(
+            (f"rejected {reason}", count) for reason, count in self.rejected.items()
+        )
+        return stats
+
+    def _downscale(self, path: str, directory: str) -> Optional[str]:
+        output = os.path.join(directory, os.path.basename(path))
+        command = [
+            part.replace("{input}", path).replace("{output}", output)
+            for part in self.config.downscale.command
+        ]
+        try:
+            subprocess.run(
+                command,
+                check=True,
+                timeout=self.config.downscale.timeout,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+        except (OSError, subprocess.SubprocessError) as error:
+            logging.warning(
+                "failed to shrink %s, attaching it as it is: %s", path, error
+            )
+            with self._lock:
+                self.downscale_failed += 1
+            return None
+        if not os.path.isfile(output):
+            logging.warning("shrinking %s wrote no file, attaching it as it is", path)
+            with self._lock:
+                self.downscale_failed += 1
+            return None
+        with self._lock:
+            self.downscaled += 1
+        return output
+
+    @staticmethod
+    def _run(job: Callable, *args) -> None:
+        try:
+            job(*args)
+        except Exception:
+            logging.exception("failed to upload attachment")
+
+    def _reject(self, reason: str) -> None:
+        with self._lock:
+            self.rejected[reason] += 1
+        return None
@@ -0,0 +1,76 @@
+from typing import Dict, List, Optional
+
+from .data.data_classes import DeviceConfig, NtfyModuleConfig, TopicConfig
+
+
+def configurations_for(
+    configuration: NtfyModuleConfig, device: Optional[str]
+) -> List[TopicConfig]:
+    """
+    Lists the topic configurations that apply to the messages of a device:
+    those without a device and those naming the device. Without a device
+    every topic configuration is listed.
+
+    Args:
+        configuration (NtfyModuleConfig): The module configuration.
+        device (Optional[str]): The name of the device.
+
+    Returns:
+        List[TopicConfig]: The topic configurations in the order they are configured.
+    """
+    if device is None:
+        return list(configuration.configurations)
+    return [
+        topic_config
+        for topic_config in configuration.configurations
+        if topic_config.device is None or topic_config.device == device
+    ]
+
+
+class Broker:
+    """
+    The MQTT client connected to the broker of one Night Sky Pi device, and
+    the statistics of its connection. The broker is the user data of its
+    client, so the MQTT callbacks know which device a message came from.
+
+    Attributes:
+        device (DeviceConfig): The configuration of the device.
+        client: The MQTT client.
+        connected (bool): Whether the client is connected.
+        connects (int): The number of times the client connected.
+        connect_failures (int): The number of times the client failed to connect.
+        disconnects (int): The number of times the client disconnected.
+        messages (int): The number of messages received from the broker.
+    """
+
+    def __init__(self, device: DeviceConfig, client) -> None:
+        self.device = device
+        self.client = client
+        self.connected = False
+        self.connects = 0
+        self.connect_failures = 0
+        self.disconnects = 0
+        self.messages = 0
+        client.user_data_set(self)
+
+    @property
+    def name(self) -> str:
+        """
+        The name of the device.
+        """
+        return self.device.name
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Reports the connection statistics.
+
+        Returns:
+            Dict[str, int]: Whether the client is connected and the connect, failed connect, disconnect and message counts.
+        """
+        return {
+            "connected": int(self.connected),
+            "connects": self.connects,
+            "connect_failures": self.connect_failures,
+            "disconnects": self.disconnects,
+            "messages": self.messages,
+        }
@@ -0,0 +1,122 @@
+import logging
+import threading
+from typing import Callable, Dict, Hashable, List
+
+from .data.data_classes import CoalesceConfig
+from .request import NtfyRequest
+from .scheduler import Scheduler, Timer
+
+
+class _Window:
+    __slots__ = ("request", "messages", "timer")
+
+    def __init__(self, request: NtfyRequest) -> None:
+        self.request = request
+        self.messages: List[str] = []
+        self.timer: Timer = None
+
+
+class Coalescer:
+    """
+    Merges notifications sent with the same request within a time window into
+    a single digest notification. Requests are the same when they post to the
+    same URL with the same headers and attachment, so notifications whose
+    templates render different headers, or that attach different files, are
+    sent in separate digests.
+
+    A window opens with the first message and is flushed by the scheduler
+    when the window elapses, or immediately once it holds the maximum number
+    of messages.
+
+    Attributes:
+        send (Callable[[NtfyRequest, str], None]): Called with the request and body of each digest.
+        separator (str): The text placed between the messages of a digest.
+    """
+
+    def __init__(
+        self,
+        scheduler: Scheduler,
+        send: Callable[[NtfyRequest, str], None],
+        separator: str = "\n",
+    ) -> None:
+        self.send = send
+        self.separator = separator
+        self._scheduler = scheduler
+        self._windows: Dict[Hashable, _Window] = {}
+        self._lock = threading.Lock()
+        self._received = 0
+        self._sent = 0
+
+    def add(self, request: NtfyRequest, config: CoalesceConfig, message: str) -> None:
+        """
+        Adds a message to the window of a request.
+
+        Args:
+            request (NtfyRequest): The rendered request the message is sent with.
+            config (CoalesceConfig): The coalescing configuration of the topic.
+            message (str): The notification message.
+
+        Returns:
+            None
+        """
+        key = (request.url, request.attachment, tuple(request.headers.items()))
+        full = None
+        with self._lock:
+            self._received += 1
+            window = self._windows.get(key)
+            if window is None:
+                window = _Window(request)
+                self._windows[key] = window
+                window.timer = self._scheduler.call_later(
+                    config.window_ms / 1000, self._flush_window, key, window
+                )
+            window.messages.append(message)
+            if len(window.messages) >= config.max_messages:
+                window.timer.cancel()
+                full = self._windows.pop(key)
+        if full:
+            self._send(full)
+
+    def flush(self) -> None:
+        """
+        Sends every open window immediately.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            windows, self._windows = list(self._windows.values()), {}
+        for window in windows:
+            window.timer.cancel()
+            self._send(window)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Reports the number of messages received and digests sent.
+
+        Returns:
+            Dict[str, int]: The coalescing counters.
+        """
+        with self._lock:
+            return {
+                "received": self._received,
+                "sent": self._sent,
+                "open_windows": len(self._windows),
+            }
+
+    def _flush_window(self, key: Hashable, window: _Window) -> None:
+        with self._lock:
+            if self._windows.get(key) is not window:
+                return
+            del self._windows[key]
+        self._send(window)
+
+    def _send(self, window: _Window) -> None:
+        with self._lock:
+            self._sent += 1
+        logging.debug(
+            "coalesced %s notifications for %s",
+            len(window.messages),
+            window.request.url,
+        )
+        self.send(window.request, self.separator.join(window.messages))
@@ -1,9 +1,16 @@
 from dataclasses import dataclass, field
 from typing import List, Optional
 from dataclass_wizard import JSONWizard
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
 import os.path
+import queue
+from ..logs import (
+    BatchedRotatingFileHandler,
+    DeferredQueueHandler,
+    JsonFormatter,
+    LogListener,
+)
 
 
 @dataclass
@@ -59,6 +66,7 @@ class ModuleLoggingConfig(LoggingConfig):
 
     Attributes:
         file (Optional[str]): The file path for the log file. Defaults to None.
+        structured (bool): Whether log records are written as compact JSON objects. Defaults to False.
     """
 
     """
@@ -72,6 +80,7 @@ class ModuleLoggingConfig(LoggingConfig):
     """
 
     file: Optional[str] = None
+    structured: bool = False
 
     def merge(self, logging_config: LoggingConfig):
         if not self.path:
@@ -84,6 +93,26 @@ class ModuleLoggingConfig(LoggingConfig):
             self.rotation = logging_config.rotation
 
 
+@dataclass
+class NtfyTemplate(JSONWizard):
+    """
+    Represents notification options built from the fields of each payload.
+    Placeholders such as "{pass.time}" are replaced by the payload field at
+    that dotted path, and "{{" and "}}" stand for literal braces.
+
+    Attributes:
+        title (Optional[str]): The title template. Defaults to None.
+        message (Optional[str]): The message template, used instead of the payload field. Defaults to None.
+        priority (Optional[str]): The priority template. Defaults to None.
+        tags (List[str]): The tag templates. Defaults to an empty list.
+    """
+
+    title: Optional[str] = None
+    message: Optional[str] = None
+    priority: Optional[str] = None
+    tags: List[str] = field(default_factory=list)
+
+
 @dataclass
 class NtfyOptions(JSONWizard):
     """
@@ -93,11 +122,13 @@ class NtfyOptions(JSONWizard):
         title (Optional[str]): The title of the notification.
         priority (Optional[int]): The priority of the notification. Defaults to 3.
         tags (List[str]): The tags associated with the notification. Defaults to an empty list.
+        template (Optional[NtfyTemplate]): Builds the title, message, priority and tags from the payload, overriding the static options. Defaults to None.
     """
 
     title: Optional[str]
     priority: Optional[int] = 3
     tags: List[str] = field(default_factory=list)
+    template: Optional[NtfyTemplate] = None
 
 
 @dataclass
@@ -108,10 +139,30 @@ class Ntfy(JSONWizard):
     Attributes:
         topic (str): The topic of the notification.
         options (Optional[NtfyOptions]): The options for the notification. Defaults to None.
+        server (Optional[str]): The ntfy server to send to, overriding the module server. Defaults to None.
+        rate (Optional[float]): The notifications per second sent to the topic, overriding the module rate limit. Defaults to None.
+        burst (Optional[int]): The notifications that may be sent to the topic at once. Defaults to None.
     """
 
     topic: str
     options: Optional[NtfyOptions] = None
+    server: Optional[str] = None
+    rate: Optional[float] = None
+    burst: Optional[int] = None
+
+
+@dataclass
+class CoalesceConfig(JSONWizard):
+    """
+    Represents the configuration for merging bursts of notifications into one.
+
+    Attributes:
+        window_ms (int): The milliseconds messages are collected for after the first. Defaults to 1000.
+        max_messages (int): The number of messages that sends the digest early. Defaults to 10.
+    """
+
+    window_ms: int = 1000
+    max_messages: int = 10
 
 
 @dataclass
@@ -122,25 +173,236 @@ class TopicConfig(JSONWizard):
     Attributes:
         mqtt_topic (str): The MQTT topic.
         ntfy (Ntfy): The notification configuration.
+        targets (List[Ntfy]): The further ntfy targets each message is also sent to. Defaults to an empty list.
+        coalesce (Optional[CoalesceConfig]): Merges bursts of messages into one notification. Defaults to None.
+        field (Optional[str]): The dotted path of the payload field holding the message, overriding the module's. Defaults to None.
+        device (Optional[str]): The name of the only device whose messages the configuration applies to. Defaults to None, applying to every device.
+        qos (int): The MQTT quality of service the topic is subscribed with. Defaults to 0.
     """
 
     mqtt_topic: str
     ntfy: Ntfy
+    targets: List[Ntfy] = field(default_factory=list)
+    coalesce: Optional[CoalesceConfig] = None
+    field: Optional[str] = None
+    device: Optional[str] = None
+    qos: int = 0
 
 
 @dataclass
-class NtfyModuleConfig(JSONWizard):
-    class NtfyModuleConfig:
-        """
-        Represents the configuration for an Ntfy module.
+class DispatchConfig(JSONWizard):
+    """
+    Represents the configuration for the notification dispatch stage.
 
-        Attributes:
-            logging (ModuleLoggingConfig): The logging configuration for the module.
-            configurations (list[TopicConfig]): The list of topic configurations for the module.
-        """
+    Attributes:
+        workers (int): The number of sender workers draining the queue. Defaults to 2.
+        queue_size (int): The maximum number of messages waiting to be sent. Defaults to 100.
+        overflow (str): What is dropped when the queue is full: "drop_newest" drops the new message, "drop_lowest" the oldest of the lowest priority, and "block" waits for room. Defaults to "drop_newest".
+        block_timeout (float): The seconds the "block" overflow waits for room before dropping the new message. Defaults to 1.
+    """
 
-    logging: ModuleLoggingConfig
-    configurations: List[TopicConfig] = field(default_factory=list)
+    workers: int = 2
+    queue_size: int = 100
+    overflow: str = "drop_newest"
+    block_timeout: float = 1.0
+
+
+@dataclass
+class HttpConfig(JSONWizard):
+    """
+    Represents the configuration for the HTTP connections to ntfy servers.
+
+    Attributes:
+        pool_size (int): The maximum number of connections kept open per server. Defaults to 4.
+        connect_timeout (float): The seconds to wait for a connection to be established. Defaults to 5.
+        read_timeout (float): The seconds to wait for the server to respond. Defaults to 10.
+        keep_alive (bool): Whether connections are reused between notifications. Defaults to True.
+        max_in_flight (int): The maximum number of notifications being sent at once in async mode. Defaults to 100.
+    """
+
+    pool_size: int = 4
+    connect_timeout: float = 5.0
+    read_timeout: float = 10.0
+    keep_alive: bool = True
+    max_in_flight: int = 100
+
+
+@dataclass
+class DedupConfig(JSONWizard):
+    """
+    Represents the configuration for dropping repeated MQTT messages.
+
+    Attributes:
+        ttl (float): The seconds a message is remembered for. Defaults to 60.
+        max_entries (int): The maximum number of messages remembered. Defaults to 1024.
+    """
+
+    ttl: float = 60.0
+    max_entries: int = 1024
+
+
+@dataclass
+class OutboxConfig(JSONWizard):
+    """
+    Represents the configuration for storing notifications that could not be sent.
+
+    Attributes:
+        file (str): The file name of the outbox database within the logging path. Defaults to "outbox.db".
+        batch_size (int): The number of notifications written to disk together. Defaults to 50.
+        flush_interval (float): The seconds a notification may wait before being written. Defaults to 1.
+        replay_interval (float): The seconds between attempts to send stored notifications. Defaults to 30.
+        replay_batch (int): The number of stored notifications read at a time. Defaults to 100.
+        replay_concurrency (int): The number of stored notifications sent at the same time. Defaults to 2.
+    """
+
+    file: str = "outbox.db"
+    batch_size: int = 50
+    flush_interval: float = 1.0
+    replay_interval: float = 30.0
+    replay_batch: int = 100
+    replay_concurrency: int = 2
+
+
+@dataclass
+class RetryConfig(JSONWizard):
+    """
+    Represents the configuration for sending failed notifications again.
+
+    Attributes:
+        max_attempts (int): The number of attempts made to send a notification. Defaults to 3.
+        base_delay (float): The seconds the backoff between attempts starts from. Defaults to 1.
+        max_delay (float): The maximum seconds between attempts. Defaults to 60.
+        jitter (bool): Whether the backoff is randomised. Defaults to True.
+        breaker_threshold (int): The consecutive failures that stop sending to a server. Defaults to 5.
+        breaker_reset (float): The seconds before sending to a failing server is tried again. Defaults to 30.
+    """
+
+    max_attempts: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    jitter: bool = True
+    breaker_threshold: int = 5
+    breaker_reset: float = 30.0
+
+
+@dataclass
+class RateLimitConfig(JSONWizard):
+    """
+    Represents the configuration for spacing out notifications to stay within ntfy's limits.
+
+    The server defaults match the publishing limits of ntfy.sh.
+
+    Attributes:
+        topic_rate (float): The notifications per second sent to each ntfy topic. Defaults to 1.
+        topic_burst (int): The notifications that may be sent to a topic at once. Defaults to 10.
+        server_rate (float): The notifications per second sent to each ntfy server. Defaults to 0.2.
+        server_burst (int): The notifications that may be sent to a server at once. Defaults to 60.
+        max_delay (float): The longest a notification is held back, in seconds. Defaults to 300.
+        backoff_factor (float): The factor rates are multiplied by when ntfy returns 429. Defaults to 0.5.
+        min_rate (float): The lowest rate notifications are slowed to. Defaults to 0.01.
+    """
+
+    topic_rate: float = 1.0
+    topic_burst: int = 10
+    server_rate: float = 0.2
+    server_burst: int = 60
+    max_delay: float = 300.0
+    backoff_factor: float = 0.5
+    min_rate: float = 0.01
+
+
+@dataclass
+class PayloadConfig(JSONWizard):
+    """
+    Represents the configuration for reading messages from MQTT payloads.
+
+    Attributes:
+        field (str): The dotted path of the payload field holding the message. Defaults to "notification".
+        max_size (int): The largest payload in bytes that is read. Defaults to 262144.
+    """
+
+    field: str = "notification"
+    max_size: int = 262144
+
+
+@dataclass
+class DownscaleConfig(JSONWizard):
+    """
+    Represents the configuration for shrinking images in a separate process
+    before they are attached.
+
+    Attributes:
+        command (List[str]): The command and its arguments, where "{input}" and "{output}" stand for the paths of the capture and of the shrunk copy.
+        suffixes (List[str]): The file suffixes of the captures that are shrunk. Defaults to ".jpg", ".jpeg" and ".png".
+        timeout (float): The seconds the command may run. Defaults to 30.
+    """
+
+    command: List[str]
+    suffixes: List[str] = field(default_factory=lambda: [".jpg", ".jpeg", ".png"])
+    timeout: float = 30.0
+
+
+@dataclass
+class AttachmentConfig(JSONWizard):
+    """
+    Represents the configuration for attaching the capture files named in
+    MQTT payloads to notifications.
+
+    Attributes:
+        directories (List[str]): The directories captures may be attached from.
+        field (str): The dotted path of the payload field holding the path of the capture. Defaults to "file".
+        max_size (int): The largest capture in bytes that is attached. Defaults to 15728640.
+        max_concurrent (int): The maximum number of captures uploaded at once. Defaults to 2.
+        downscale (Optional[DownscaleConfig]): Shrinks images before they are attached when set. Defaults to None.
+    """
+
+    directories: List[str]
+    field: str = "file"
+    max_size: int = 15728640
+    max_concurrent: int = 2
+    downscale: Optional[DownscaleConfig] = None
+
+
+@dataclass
+class WatchConfig(JSONWizard):
+    """
+    Represents the configuration for reloading the configuration file when it changes.
+
+    Attributes:
+        interval (float): The seconds between checks of the configuration file. Defaults to 5.
+    """
+
+    interval: float = 5.0
+
+
+@dataclass
+class MqttSessionConfig(JSONWizard):
+    """
+    Represents the configuration for a persistent MQTT session, which the
+    broker keeps while the client is disconnected so that messages sent in
+    the meantime are delivered on reconnecting.
+
+    Attributes:
+        client_id (str): The stable client id the session is kept under.
+        expiry (int): The seconds the broker keeps the session after a disconnect. Defaults to 3600.
+    """
+
+    client_id: str
+    expiry: int = 3600
+
+
+@dataclass
+class MetricsConfig(JSONWizard):
+    """
+    Represents the configuration for the metrics endpoint.
+
+    Attributes:
+        host (str): The address the endpoint listens on. Defaults to "127.0.0.1".
+        port (int): The port the endpoint listens on. Defaults to 9464.
+    """
+
+    host: str = "127.0.0.1"
+    port: int = 9464
 
 
 @dataclass
@@ -151,10 +413,12 @@ class MQTTConfig(JSONWizard):
     Attributes:
         enabled (Optional[bool]): Whether MQTT is enabled. Defaults to False.
         host (Optional[str]): The MQTT host. Defaults to "mqtt://localhost".
+        port (Optional[int]): The MQTT port. Defaults to 1883.
     """
 
     enabled: Optional[bool] = False
     host: Optional[str] = "mqtt://localhost"
+    port: Optional[int] = 1883
 
 
 @dataclass
@@ -171,16 +435,60 @@ class DeviceConfig(JSONWizard):
     mqtt: MQTTConfig
 
 
+@dataclass
+class NtfyModuleConfig(JSONWizard):
+    class NtfyModuleConfig:
+        """
+        Represents the configuration for an Ntfy module.
+
+        Attributes:
+            logging (ModuleLoggingConfig): The logging configuration for the module.
+            configurations (list[TopicConfig]): The list of topic configurations for the module.
+            dispatch (DispatchConfig): The configuration for the dispatch stage.
+            server (str): The default ntfy server. Defaults to "https://ntfy.sh".
+            http (HttpConfig): The configuration for the connections to ntfy.
+            dedup (Optional[DedupConfig]): Drops repeated messages when set. Defaults to None.
+            outbox (Optional[OutboxConfig]): Stores notifications that could not be sent when set. Defaults to None.
+            retry (RetryConfig): The configuration for sending failed notifications again.
+            rate_limit (Optional[RateLimitConfig]): Spaces out notifications when set. Defaults to None.
+            metrics (Optional[MetricsConfig]): Serves metrics in the Prometheus format when set. Defaults to None.
+            payload (PayloadConfig): The configuration for reading messages from MQTT payloads.
+            watch (Optional[WatchConfig]): Reloads the configuration when the file changes when set. Defaults to None.
+            devices (List[DeviceConfig]): Further devices whose MQTT brokers are bridged alongside the NSP device. Defaults to none.
+            mqtt_session (Optional[MqttSessionConfig]): Keeps a persistent MQTT session when set. Defaults to None.
+            attachments (Optional[AttachmentConfig]): Attaches the capture files named in payloads when set. Defaults to None.
+        """
+
+    logging: ModuleLoggingConfig
+    configurations: List[TopicConfig] = field(default_factory=list)
+    dispatch: DispatchConfig = field(default_factory=DispatchConfig)
+    server: str = "https://ntfy.sh"
+    http: HttpConfig = field(default_factory=HttpConfig)
+    dedup: Optional[DedupConfig] = None
+    outbox: Optional[OutboxConfig] = None
+    retry: RetryConfig = field(default_factory=RetryConfig)
+    rate_limit: Optional[RateLimitConfig] = None
+    metrics: Optional[MetricsConfig] = None
+    payload: PayloadConfig = field(default_factory=PayloadConfig)
+    watch: Optional[WatchConfig] = None
+    devices: List[DeviceConfig] = field(default_factory=list)
+    mqtt_session: Optional[MqttSessionConfig] = None
+    attachments: Optional[AttachmentConfig] = None
+
+
 def __configure_logging(
     module_logging: ModuleLoggingConfig, root_logging: LoggingConfig
-) -> None:
+) -> LogListener:
     """
     Configures logging based on the provided module_logging and root_logging configurations.
+    Log records are queued and written to the log file by a listener thread,
+    so that neither formatting nor writing and rotating the file happens on
+    the thread that logs.
     Args:
         module_logging (ModuleLoggingConfig): The configuration for module-specific logging.
         root_logging (LoggingConfig): The root logging configuration.
     Returns:
-        None
+        LogListener: The started listener writing the log file.
     """
 
     module_logging.merge(root_logging)
@@ -190,15 +498,21 @@ def __configure_logging(
         os.makedirs(log_conf.path)
 
     file = f"{log_conf.path}/{log_conf.file}"
-    handler = RotatingFileHandler(
-        file, maxBytes=log_conf.rotation.size, backupCount=log_conf.rotation.backup
-    )
-
-    logging.basicConfig(
-        level=log_conf.level,
-        format=log_conf.format.output,
-        datefmt=log_conf.format.date,
-        handlers=[handler],
+    records = queue.SimpleQueue()
+    handler = BatchedRotatingFileHandler(
+        file, records, log_conf.rotation.size, log_conf.rotation.backup
     )
+    if log_conf.structured:
+        handler.setFormatter(JsonFormatter(datefmt=log_conf.format.date))
+    else:
+        handler.setFormatter(
+            logging.Formatter(log_conf.format.output, log_conf.format.date)
+        )
+    listener = LogListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logging.basicConfig(level=log_conf.level, handlers=[DeferredQueueHandler(records)])
 
     logging.info("configuration created")
+    return listener
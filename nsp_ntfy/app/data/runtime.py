@@ -0,0 +1,257 @@
+import sys
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from .data_classes import (
+    CoalesceConfig,
+    Ntfy,
+    NtfyModuleConfig,
+    NtfyOptions,
+    NtfyTemplate,
+    TopicConfig,
+)
+
+
+@dataclass(frozen=True, slots=True)
+class RuntimeTemplate:
+    """
+    The compact form of an NtfyTemplate.
+
+    Attributes:
+        title (Optional[str]): The title template.
+        message (Optional[str]): The message template.
+        priority (Optional[str]): The priority template.
+        tags (Tuple[str, ...]): The tag templates.
+    """
+
+    title: Optional[str]
+    message: Optional[str]
+    priority: Optional[str]
+    tags: Tuple[str, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class RuntimeOptions:
+    """
+    The compact form of NtfyOptions.
+
+    Attributes:
+        title (Optional[str]): The title of the notification.
+        priority (Optional[int]): The priority of the notification.
+        tags (Tuple[str, ...]): The tags associated with the notification.
+        template (Optional[RuntimeTemplate]): The templates built from each payload.
+    """
+
+    title: Optional[str]
+    priority: Optional[int]
+    tags: Tuple[str, ...]
+    template: Optional[RuntimeTemplate]
+
+
+@dataclass(frozen=True, slots=True)
+class RuntimeNtfy:
+    """
+    The compact form of an Ntfy target.
+
+    Attributes:
+        topic (str): The ntfy topic.
+        options (Optional[RuntimeOptions]): The options for the notification.
+        server (Optional[str]): The ntfy server overriding the module server.
+        rate (Optional[float]): The notifications per second sent to the topic.
+        burst (Optional[int]): The notifications that may be sent to the topic at once.
+    """
+
+    topic: str
+    options: Optional[RuntimeOptions]
+    server: Optional[str]
+    rate: Optional[float]
+    burst: Optional[int]
+
+
+@dataclass(frozen=True, slots=True)
+class RuntimeCoalesce:
+    """
+    The compact form of a CoalesceConfig.
+
+    Attributes:
+        window_ms (int): The milliseconds messages are collected for after the first.
+        max_messages (int): The number of messages that sends the digest early.
+    """
+
+    window_ms: int
+    max_messages: int
+
+
+@dataclass(frozen=True, slots=True)
+class RuntimeTopic:
+    """
+    The compact form of a TopicConfig, with the same attributes so that it is
+    read wherever a topic configuration is.
+
+    Attributes:
+        mqtt_topic (str): The MQTT topic.
+        ntfy (RuntimeNtfy): The notification configuration.
+        targets (Tuple[RuntimeNtfy, ...]): The further ntfy targets.
+        coalesce (Optional[RuntimeCoalesce]): Merges bursts of messages into one notification.
+        field (Optional[str]): The dotted path of the payload field holding the message.
+        device (Optional[str]): The name of the only device the configuration applies to.
+        qos (int): The MQTT quality of service the topic is subscribed with.
+    """
+
+    mqtt_topic: str
+    ntfy: RuntimeNtfy
+    targets: Tuple[RuntimeNtfy, ...]
+    coalesce: Optional[RuntimeCoalesce]
+    field: Optional[str]
+    device: Optional[str]
+    qos: int
+
+
+class Lowering:
+    """
+    Lowers topic configurations into their compact runtime form.
+
+    Strings are interned and equal options, templates and coalesce settings
+    are shared, so thousands of topics with the same options hold a single
+    copy of them. The runtime classes have slots instead of a per-instance
+    dictionary and are immutable, which is what allows sharing them.
+    """
+
+    def __init__(self) -> None:
+        self._shared: Dict[Tuple, object] = {}
+
+    def topic(self, config: TopicConfig) -> RuntimeTopic:
+        """
+        Lowers a topic configuration.
+
+        Args:
+            config (TopicConfig): The topic configuration.
+
+        Returns:
+            RuntimeTopic: The compact topic configuration.
+        """
+        return RuntimeTopic(
+            _intern(config.mqtt_topic),
+            self.ntfy(config.ntfy),
+            tuple(self.ntfy(target) for target in config.targets),
+            self.coalesce(config.coalesce),
+            _intern(config.field),
+            _intern(config.device),
+            config.qos,
+        )
+
+    def ntfy(self, config: Ntfy) -> RuntimeNtfy:
+        """
+        Lowers an ntfy target.
+
+        Args:
+            config (Ntfy): The ntfy target.
+
+        Returns:
+            RuntimeNtfy: The compact ntfy target.
+        """
+        return RuntimeNtfy(
+            _intern(config.topic),
+            self.options(config.options),
+            _intern(config.server),
+            config.rate,
+            config.burst,
+        )
+
+    def options(self, config: Optional[NtfyOptions]) -> Optional[RuntimeOptions]:
+        """
+        Lowers notification options, sharing equal ones.
+
+        Args:
+            config (Optional[NtfyOptions]): The notification options.
+
+        Returns:
+            Optional[RuntimeOptions]: The shared compact options.
+        """
+        if config is None:
+            return None
+        key = (
+            RuntimeOptions,
+            config.title,
+            config.priority,
+            tuple(config.tags),
+            self.template(config.template),
+        )
+        options = self._shared.get(key)
+        if options is None:
+            options = self._shared[key] = RuntimeOptions(
+                _intern(config.title),
+                config.priority,
+                tuple(_intern(tag) for tag in config.tags),
+                key[4],
+            )
+        return options
+
+    def template(self, config: Optional[NtfyTemplate]) -> Optional[RuntimeTemplate]:
+        """
+        Lowers notification templates, sharing equal ones.
+
+        Args:
+            config (Optional[NtfyTemplate]): The notification templates.
+
+        Returns:
+            Optional[RuntimeTemplate]: The shared compact templates.
+        """
+        if config is None:
+            return None
+        key = (
+            RuntimeTemplate,
+            config.title,
+            config.message,
+            config.priority,
+            tuple(config.tags),
+        )
+        template = self._shared.get(key)
+        if template is None:
+            template = self._shared[key] = RuntimeTemplate(
+                _intern(config.title),
+                _intern(config.message),
+                _intern(config.priority),
+                tuple(_intern(tag) for tag in config.tags),
+            )
+        return template
+
+    def coalesce(self, config: Optional[CoalesceConfig]) -> Optional[RuntimeCoalesce]:
+        """
+        Lowers coalesce settings, sharing equal ones.
+
+        Args:
+            config (Optional[CoalesceConfig]): The coalesce settings.
+
+        Returns:
+            Optional[RuntimeCoalesce]: The shared compact coalesce settings.
+        """
+        if config is None:
+            return None
+        key = (RuntimeCoalesce, config.window_ms, config.max_messages)
+        coalesce = self._shared.get(key)
+        if coalesce is None:
+            coalesce = self._shared[key] = RuntimeCoalesce(*key[1:])
+        return coalesce
+
+
+def lower_configuration(configuration: NtfyModuleConfig) -> NtfyModuleConfig:
+    """
+    Replaces the topic configurations of a module configuration with their
+    compact runtime form, releasing the schema objects they were read into.
+
+    Args:
+        configuration (NtfyModuleConfig): The module configuration.
+
+    Returns:
+        NtfyModuleConfig: The same module configuration.
+    """
+    lowering = Lowering()
+    configuration.configurations = [
+        lowering.topic(topic_config) for topic_config in configuration.configurations
+    ]
+    return configuration
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else value
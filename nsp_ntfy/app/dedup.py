@@ -0,0 +1,108 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class DedupCache:
+    """
+    Remembers recently received MQTT messages so that repeated deliveries of
+    the same payload, such as publisher retries and retained messages replayed
+    on reconnect, are only forwarded once.
+
+    Entries are keyed on a digest of the device, topic and payload, so the
+    same message from two devices is forwarded for each, and all share the
+    same time to live, so insertion order is also expiry order. Expired and
+    oldest entries are therefore always at the front of the cache and are
+    evicted in constant time.
+
+    Attributes:
+        ttl (float): The seconds a message is remembered for.
+        max_entries (int): The maximum number of messages remembered.
+    """
+
+    def __init__(self, ttl: float, max_entries: int) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(topic: str, payload: bytes, device: Optional[str] = None) -> bytes:
+        """
+        Creates the cache key for a message.
+
+        Args:
+            topic (str): The MQTT topic of the message.
+            payload (bytes): The payload of the message.
+            device (Optional[str]): The name of the device the message came from. Defaults to None.
+
+        Returns:
+            bytes: The digest of the device, topic and payload.
+        """
+        digest = hashlib.blake2b(topic.encode("utf-8"), digest_size=16)
+        digest.update(b"\0")
+        if device is not None:
+            digest.update(device.encode("utf-8"))
+            digest.update(b"\0")
+        digest.update(payload)
+        return digest.digest()
+
+    def seen(self, topic: str, payload: bytes, device: Optional[str] = None) -> bool:
+        """
+        Checks whether a message was received within the time to live, and
+        remembers it if it wasn't.
+
+        Args:
+            topic (str): The MQTT topic of the message.
+            payload (bytes): The payload of the message.
+            device (Optional[str]): The name of the device the message came from. Defaults to None.
+
+        Returns:
+            bool: True if the message is a duplicate.
+        """
+        key = self.key(topic, payload, device)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            expires = self._entries.get(key)
+            if expires is not None:
+                self.hits += 1
+                return True
+            self.misses += 1
+            self._entries[key] = now + self.ttl
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return False
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Reports the cache counters.
+
+        Returns:
+            Dict[str, int]: The hits, misses, evictions and current size.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
+
+    def _expire(self, now: float) -> None:
+        entries = self._entries
+        while entries:
+            key, expires = next(iter(entries.items()))
+            if expires > now:
+                return
+            del entries[key]
+            self.evictions += 1
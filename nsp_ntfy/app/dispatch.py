@@ -0,0 +1,399 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+_STOP = object()
+_STOP_PRIORITY = -1
+
+DEFAULT_PRIORITY = 3
+DROP_NEWEST = "drop_newest"
+DROP_LOWEST = "drop_lowest"
+BLOCK = "block"
+OVERFLOW_POLICIES = (DROP_NEWEST, DROP_LOWEST, BLOCK)
+
+
+class _Control:
+    __slots__ = ("item",)
+
+    def __init__(self, item: Any) -> None:
+        self.item = item
+
+
+class PriorityBuffer:
+    """
+    A bounded buffer that hands out the items of the highest priority first,
+    and the items of one priority in the order they were added.
+
+    When the buffer is full, the overflow policy decides what is shed:
+    "drop_newest" rejects the new item, "drop_lowest" evicts the oldest item
+    of the lowest priority when it is no more urgent than the new item, and
+    "block" waits up to the block timeout for room before rejecting the new
+    item. Items added with put_control are never shed.
+
+    Attributes:
+        maxsize (int): The maximum number of items held.
+        overflow (str): The overflow policy.
+        block_timeout (float): The seconds the "block" policy waits for room.
+    """
+
+    def __init__(
+        self, maxsize: int, overflow: str = DROP_NEWEST, block_timeout: float = 1.0
+    ) -> None:
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"unknown overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}"
+            )
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self._levels: Dict[int, Deque[Any]] = {}
+        self._controls: Dict[int, int] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def put(self, item: Any, priority: int) -> Tuple[bool, Optional[Any]]:
+        """
+        Adds an item, shedding an item when the buffer is full.
+
+        Args:
+            item (Any): The item to add.
+            priority (int): The priority of the item, higher is more urgent.
+
+        Returns:
+            Tuple[bool, Optional[Any]]: Whether the item was added, and the item evicted to make room for it, if any.
+        """
+        evicted = None
+        with self._lock:
+            if self._size >= self.maxsize:
+                if self.overflow == BLOCK:
+                    deadline = time.monotonic() + self.block_timeout
+                    while self._size >= self.maxsize:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False, None
+                        self._not_full.wait(remaining)
+                elif self.overflow == DROP_LOWEST:
+                    lowest = min(
+                        (
+                            level
+                            for level, items in self._levels.items()
+                            if len(items) > self._controls.get(level, 0)
+                        ),
+                        default=None,
+                    )
+                    if lowest is None or lowest > priority:
+                        return False, None
+                    evicted = self._evict(lowest)
+                else:
+                    return False, None
+            self._append(item, priority)
+        return True, evicted
+
+    def put_control(self, item: Any, priority: int) -> None:
+        """
+        Adds an item regardless of the size of the buffer. The item is never
+        evicted by the "drop_lowest" policy.
+
+        Args:
+            item (Any): The item to add.
+            priority (int): The priority of the item.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._controls[priority] = self._controls.get(priority, 0) + 1
+            self._append(_Control(item), priority)
+
+    def get(self) -> Any:
+        """
+        Removes the oldest item of the highest priority, waiting for one if
+        the buffer is empty.
+
+        Returns:
+            Any: The item.
+        """
+        with self._lock:
+            while not self._size:
+                self._not_empty.wait()
+            return self._pop(max(self._levels))
+
+    def clear(self) -> List[Any]:
+        """
+        Removes every item.
+
+        Returns:
+            List[Any]: The removed items, most urgent first.
+        """
+        with self._lock:
+            items = [
+                item.item if isinstance(item, _Control) else item
+                for priority in sorted(self._levels, reverse=True)
+                for item in self._levels[priority]
+            ]
+            self._levels.clear()
+            self._controls.clear()
+            self._size = 0
+            self._not_full.notify_all()
+            return items
+
+    def qsize(self) -> int:
+        """
+        The number of items held.
+        """
+        return self._size
+
+    def _append(self, item: Any, priority: int) -> None:
+        level = self._levels.get(priority)
+        if level is None:
+            level = self._levels[priority] = deque()
+        level.append(item)
+        self._size += 1
+        self._not_empty.notify()
+
+    def _pop(self, priority: int) -> Any:
+        level = self._levels[priority]
+        item = level.popleft()
+        if isinstance(item, _Control):
+            self._uncount_control(priority)
+            item = item.item
+        self._release(priority)
+        return item
+
+    def _evict(self, priority: int) -> Any:
+        level = self._levels[priority]
+        for index, item in enumerate(level):
+            if not isinstance(item, _Control):
+                del level[index]
+                self._release(priority)
+                return item
+
+    def _uncount_control(self, priority: int) -> None:
+        remaining = self._controls[priority] - 1
+        if remaining:
+            self._controls[priority] = remaining
+        else:
+            del self._controls[priority]
+
+    def _release(self, priority: int) -> None:
+        if not self._levels[priority]:
+            del self._levels[priority]
+        self._size -= 1
+        self._not_full.notify()
+
+
+class Dispatcher:
+    """
+    Decouples receiving MQTT messages from sending notifications.
+
+    Jobs are placed onto a bounded priority buffer and drained by a pool of
+    worker threads, so that a slow ntfy request never blocks the MQTT network
+    loop. Under overload the most urgent jobs are sent first, and jobs shed
+    by the overflow policy are counted per topic.
+
+    Attributes:
+        workers (int): The number of worker threads draining the queue.
+        queue_size (int): The maximum number of jobs waiting in the queue.
+        on_shed (Optional[Callable[[Optional[str]], None]]): Called with the topic of each job that is shed.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        queue_size: int,
+        overflow: str = DROP_NEWEST,
+        block_timeout: float = 1.0,
+        on_shed: Callable[[Optional[str]], None] = None,
+    ) -> None:
+        self.workers = workers
+        self.queue_size = queue_size
+        self.on_shed = on_shed
+        self._queue = PriorityBuffer(queue_size, overflow, block_timeout)
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._running = False
+        self._busy = 0
+        self._dispatched = 0
+        self._dropped = 0
+        self._failed = 0
+        self._shed: Dict[str, int] = {}
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether the workers are accepting jobs.
+        """
+        return self._running
+
+    def start(self) -> None:
+        """
+        Starts the worker threads.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._threads = [
+                threading.Thread(
+                    target=self._work, name=f"nsp-ntfy-sender-{index}", daemon=True
+                )
+                for index in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+        logging.info(f"dispatcher started with {self.workers} workers")
+
+    def submit(
+        self,
+        job: Callable,
+        *args,
+        priority: int = DEFAULT_PRIORITY,
+        topic: str = None,
+    ) -> bool:
+        """
+        Queues a job to be run by one of the workers. Only the "block"
+        overflow policy waits for room in the queue.
+
+        Args:
+            job (Callable): The function to run.
+            *args: The arguments to pass to the function.
+            priority (int): The priority of the job, higher is sent first. Defaults to 3.
+            topic (str): The MQTT topic filter of the configuration the job is for, used to count shed jobs.
+
+        Returns:
+            bool: True if the job was queued, False if it was dropped.
+        """
+        if not self._running:
+            logging.warning("dispatcher is not running, dropping message")
+            self._count_dropped()
+            return False
+        queued, evicted = self._queue.put((job, args, topic), priority)
+        if evicted is not None:
+            logging.warning("dispatch queue is full, dropping a less urgent message")
+            self._shed_job(evicted[2])
+        if not queued:
+            logging.warning("dispatch queue is full, dropping message")
+            self._shed_job(topic)
+        return queued
+
+    def resubmit(
+        self,
+        job: Callable,
+        *args,
+        priority: int = DEFAULT_PRIORITY,
+        topic: str = None,
+    ) -> bool:
+        """
+        Queues a job the application hands back to itself, such as a retry, a
+        deferred notification or a further target of a message. The job was
+        already admitted once, so it is queued regardless of the overflow
+        policy, and a worker handing it back never waits for room.
+
+        Args:
+            job (Callable): The function to run.
+            *args: The arguments to pass to the function.
+            priority (int): The priority of the job, higher is sent first. Defaults to 3.
+            topic (str): The MQTT topic filter of the configuration the job is for, used to count shed jobs.
+
+        Returns:
+            bool: True if the job was queued, False if the dispatcher isn't running.
+        """
+        if not self._running:
+            logging.warning("dispatcher is not running, dropping message")
+            self._count_dropped()
+            return False
+        self._queue.put_control((job, args, topic), priority)
+        return True
+
+    def stop(self, drain: bool = True, timeout: float = None) -> None:
+        """
+        Stops the workers.
+
+        Args:
+            drain (bool): Whether to send the queued jobs before stopping. Defaults to True.
+            timeout (float): The maximum number of seconds to wait for each worker.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+        if not drain:
+            discarded = len(self._queue.clear())
+            if discarded:
+                logging.warning(f"discarded {discarded} queued messages on shutdown")
+                self._count_dropped(discarded)
+        for _ in self._threads:
+            self._queue.put_control(_STOP, _STOP_PRIORITY)
+        for thread in self._threads:
+            thread.join(timeout)
+        logging.info("dispatcher stopped")
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Reports the current state of the dispatcher.
+
+        Returns:
+            Dict[str, int]: The queue depth, worker counts and job counters.
+        """
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_size": self.queue_size,
+                "workers": self.workers,
+                "workers_alive": sum(1 for t in self._threads if t.is_alive()),
+                "workers_busy": self._busy,
+                "dispatched": self._dispatched,
+                "dropped": self._dropped,
+                "failed": self._failed,
+            }
+
+    def shed(self) -> Dict[str, int]:
+        """
+        Reports the number of jobs shed by the overflow policy for each topic.
+
+        Returns:
+            Dict[str, int]: The shed count of each MQTT topic.
+        """
+        with self._lock:
+            return dict(self._shed)
+
+    def _count_dropped(self, count: int = 1) -> None:
+        with self._lock:
+            self._dropped += count
+
+    def _shed_job(self, topic: Optional[str]) -> None:
+        with self._lock:
+            self._dropped += 1
+            if topic is not None:
+                self._shed[topic] = self._shed.get(topic, 0) + 1
+        if self.on_shed is not None:
+            self.on_shed(topic)
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            job, args, _ = item
+            with self._lock:
+                self._busy += 1
+            try:
+                job(*args)
+            except Exception:
+                logging.exception("dispatched job failed")
+                with self._lock:
+                    self._failed += 1
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                    self._dispatched += 1
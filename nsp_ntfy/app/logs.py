@@ -0,0 +1,75 @@
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Puts log records on a queue without formatting them, so that the message
+    is only formatted, and its arguments only converted to text, by the
+    thread writing the log file.
+
+    The standard QueueHandler formats each record before queueing it so that
+    it can be pickled; the records here never leave the process.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class BatchedRotatingFileHandler(RotatingFileHandler):
+    """
+    A RotatingFileHandler that only flushes once the queue of records waiting
+    to be written is empty, so that a burst of records is written to the file
+    together instead of one write per record.
+
+    Attributes:
+        pending (queue.SimpleQueue): The queue of records waiting to be written.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        pending: queue.SimpleQueue,
+        max_bytes: int = 0,
+        backup_count: int = 0,
+    ) -> None:
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count)
+        self.pending = pending
+
+    def flush(self) -> None:
+        if self.pending.empty():
+            super().flush()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats log records as compact JSON objects, one per line, with the time,
+    level, thread and message of the record and the exception if there is one.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+
+
+class LogListener(QueueListener):
+    """
+    A QueueListener that flushes its handlers once it has written the records
+    left on the queue, and that can be stopped more than once, so that it can
+    be stopped on shutdown and again when the interpreter exits.
+    """
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            super().stop()
+            for handler in self.handlers:
+                handler.flush()
@@ -1,25 +1,106 @@
-import paho.mqtt.client as mqtt
+from __future__ import annotations
+
+import dataclasses
 import json
-from os.path import isfile
-from typing import Tuple
+from os.path import isfile, splitext
+from typing import Callable, Dict, List, Optional, Tuple
 import logging
+import signal
+import sys
+import threading
+import time
 from .data.data_classes import (
     DeviceConfig,
     NtfyModuleConfig,
     LoggingConfig,
+    HttpConfig,
+    OutboxConfig,
+    RetryConfig,
     __configure_logging,
     TopicConfig,
 )
-import requests
+from .data.runtime import lower_configuration
+from .attachments import Attachments
+from .brokers import Broker, configurations_for
+from .coalesce import Coalescer
+from .dedup import DedupCache
+from .dispatch import Dispatcher
+from .logs import LogListener
+from .metrics import Metrics, MetricsServer
+from .outbox import Outbox
+from .payload import DEFAULT_FIELD, PayloadExtractor, parse_path
+from .request import (
+    DEFAULT_PRIORITY,
+    NtfyRequest,
+    Route,
+    compile_request,
+    compile_route,
+    render_request,
+    resolve_server,
+    targets_of,
+)
+from .retry import (
+    CircuitBreakers,
+    Outcome,
+    Result,
+    RetryPolicy,
+    classify_error,
+    classify_response,
+)
+from .ratelimit import RateLimiter
+from .recording import Recorder, Replay, parse_speed, read_records
+from .reload import FileWatcher, diff_subscriptions, subscriptions_of
+from .routing import RoutingIndex
+from .scheduler import Scheduler
+from .sessions import SessionPool
+from .snapshot import ConfigSnapshot
+from .startup import StartupProfile, lazy_import
+from .supervisor import Supervisor
+
+mqtt = lazy_import("paho.mqtt.client")
+mqtt_properties = lazy_import("paho.mqtt.properties")
+mqtt_packettypes = lazy_import("paho.mqtt.packettypes")
+requests = lazy_import("requests")
+aio = lazy_import("nsp_ntfy.app.aio")
 
 module_configuration: NtfyModuleConfig = None
 nsp_configuration: DeviceConfig = None
+dispatcher: Dispatcher = None
+routing_index: RoutingIndex = RoutingIndex()
+device_indexes: Dict[str, RoutingIndex] = {}
+brokers: List[Broker] = []
+sessions: SessionPool = SessionPool(HttpConfig())
+scheduler: Scheduler = None
+coalescer: Coalescer = None
+deduplicator: DedupCache = None
+outbox: Outbox = None
+outbox_configuration: OutboxConfig = None
+replay_lock = threading.Lock()
+retry_policy: RetryPolicy = RetryPolicy(RetryConfig())
+breakers: CircuitBreakers = CircuitBreakers(RetryConfig())
+rate_limiter: RateLimiter = None
+engine: aio.AsyncEngine = None
+metrics: Metrics = None
+extractor: PayloadExtractor = PayloadExtractor()
+attachments: Attachments = None
+metrics_server: MetricsServer = None
+watcher: FileWatcher = None
+log_listener: LogListener = None
+worker_index: int = None
+share_group: str = None
+stats_reporter: Callable[[Dict], None] = None
+startup_profile: StartupProfile = None
+message_source: Callable[[], None] = None
+STATS_INTERVAL = 15.0
 
 
 def on_connect(client, userdata, flags, reason_code, properties):
     """
     Callback function that is called when the client connects to the MQTT broker.
 
+    The topics are subscribed to on every connection, in a single SUBSCRIBE
+    packet, so that the subscriptions are restored after the broker restarts.
+
     Args:
         client: The MQTT client instance.
         userdata: The private user data as set in the MQTT client constructor.
@@ -30,13 +111,70 @@ def on_connect(client, userdata, flags, reason_code, properties):
     Returns:
         None
     """
-    logging.info("connected to MQTT broker")
+    if reason_code.is_failure:
+        logging.error("failed to connect to MQTT broker, %s", reason_code)
+        return
+    device = None
+    if isinstance(userdata, Broker):
+        userdata.connected = True
+        userdata.connects += 1
+        device = userdata.name
+        logging.info("connected to MQTT broker of %s", device)
+    else:
+        logging.info("connected to MQTT broker")
+    subscriptions = subscriptions_of(module_configuration, device)
+    if subscriptions:
+        client.subscribe(
+            [(get_subscription(topic), qos) for topic, qos in subscriptions.items()]
+        )
+
+
+def on_connect_fail(client, userdata):
+    """
+    Callback function that is called when the client fails to connect to the
+    MQTT broker. The client keeps trying to connect in the background.
+
+    Args:
+        client: The MQTT client instance.
+        userdata: The private user data as set in the MQTT client constructor.
+
+    Returns:
+        None
+    """
+    if isinstance(userdata, Broker):
+        userdata.connect_failures += 1
+        logging.warning("failed to connect to MQTT broker of %s", userdata.name)
+    else:
+        logging.warning("failed to connect to MQTT broker")
+
+
+def on_disconnect(client, userdata, flags, reason_code, properties):
+    """
+    Callback function that is called when the client disconnects from the MQTT broker.
+
+    Args:
+        client: The MQTT client instance.
+        userdata: The private user data as set in the MQTT client constructor.
+        flags: Response flags sent by the broker.
+        reason_code: The disconnection reason.
+        properties: The MQTT properties returned by the broker.
+
+    Returns:
+        None
+    """
+    if isinstance(userdata, Broker):
+        userdata.connected = False
+        userdata.disconnects += 1
 
 
 def on_message(client, userdata, msg):
     """
     Callback function that is called when a message is received.
 
+    Repeated messages are dropped before any decoding, and the notification is
+    handed to the dispatcher so that the MQTT network loop is never blocked by
+    a request to ntfy.
+
     Args:
         client: The MQTT client instance that received the message.
         userdata: The private user data as set in the MQTT client constructor.
@@ -48,38 +186,557 @@ def on_message(client, userdata, msg):
     Raises:
         None
     """
-    topic_config = get_configuration(msg.topic)
-    if topic_config:
-        logging.debug(f"found configuration for {msg.topic}")
-        send_notification(msg, topic_config)
+    device = None
+    if isinstance(userdata, Broker):
+        userdata.messages += 1
+        device = userdata.name
+    if metrics is not None:
+        metrics.received.inc()
+    if deduplicator is not None and deduplicator.seen(msg.topic, msg.payload, device):
+        logging.debug("dropping duplicate message for %s", msg.topic)
+        if metrics is not None:
+            metrics.dropped["duplicate"].inc()
+        return
+    if metrics is None:
+        routes = get_routes(msg.topic, device)
+    else:
+        started = time.perf_counter()
+        routes = get_routes(msg.topic, device)
+        metrics.observe("route", started)
+        (metrics.routed if routes else metrics.unrouted).inc()
+    if routes:
+        logging.debug("found configuration for %s", msg.topic)
+        for route in routes:
+            submit(
+                send_notification,
+                msg,
+                route.config,
+                route.request,
+                route.targets,
+                priority=route.priority,
+                topic=route.config.mqtt_topic,
+            )
     else:
-        logging.warn(f"no configuration found for topic {msg.topic}")
+        logging.warning("no configuration found for topic %s", msg.topic)
 
 
-def send_notification(msg, config: TopicConfig) -> None:
+def send_notification(
+    msg,
+    config: TopicConfig,
+    request: NtfyRequest = None,
+    targets: Tuple[NtfyRequest, ...] = None,
+) -> None:
     """
     Sends a notification to the ntfy service.
 
+    The payload is decoded once for every target. The further targets are
+    handed to the dispatcher so they are sent alongside the main target, and
+    each target is retried on its own, so a slow or failing target neither
+    delays nor repeats the others.
+
     Args:
         msg: The message to be sent as a notification.
         config: The configuration for the ntfy service.
+        request: The request compiled from the configuration, compiled on demand when not given.
+        targets: The requests of the further targets, compiled on demand when not given.
+
+    Returns:
+        None
+    """
+    if request is None:
+        request = compile_request(config, get_server(config))
+    if targets is None:
+        targets = compile_route(
+            config, module_configuration.server if module_configuration else None
+        ).targets
+    requests = (request, *targets)
+    if metrics is None:
+        notifications = render_notifications(msg.payload, config, requests)
+    else:
+        metrics.stages["queue"].observe(time.monotonic() - msg.timestamp)
+        started = time.perf_counter()
+        notifications = render_notifications(msg.payload, config, requests)
+        metrics.observe("decode", started)
+    if not any(notifications):
+        logging.warning("dropping malformed payload for %s", msg.topic)
+        if metrics is not None:
+            metrics.dropped["malformed"].inc()
+        return
+    if config.coalesce and coalescer:
+        for notification in notifications:
+            if notification is not None:
+                rendered, body = notification
+                coalescer.add(rendered, config.coalesce, body)
+        return
+    first, *others = (n for n in notifications if n is not None)
+    for notification in others:
+        resubmit(post_notification, *notification)
+    post_notification(*first)
+
+
+def render_notifications(
+    payload: bytes, config: TopicConfig, requests: Tuple[NtfyRequest, ...]
+) -> List[Optional[Tuple[NtfyRequest, str]]]:
+    """
+    Builds the notification sent with each request from a payload, decoding
+    the payload once. Requests without templates send the payload field as
+    it is, while the templates of the others are rendered from the decoded
+    payload. When attachments are configured, the capture file named in the
+    payload is attached to every notification.
+
+    Args:
+        payload (bytes): The MQTT payload.
+        config (TopicConfig): The topic configuration.
+        requests (Tuple[NtfyRequest, ...]): The compiled requests of the targets.
+
+    Returns:
+        List[Optional[Tuple[NtfyRequest, str]]]: The request and message of each target, None where the payload can't be used.
+    """
+    path = get_field(config)
+    if attachments is None and all(request.template is None for request in requests):
+        message = extractor.extract(payload, path)
+        return [None if message is None else (r, message) for r in requests]
+    document = extractor.decode(payload)
+    if document is None:
+        return [None] * len(requests)
+    message = None
+    if any(r.template is None or r.template.message is None for r in requests):
+        message = extractor.select(document, path)
+    capture = attachments.locate(document) if attachments is not None else None
+    notifications = []
+    for request in requests:
+        rendered, body = render_request(request, document, message)
+        if capture is not None:
+            rendered = dataclasses.replace(rendered, attachment=capture)
+        notifications.append(None if body is None else (rendered, body))
+    return notifications
+
+
+def post_notification(request: NtfyRequest, message: str, attempt: int = 1) -> None:
+    """
+    Posts a notification message to ntfy using a compiled request. When rate
+    limiting is configured the notification is held back until the topic and
+    server limits allow it to be sent.
+
+    Args:
+        request (NtfyRequest): The compiled request.
+        message (str): The notification message.
+        attempt (int): The number of this attempt. Defaults to 1.
+
+    Returns:
+        None
+    """
+    if rate_limiter is not None:
+        delay = rate_limiter.reserve(request)
+        if delay is None:
+            logging.warning("rate limit backlog full for %s", request.url)
+            __give_up(request, message, Outcome(Result.RATE_LIMITED), attempt)
+            return
+        if delay and scheduler is not None and scheduler.running:
+            scheduler.call_later(
+                delay, resubmit, attempt_notification, request, message, attempt
+            )
+            return
+    attempt_notification(request, message, attempt)
+
+
+def attempt_notification(request: NtfyRequest, message: str, attempt: int) -> None:
+    """
+    Makes one attempt to post a notification message to ntfy. Notifications
+    with an attachment are handed to the upload threads, in async mode the
+    attempt is handed to the event loop, and otherwise it is sent right away.
+
+    Args:
+        request (NtfyRequest): The compiled request.
+        message (str): The notification message.
+        attempt (int): The number of this attempt.
+
+    Returns:
+        None
+    """
+    if request.attachment is not None and attachments is not None:
+        attachments.submit(
+            lambda: handle_outcome(request, message, attempt, deliver(request, message))
+        )
+        return
+    if engine is not None and engine.running:
+        engine.attempt(request, message, attempt)
+        return
+    handle_outcome(request, message, attempt, deliver(request, message))
+
+
+def handle_outcome(
+    request: NtfyRequest, message: str, attempt: int, outcome: Outcome
+) -> None:
+    """
+    Acts on the outcome of an attempt to post a notification. Failed attempts
+    are scheduled to be sent again with backoff, and notifications that still
+    can't be sent are stored in the outbox.
+
+    Args:
+        request (NtfyRequest): The compiled request.
+        message (str): The notification message.
+        attempt (int): The number of the attempt.
+        outcome (Outcome): The outcome of the attempt.
+
+    Returns:
+        None
+    """
+    if rate_limiter is not None:
+        if outcome.result is Result.RATE_LIMITED:
+            rate_limiter.throttle(request, outcome.retry_after)
+        elif outcome.result is Result.SENT:
+            rate_limiter.recover(request)
+    if outcome.result is Result.SENT:
+        if outbox is not None and outbox.pending():
+            start_replay()
+    elif (
+        scheduler is not None
+        and scheduler.running
+        and retry_policy.should_retry(outcome, attempt)
+    ):
+        delay = retry_policy.delay(attempt, outcome.retry_after)
+        logging.info(
+            "retrying notification in %.1fs after %s", delay, outcome.result.value
+        )
+        scheduler.call_later(
+            delay, resubmit, post_notification, request, message, attempt + 1
+        )
+    elif outcome.retryable:
+        __give_up(request, message, outcome, attempt)
+
+
+def __give_up(
+    request: NtfyRequest, message: str, outcome: Outcome, attempt: int
+) -> None:
+    """
+    Stores a notification that could not be sent in the outbox, or drops it
+    when there is no outbox.
+
+    Args:
+        request (NtfyRequest): The compiled request.
+        message (str): The notification message.
+        outcome (Outcome): The outcome of the last attempt.
+        attempt (int): The number of attempts made.
+
+    Returns:
+        None
+    """
+    if outbox is not None:
+        outbox.add(request, message)
+    else:
+        if metrics is not None:
+            metrics.dropped["gave_up"].inc()
+        logging.error(
+            "notification dropped after %s attempts, %s",
+            attempt,
+            outcome.result.value,
+        )
+
+
+def deliver(request: NtfyRequest, message: str) -> Outcome:
+    """
+    Sends a notification message to ntfy once, unless the circuit breaker of
+    the server is open. A notification that fails for any reason other than
+    the request to ntfy is rejected, so the breaker always learns the outcome.
+
+    Args:
+        request (NtfyRequest): The compiled request.
+        message (str): The notification message.
+
+    Returns:
+        Outcome: The classified outcome of the attempt.
+    """
+    breaker = breakers.get(request.server)
+    if not breaker.allow():
+        logging.debug("circuit open for %s, not sending notification", request.server)
+        if metrics is not None:
+            metrics.fail(Result.CIRCUIT_OPEN)
+        return Outcome(Result.CIRCUIT_OPEN)
+    logging.debug("sending notification to ntfy %s", message)
+    started = time.perf_counter()
+    try:
+        if request.attachment is not None and attachments is not None:
+            response = __upload(request, message)
+        else:
+            response = sessions.post(
+                request.server,
+                request.url,
+                data=message,
+                headers=request.headers,
+            )
+    except requests.RequestException as error:
+        outcome = classify_error(error)
+        logging.warning("failed to send notification to ntfy: %s", error)
+    except Exception:
+        outcome = Outcome(Result.REJECTED)
+        logging.exception("not sending notification to ntfy")
+    else:
+        outcome = classify_response(response)
+        if outcome.result is Result.SENT:
+            logging.info("notification sent to ntfy")
+        elif outcome.result is Result.REJECTED:
+            logging.error("ntfy rejected notification, status %s", outcome.status)
+        else:
+            logging.warning("ntfy unavailable, status %s", outcome.status)
+    breaker.record(outcome)
+    if metrics is not None:
+        metrics.record(outcome.result, started)
+    return outcome
+
+
+def __upload(request: NtfyRequest, message: str):
+    """
+    Puts a capture file to ntfy as the attachment of a notification, reading
+    the file in chunks as it is sent. A capture that can't be attached is
+    left out and the message is posted on its own.
+
+    Args:
+        request (NtfyRequest): The compiled request with the path of the capture.
+        message (str): The notification message.
+
+    Returns:
+        requests.Response: The response from the server.
+    """
+    with attachments.open(request.attachment) as upload:
+        if upload is None:
+            return sessions.post(
+                request.server, request.url, data=message, headers=request.headers
+            )
+        return sessions.put(
+            request.server,
+            request.url,
+            data=upload.file,
+            headers={**request.headers, **upload.headers(message)},
+        )
+
+
+def replay_outbox() -> None:
+    """
+    Sends the notifications stored in the outbox, unless a replay is already running.
+
+    Returns:
+        None
+    """
+    if outbox is None or not replay_lock.acquire(blocking=False):
+        return
+    try:
+        outbox.replay(
+            __replay_notification,
+            outbox_configuration.replay_batch,
+            outbox_configuration.replay_concurrency,
+        )
+    finally:
+        replay_lock.release()
+
+
+def start_replay() -> None:
+    """
+    Starts a replay of the outbox on its own thread, unless a replay is
+    already running, so that neither the workers nor the event loop wait on it.
 
     Returns:
         None
     """
-    joiner = ","
-    message = json.loads(str(msg.payload.decode("utf-8", "ignore")))["notification"]
-    logging.debug(f"sending notification to ntfy {message}")
-    requests.post(
-        f"https://ntfy.sh/{config.ntfy.topic}",
-        data=message,
-        headers={
-            "Title": f"{config.ntfy.options.title}",
-            "Priority": f"{config.ntfy.options.priority}",
-            "Tags": f"{joiner.join(config.ntfy.options.tags)}",
-        },
+    if outbox is None or replay_lock.locked():
+        return
+    threading.Thread(target=replay_outbox, name="nsp-ntfy-replay", daemon=True).start()
+
+
+def __replay_notification(request: NtfyRequest, message: str) -> bool:
+    """
+    Sends a notification from the outbox. Replay runs on its own threads, so
+    waiting for the rate limiter here doesn't hold up new notifications.
+
+    Args:
+        request (NtfyRequest): The compiled request.
+        message (str): The notification message.
+
+    Returns:
+        bool: True once the notification no longer needs sending.
+    """
+    if rate_limiter is not None:
+        delay = rate_limiter.reserve(request)
+        if delay is None:
+            return False
+        time.sleep(delay)
+    return not deliver(request, message).retryable
+
+
+def __schedule_replay() -> None:
+    """
+    Periodically starts a replay of the outbox while the application runs.
+
+    Returns:
+        None
+    """
+    if outbox.pending():
+        start_replay()
+    scheduler.call_later(outbox_configuration.replay_interval, __schedule_replay)
+
+
+def submit(job, *args, priority: int = DEFAULT_PRIORITY, topic: str = None) -> None:
+    """
+    Hands a job to the dispatcher, or runs it immediately when the dispatcher isn't running.
+
+    Args:
+        job: The function to run.
+        *args: The arguments to pass to the function.
+        priority (int): The priority of the job, higher is sent first. Defaults to 3.
+        topic (str): The MQTT topic filter of the configuration the job is for, used to count shed jobs.
+
+    Returns:
+        None
+    """
+    if dispatcher and dispatcher.running:
+        dispatcher.submit(job, *args, priority=priority, topic=topic)
+    else:
+        job(*args)
+
+
+def resubmit(job, request: NtfyRequest, *args) -> None:
+    """
+    Hands a job for a notification back to the dispatcher, with the priority
+    and topic of its request, or runs it immediately when the dispatcher
+    isn't running. Retries, deferred notifications, digests and further
+    targets are never shed by the overflow policy and never wait for room.
+
+    Args:
+        job: The function to run.
+        request (NtfyRequest): The compiled request, the first argument of the job.
+        *args: The further arguments to pass to the function.
+
+    Returns:
+        None
+    """
+    if dispatcher and dispatcher.running:
+        dispatcher.resubmit(
+            job, request, *args, priority=request.priority, topic=request.topic
+        )
+    else:
+        job(request, *args)
+
+
+def count_shed(topic: str) -> None:
+    """
+    Counts a job shed by the dispatcher because its queue was full.
+
+    Args:
+        topic (str): The MQTT topic filter of the configuration the job was for.
+
+    Returns:
+        None
+    """
+    if metrics is not None:
+        metrics.dropped["queue_full"].inc()
+
+
+def get_server(config: TopicConfig) -> str:
+    """
+    Retrieves the ntfy server a topic configuration sends to.
+
+    Args:
+        config (TopicConfig): The topic configuration.
+
+    Returns:
+        str: The base URL of the ntfy server without a trailing slash.
+    """
+    return resolve_server(
+        config, module_configuration.server if module_configuration else None
     )
-    logging.info("notification sent to ntfy")
+
+
+def get_field(config: TopicConfig) -> str:
+    """
+    Retrieves the path of the payload field holding the message of a topic configuration.
+
+    Args:
+        config (TopicConfig): The topic configuration.
+
+    Returns:
+        str: The dotted path of the field.
+    """
+    if config.field:
+        return config.field
+    return module_configuration.payload.field if module_configuration else DEFAULT_FIELD
+
+
+def get_subscription(topic: str) -> str:
+    """
+    Retrieves the topic filter to subscribe with for a configured MQTT topic.
+    Workers subscribe through an MQTT v5 shared subscription, so that the
+    broker delivers each message to only one worker of the share group.
+
+    Args:
+        topic (str): The configured MQTT topic filter.
+
+    Returns:
+        str: The topic filter to subscribe with.
+    """
+    if share_group:
+        return f"$share/{share_group}/{topic}"
+    return topic
+
+
+def get_worker_file(name: str) -> str:
+    """
+    Retrieves the name of a file written by this process. Each worker writes
+    its own file, named after the worker, so workers never share a log file
+    or an outbox.
+
+    Args:
+        name (str): The configured file name.
+
+    Returns:
+        str: The file name of this process.
+    """
+    if worker_index is None or not name:
+        return name
+    root, extension = splitext(name)
+    return f"{root}-{worker_index}{extension}"
+
+
+def get_worker_port(port: int) -> int:
+    """
+    Retrieves the port this process serves on. Each worker serves on the
+    configured port plus its index, so workers never bind the same port.
+    Port 0 lets the operating system choose a free port for every worker.
+
+    Args:
+        port (int): The configured port.
+
+    Returns:
+        int: The port of this process.
+    """
+    if worker_index is None or not port:
+        return port
+    return port + worker_index
+
+
+def collect_stats() -> Dict[str, Dict]:
+    """
+    Collects the statistics of the parts of the application that are running.
+
+    Returns:
+        Dict[str, Dict]: The statistics of each part by name.
+    """
+    stats = {"payload": extractor.stats()}
+    if dispatcher is not None:
+        stats["dispatcher"] = dispatcher.stats()
+        stats["shed"] = dispatcher.shed()
+    if attachments is not None:
+        stats["attachments"] = attachments.stats()
+    if engine is not None:
+        stats["engine"] = engine.stats()
+    if rate_limiter is not None:
+        stats["rate_limit"] = rate_limiter.stats()
+    if deduplicator is not None:
+        stats["dedup"] = deduplicator.stats()
+    if outbox is not None:
+        stats["outbox"] = {"pending": outbox.pending()}
+    if brokers:
+        stats["brokers"] = {broker.name: broker.stats() for broker in brokers}
+    return stats
 
 
 def get_configuration(topic: str) -> TopicConfig:
@@ -90,13 +747,110 @@ def get_configuration(topic: str) -> TopicConfig:
         topic (str): The MQTT topic to retrieve the configuration for.
 
     Returns:
-        TopicConfig: The configuration object for the given topic, or None if no configuration is found.
+        TopicConfig: The first configuration object matching the given topic, or None if no configuration is found.
     """
-    global module_configuration
-    for configuration in module_configuration.configurations:
-        if configuration.mqtt_topic == topic:
-            return configuration
-    return None
+    routes = get_routes(topic)
+    return routes[0].config if routes else None
+
+
+def get_configurations(topic: str) -> Tuple[TopicConfig, ...]:
+    """
+    Retrieves every configuration whose MQTT topic filter matches a given MQTT topic.
+
+    Args:
+        topic (str): The MQTT topic to retrieve the configurations for.
+
+    Returns:
+        Tuple[TopicConfig, ...]: The matching configurations in the order they are configured.
+    """
+    return tuple(route.config for route in get_routes(topic))
+
+
+def get_routes(topic: str, device: str = None) -> Tuple[Route, ...]:
+    """
+    Retrieves every route, a configuration and its compiled request, matching a given MQTT topic.
+
+    Args:
+        topic (str): The MQTT topic to retrieve the routes for.
+        device (str): The name of the device the message came from. Defaults to the NSP device.
+
+    Returns:
+        Tuple[Route, ...]: The matching routes in the order they are configured.
+    """
+    if device is not None:
+        index = device_indexes.get(device)
+        if index is not None:
+            return index.match(topic)
+    return routing_index.match(topic)
+
+
+def build_routing_index(
+    configuration: NtfyModuleConfig, device: str = None
+) -> RoutingIndex:
+    """
+    Builds the routing index for the topic configurations of the module,
+    compiling the ntfy request of each topic configuration once.
+
+    Args:
+        configuration (NtfyModuleConfig): The module configuration.
+        device (str): Only includes the topic configurations applying to this device when set.
+
+    Returns:
+        RoutingIndex: The index mapping MQTT topics to routes.
+    """
+    return RoutingIndex(
+        (topic_config.mqtt_topic, compile_route(topic_config, configuration.server))
+        for topic_config in configurations_for(configuration, device)
+    )
+
+
+def build_device_indexes(
+    configuration: NtfyModuleConfig, devices: List[str]
+) -> Dict[str, RoutingIndex]:
+    """
+    Builds a routing index for each further device bridged alongside the NSP device.
+
+    Args:
+        configuration (NtfyModuleConfig): The module configuration.
+        devices (List[str]): The names of the further devices.
+
+    Returns:
+        Dict[str, RoutingIndex]: The routing index of each device by name.
+    """
+    return {device: build_routing_index(configuration, device) for device in devices}
+
+
+def build_rate_limiter(configuration: NtfyModuleConfig) -> RateLimiter:
+    """
+    Builds the rate limiter for the module, applying the rate of each topic that sets one.
+
+    Args:
+        configuration (NtfyModuleConfig): The module configuration.
+
+    Returns:
+        RateLimiter: The rate limiter.
+    """
+    limiter = RateLimiter(configuration.rate_limit)
+    configure_rates(limiter, configuration)
+    return limiter
+
+
+def configure_rates(limiter: RateLimiter, configuration: NtfyModuleConfig) -> None:
+    """
+    Applies the rate of every ntfy target that sets one to the rate limiter.
+
+    Args:
+        limiter (RateLimiter): The rate limiter.
+        configuration (NtfyModuleConfig): The module configuration.
+
+    Returns:
+        None
+    """
+    for topic_config in configuration.configurations:
+        for target in targets_of(topic_config):
+            if target.rate:
+                request = compile_request(topic_config, configuration.server, target)
+                limiter.configure_topic(request.url, target.rate, target.burst)
 
 
 def __get_module_configuration(config_path: str) -> NtfyModuleConfig:
@@ -141,12 +895,48 @@ def __get_nsp_configuration(config_path: str) -> Tuple[DeviceConfig, LoggingConf
         raise IOError(msg)
     else:
         with open(config_path) as configuration_file:
-            file_contents = configuration_file.read()
-        nsp_logging = LoggingConfig.from_dict(json.loads(file_contents)["logging"])
-        nsp_config = DeviceConfig.from_dict(json.loads(file_contents)["device"])
+            contents = json.loads(configuration_file.read())
+        nsp_logging = LoggingConfig.from_dict(contents["logging"])
+        nsp_config = DeviceConfig.from_dict(contents["device"])
         return nsp_config, nsp_logging
 
 
+def __load_configurations(
+    args,
+) -> Tuple[NtfyModuleConfig, DeviceConfig, LoggingConfig]:
+    """
+    Reads and validates the module and NSP configurations, and lowers the
+    topic configurations into their compact runtime form. When a snapshot
+    path is given, configurations stored by an earlier start are used as long
+    as neither file has changed, and freshly read ones are stored for the
+    next start.
+
+    Args:
+        args: The command line arguments.
+
+    Returns:
+        Tuple[NtfyModuleConfig, DeviceConfig, LoggingConfig]: The module, NSP device and NSP logging configurations.
+
+    Raises:
+        IOError: If a configuration file is not found.
+        ValueError: If a payload field path is invalid.
+    """
+    sources = (args.configuration, args.nsp_configuration)
+    snapshot = ConfigSnapshot(args.snapshot) if args.snapshot else None
+    if snapshot is not None:
+        configurations = snapshot.load(sources)
+        if configurations is not None:
+            return configurations
+    configuration = __get_module_configuration(args.configuration)
+    for topic_config in configuration.configurations:
+        parse_path(topic_config.field or configuration.payload.field)
+    lower_configuration(configuration)
+    nsp_config, logging_config = __get_nsp_configuration(args.nsp_configuration)
+    if snapshot is not None:
+        snapshot.save(sources, (configuration, nsp_config, logging_config))
+    return configuration, nsp_config, logging_config
+
+
 def run(args) -> None:
     """
     Runs the main function of the NSP-NTFY application.
@@ -160,20 +950,738 @@ def run(args) -> None:
 
     global module_configuration
     global nsp_configuration
+    global dispatcher
+    global sessions
+    global routing_index
+    global device_indexes
+    global brokers
+    global scheduler
+    global coalescer
+    global deduplicator
+    global outbox
+    global outbox_configuration
+    global retry_policy
+    global breakers
+    global rate_limiter
+    global metrics
+    global metrics_server
+    global extractor
+    global watcher
+    global log_listener
+    global attachments
 
-    module_configuration = __get_module_configuration(args.configuration)
-    nsp_configuration, logging_config = __get_nsp_configuration(args.nsp_configuration)
-    __configure_logging(module_configuration.logging, logging_config)
+    module_configuration, nsp_configuration, logging_config = __load_configurations(
+        args
+    )
+    if startup_profile is not None:
+        startup_profile.mark("configuration")
+    devices = __get_devices()
+    names = [nsp_configuration.name] + [device.name for device in devices]
+    routing_index = build_routing_index(module_configuration, nsp_configuration.name)
+    device_indexes = build_device_indexes(module_configuration, names[1:])
+    extractor = PayloadExtractor(module_configuration.payload.max_size)
+    if module_configuration.attachments:
+        attachments = Attachments(module_configuration.attachments)
+    if module_configuration.dedup:
+        deduplicator = DedupCache(
+            module_configuration.dedup.ttl, module_configuration.dedup.max_entries
+        )
+    module_configuration.logging.file = get_worker_file(
+        module_configuration.logging.file
+    )
+    log_listener = __configure_logging(module_configuration.logging, logging_config)
+    if startup_profile is not None:
+        startup_profile.mark("logging")
 
     if nsp_configuration.mqtt.enabled:
-        mqttc = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-        mqttc.on_connect = on_connect
-        mqttc.on_message = on_message
-        mqttc.connect(nsp_configuration.mqtt.host)
+        brokers = [__create_broker(nsp_configuration)]
+        brokers.extend(__create_broker(device, primary=False) for device in devices)
 
-        for configuration in module_configuration.configurations:
-            mqttc.subscribe(configuration.mqtt_topic)
+        sessions = SessionPool(module_configuration.http)
+        retry_policy = RetryPolicy(module_configuration.retry)
+        breakers = CircuitBreakers(module_configuration.retry)
+        if module_configuration.rate_limit:
+            rate_limiter = build_rate_limiter(module_configuration)
+        if not args.async_mode:
+            dispatcher = Dispatcher(
+                module_configuration.dispatch.workers,
+                module_configuration.dispatch.queue_size,
+                module_configuration.dispatch.overflow,
+                module_configuration.dispatch.block_timeout,
+                count_shed,
+            )
+            dispatcher.start()
+        scheduler = Scheduler()
+        scheduler.start()
+        coalescer = Coalescer(
+            scheduler, lambda request, body: resubmit(post_notification, request, body)
+        )
+        if module_configuration.outbox:
+            outbox_configuration = module_configuration.outbox
+            outbox = Outbox(
+                f"{module_configuration.logging.path}/"
+                f"{get_worker_file(outbox_configuration.file)}",
+                scheduler,
+                outbox_configuration.batch_size,
+                outbox_configuration.flush_interval,
+            )
+            __schedule_replay()
+        if threading.current_thread() is threading.main_thread() and hasattr(
+            signal, "SIGHUP"
+        ):
+            signal.signal(
+                signal.SIGHUP,
+                lambda *_: scheduler.call_later(
+                    0, reload_configuration, args.configuration
+                ),
+            )
+        if module_configuration.watch:
+            watcher = FileWatcher(
+                args.configuration,
+                scheduler,
+                module_configuration.watch.interval,
+                lambda: reload_configuration(args.configuration),
+            )
+            watcher.start()
+        if module_configuration.metrics:
+            metrics = Metrics()
+            __register_gauges(metrics)
+            metrics_server = MetricsServer(
+                metrics.registry,
+                module_configuration.metrics.host,
+                get_worker_port(module_configuration.metrics.port),
+            )
+            metrics_server.start()
+        if stats_reporter is not None:
+            __schedule_stats()
+        if startup_profile is not None:
+            startup_profile.mark("setup")
+        if message_source is not None:
+            try:
+                message_source()
+            finally:
+                __shutdown()
+        elif args.async_mode:
+            __run_async()
+        else:
+            if threading.current_thread() is threading.main_thread():
+                signal.signal(signal.SIGTERM, lambda *_: __disconnect())
+            try:
+                __connect()
+                for broker in brokers[1:]:
+                    broker.client.loop_start()
+                brokers[0].client.loop_forever()
+            finally:
+                __shutdown()
+    else:
+        logging.error("MQTT on NSP not enabled in configuration, exiting NSP-NTFY.")
 
-        mqttc.loop_forever()
+
+def __get_devices() -> List[DeviceConfig]:
+    """
+    Lists the further devices whose MQTT is enabled.
+
+    Returns:
+        List[DeviceConfig]: The configurations of the further devices.
+
+    Raises:
+        ValueError: If two devices, including the NSP device, have the same name.
+    """
+    devices = [device for device in module_configuration.devices if device.mqtt.enabled]
+    names = [nsp_configuration.name] + [device.name for device in devices]
+    if len(set(names)) != len(names):
+        raise ValueError(f"device names must be unique, found {names}")
+    return devices
+
+
+def __create_broker(device: DeviceConfig, primary: bool = True) -> Broker:
+    """
+    Creates the MQTT client for the broker of a device. Workers connect with
+    MQTT v5 to use shared subscriptions, and so do clients keeping a
+    persistent session.
+
+    Args:
+        device (DeviceConfig): The configuration of the device.
+        primary (bool): Whether the device is the NSP device. Defaults to True.
+
+    Returns:
+        Broker: The client of the device and its connection statistics.
+    """
+    client_id = get_client_id(device, primary)
+    if share_group or module_configuration.mqtt_session is not None:
+        client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2,
+            client_id=client_id,
+            protocol=mqtt.MQTTv5,
+        )
     else:
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.on_connect = on_connect
+    client.on_connect_fail = on_connect_fail
+    client.on_disconnect = on_disconnect
+    client.on_message = on_message
+    return Broker(device, client)
+
+
+def get_client_id(device: DeviceConfig, primary: bool = True) -> str:
+    """
+    Retrieves the MQTT client id of the client for a device. Clients keeping
+    a persistent session use the configured client id, followed by the
+    device name for the further devices and by the number of the worker.
+
+    Args:
+        device (DeviceConfig): The configuration of the device.
+        primary (bool): Whether the device is the NSP device. Defaults to True.
+
+    Returns:
+        str: The client id, or an empty string to let the client generate one.
+    """
+    session = module_configuration.mqtt_session
+    if session is None:
+        return ""
+    client_id = session.client_id
+    if not primary:
+        client_id = f"{client_id}-{device.name}"
+    if worker_index is not None:
+        client_id = f"{client_id}-{worker_index}"
+    return client_id
+
+
+def __connect() -> None:
+    """
+    Connects to the MQTT broker of every device. The topics are subscribed to
+    once the broker acknowledges the connection.
+
+    Returns:
+        None
+
+    Raises:
+        OSError: If the broker of the NSP device can't be reached.
+    """
+    session = module_configuration.mqtt_session
+    options = {}
+    if session is not None:
+        properties = mqtt_properties.Properties(mqtt_packettypes.PacketTypes.CONNECT)
+        properties.SessionExpiryInterval = session.expiry
+        options = {"clean_start": False, "properties": properties}
+    primary, *others = brokers
+    primary.client.connect(
+        primary.device.mqtt.host, primary.device.mqtt.port, **options
+    )
+    for broker in others:
+        __connect_further(broker, **options)
+    if startup_profile is not None:
+        startup_profile.mark("connect")
+        report = f"startup took {startup_profile.report()}"
+        logging.info(report)
+        print(report, file=sys.stderr)
+
+
+def __connect_further(broker: Broker, **options) -> None:
+    """
+    Connects to the MQTT broker of a further device. A broker that can't be
+    reached doesn't stop the application: the failure is counted in the
+    statistics of the broker and the client keeps trying to connect, from its
+    network thread or, in async mode, from the event loop.
+
+    Args:
+        broker (Broker): The broker of the device.
+        **options: The further arguments to connect with.
+
+    Returns:
+        None
+    """
+    try:
+        broker.client.connect(
+            broker.device.mqtt.host, broker.device.mqtt.port, **options
+        )
+    except OSError as error:
+        logging.error("failed to connect to MQTT broker of %s: %s", broker.name, error)
+        on_connect_fail(broker.client, broker)
+        if engine is not None and engine.running:
+            engine.reconnect_later(broker.client)
+
+
+def __disconnect() -> None:
+    """
+    Disconnects from the MQTT broker of every device, which stops the network loops.
+
+    Returns:
+        None
+    """
+    for broker in brokers:
+        broker.client.disconnect()
+
+
+def __run_async() -> None:
+    """
+    Runs the MQTT clients and sends notifications on an asyncio event loop
+    until the application is stopped.
+
+    Returns:
+        None
+    """
+    global engine
+
+    engine = aio.AsyncEngine(
+        module_configuration.http, breakers, handle_outcome, metrics
+    )
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda *_: engine.stop())
+    try:
+        engine.run([broker.client for broker in brokers], __connect)
+    finally:
+        logging.info(f"async engine statistics {engine.stats()}")
+        engine = None
+        __shutdown()
+
+
+def reload_configuration(config_path: str) -> bool:
+    """
+    Reloads the module configuration while the application runs.
+
+    The new configuration is parsed and its routing indexes built before the
+    indexes are swapped in, so that messages are always routed against either
+    the old or the new configuration. Afterwards only the topics that were
+    added or removed are subscribed or unsubscribed on the broker of each
+    device. Changes to the topic configurations, the default server and the
+    payload field apply immediately; other settings, including the devices,
+    apply on the next restart.
+
+    Args:
+        config_path (str): The path to the module configuration file.
+
+    Returns:
+        bool: True if the configuration was reloaded, False if it was invalid and the current one was kept.
+    """
+    global module_configuration
+    global routing_index
+    global device_indexes
+
+    try:
+        configuration = lower_configuration(__get_module_configuration(config_path))
+        index = build_routing_index(configuration, brokers[0].name if brokers else None)
+        indexes = build_device_indexes(
+            configuration, [broker.name for broker in brokers[1:]]
+        )
+        for topic_config in configuration.configurations:
+            parse_path(topic_config.field or configuration.payload.field)
+    except Exception as error:
+        logging.error(
+            f"failed to reload configuration, keeping the current one: {error}"
+        )
+        return False
+    changes = [
+        (
+            broker.client,
+            *diff_subscriptions(
+                subscriptions_of(module_configuration, broker.name),
+                subscriptions_of(configuration, broker.name),
+            ),
+        )
+        for broker in brokers
+    ]
+    if rate_limiter is not None:
+        configure_rates(rate_limiter, configuration)
+    module_configuration = configuration
+    routing_index = index
+    device_indexes = indexes
+    for client, added, removed in changes:
+        if added or removed:
+            if engine is not None and engine.running:
+                engine.call(__resubscribe, client, added, removed)
+            else:
+                __resubscribe(client, added, removed)
+    added_count = sum(len(added) for _, added, _ in changes)
+    removed_count = sum(len(removed) for _, _, removed in changes)
+    logging.info(
+        f"configuration reloaded, {added_count} topics added and {removed_count} removed"
+    )
+    return True
+
+
+def __resubscribe(mqttc: mqtt.Client, added: list, removed: list) -> None:
+    """
+    Subscribes to added topics and unsubscribes from removed ones.
+
+    Args:
+        mqttc (mqtt.Client): The MQTT client.
+        added (list): The topics to subscribe to with their quality of service.
+        removed (list): The topics to unsubscribe from.
+
+    Returns:
+        None
+    """
+    if added:
+        mqttc.subscribe([(get_subscription(topic), qos) for topic, qos in added])
+    if removed:
+        mqttc.unsubscribe([get_subscription(topic) for topic in removed])
+
+
+def __schedule_stats() -> None:
+    """
+    Periodically reports the statistics of a worker to its supervisor.
+
+    Returns:
+        None
+    """
+    stats_reporter(collect_stats())
+    scheduler.call_later(STATS_INTERVAL, __schedule_stats)
+
+
+def __register_gauges(metrics: Metrics) -> None:
+    """
+    Registers the gauges reporting the backlog of the application, which are
+    read only when the metrics are collected.
+
+    Args:
+        metrics (Metrics): The metrics of the application.
+
+    Returns:
+        None
+    """
+
+    def queue_depth() -> int:
+        if engine is not None:
+            return engine.stats()["pending"] - engine.stats()["in_flight"]
+        return dispatcher.stats()["queue_depth"] if dispatcher is not None else 0
+
+    def in_flight() -> int:
+        if engine is not None:
+            return engine.stats()["in_flight"]
+        return dispatcher.stats()["workers_busy"] if dispatcher is not None else 0
+
+    metrics.registry.gauge(
+        "nsp_ntfy_queue_depth", "Notifications waiting to be sent.", queue_depth
+    )
+    metrics.registry.gauge("nsp_ntfy_in_flight", "Notifications being sent.", in_flight)
+    metrics.registry.gauge(
+        "nsp_ntfy_scheduled", "Delayed and retried notifications.", scheduler.pending
+    )
+    if outbox is not None:
+        metrics.registry.gauge(
+            "nsp_ntfy_outbox_pending",
+            "Notifications stored in the outbox.",
+            outbox.pending,
+        )
+    for broker in brokers:
+        metrics.registry.gauge(
+            "nsp_ntfy_broker_connected",
+            "Whether the MQTT client of a device is connected.",
+            lambda broker=broker: int(broker.connected),
+            device=broker.name,
+        )
+
+
+def __shutdown() -> None:
+    """
+    Sends or stores the notifications still waiting and releases the
+    resources of the application.
+
+    Returns:
+        None
+    """
+    if watcher is not None:
+        watcher.stop()
+    for broker in brokers[1:]:
+        broker.client.disconnect()
+        broker.client.loop_stop()
+    scheduler.stop(run_pending=True)
+    if dispatcher is not None:
+        dispatcher.stop(drain=True)
+    coalescer.flush()
+    if attachments is not None:
+        attachments.stop()
+        logging.info(f"attachment statistics {attachments.stats()}")
+    if outbox is not None:
+        outbox.close()
+    sessions.close()
+    if metrics_server is not None:
+        metrics_server.stop()
+    if dispatcher is not None:
+        logging.info(f"dispatcher statistics {dispatcher.stats()}")
+        if dispatcher.shed():
+            logging.info(f"messages shed per topic {dispatcher.shed()}")
+    if rate_limiter is not None:
+        logging.info(f"rate limit statistics {rate_limiter.stats()}")
+    if deduplicator is not None:
+        logging.info(f"deduplication statistics {deduplicator.stats()}")
+    logging.info(f"payload statistics {extractor.stats()}")
+    for broker in brokers:
+        logging.info(f"broker statistics of {broker.name} {broker.stats()}")
+    if stats_reporter is not None:
+        stats_reporter(collect_stats())
+    log_listener.stop()
+
+
+def run_worker(index: int, reports, args, group: str) -> None:
+    """
+    Runs the application as one of the workers of a supervisor, subscribing
+    through the shared subscriptions of a share group and reporting its
+    statistics to the supervisor.
+
+    Args:
+        index (int): The number of the worker.
+        reports: The queue on which statistics are reported to the supervisor.
+        args: The command line arguments.
+        group (str): The name of the share group.
+
+    Returns:
+        None
+    """
+    global worker_index
+    global share_group
+    global stats_reporter
+
+    worker_index = index
+    share_group = group
+    stats_reporter = lambda stats: reports.put((index, stats))
+    run(args)
+
+
+def run_workers(args) -> None:
+    """
+    Runs the application as a supervisor of several worker processes, which
+    share the messages of the configured topics through MQTT v5 shared
+    subscriptions. Workers that exit are restarted until the supervisor is
+    stopped with SIGTERM or SIGINT, and SIGHUP is passed on to every worker.
+
+    Args:
+        args: The command line arguments.
+
+    Returns:
+        None
+    """
+    configuration = __get_module_configuration(args.configuration)
+    nsp_config, logging_config = __get_nsp_configuration(args.nsp_configuration)
+    listener = __configure_logging(configuration.logging, logging_config)
+
+    if not nsp_config.mqtt.enabled:
         logging.error("MQTT on NSP not enabled in configuration, exiting NSP-NTFY.")
+        listener.stop()
+        return
+    supervisor = Supervisor(run_worker, args.workers, (args, args.share_group))
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda *_: supervisor.stop())
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(
+                signal.SIGHUP, lambda signum, _: supervisor.signal_workers(signum)
+            )
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.stop()
+
+
+def run_record(args) -> None:
+    """
+    Records the messages of the configured topics, from the broker of every
+    device, to a file until stopped with SIGTERM or SIGINT, or until the
+    given number of seconds has passed.
+
+    Args:
+        args: The command line arguments.
+
+    Returns:
+        None
+    """
+    global module_configuration
+    global nsp_configuration
+    global brokers
+
+    module_configuration, nsp_configuration, logging_config = __load_configurations(
+        args
+    )
+    devices = __get_devices()
+    listener = __configure_logging(module_configuration.logging, logging_config)
+    if not nsp_configuration.mqtt.enabled:
+        logging.error("MQTT on NSP not enabled in configuration, exiting NSP-NTFY.")
+        listener.stop()
+        return
+    recorder = Recorder(args.output)
+    brokers = [
+        Broker(device, mqtt.Client(mqtt.CallbackAPIVersion.VERSION2))
+        for device in [nsp_configuration] + devices
+    ]
+    for broker in brokers:
+        broker.client.on_connect = on_connect
+        broker.client.on_connect_fail = on_connect_fail
+        broker.client.on_disconnect = on_disconnect
+        broker.client.on_message = recorder.on_message
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda *_: __disconnect())
+    timer = None
+    if args.duration:
+        timer = threading.Timer(args.duration, __disconnect)
+        timer.daemon = True
+    try:
+        primary = brokers[0]
+        primary.client.connect(primary.device.mqtt.host, primary.device.mqtt.port)
+        for broker in brokers[1:]:
+            __connect_further(broker)
+        for broker in brokers[1:]:
+            broker.client.loop_start()
+        if timer is not None:
+            timer.start()
+        brokers[0].client.loop_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if timer is not None:
+            timer.cancel()
+        for broker in brokers[1:]:
+            broker.client.disconnect()
+            broker.client.loop_stop()
+        recorder.close()
+        logging.info(f"recorded {recorder.recorded} messages to {args.output}")
+        listener.stop()
+
+
+def run_replay(args) -> None:
+    """
+    Replays a recording at a multiple of the rate it was recorded. The
+    messages are either published to the MQTT brokers, for a running
+    NSP-NTFY to receive, or handed straight to an NSP-NTFY started in this
+    process without connecting to MQTT. The throughput and latency of the
+    replay are logged and printed to stderr.
+
+    Args:
+        args: The command line arguments.
+
+    Returns:
+        None
+
+    Raises:
+        IOError: If the recording is not found.
+        ValueError: If the speed is invalid.
+    """
+    global message_source
+
+    if not isfile(args.recording):
+        msg = "Recording not found"
+        logging.error(msg)
+        raise IOError(msg)
+    replay = Replay(parse_speed(args.speed))
+    records = read_records(args.recording)
+    if args.publish:
+        __publish_records(args, records, replay)
+        return
+    message_source = lambda: __feed_records(records, replay)
+    try:
+        run(args)
+    finally:
+        message_source = None
+
+
+def __feed_records(records, replay: Replay) -> None:
+    """
+    Hands recorded messages to on_message as if they had been received from
+    the broker of their device, then waits for the notifications to be sent.
+
+    Args:
+        records (Iterator[Record]): The recorded messages.
+        replay (Replay): The pacing and measurements of the replay.
+
+    Returns:
+        None
+    """
+    global metrics
+
+    if metrics is None:
+        metrics = Metrics()
+    by_name = {broker.name: broker for broker in brokers}
+    for record in records:
+        broker = by_name.get(record.device, brokers[0])
+        msg = mqtt.MQTTMessage(topic=record.topic.encode("utf-8"))
+        msg.payload = record.payload
+        msg.qos = record.qos
+        msg.retain = record.retain
+        replay.wait(record)
+        msg.timestamp = time.monotonic()
+        started = time.perf_counter()
+        on_message(broker.client, broker, msg)
+        replay.observe(started)
+    if dispatcher is not None:
+        dispatcher.stop(drain=True)
+    replay.finish()
+    __report_replay(replay)
+
+
+def __publish_records(args, records, replay: Replay) -> None:
+    """
+    Publishes recorded messages to the broker of their device, or to the
+    given broker. Messages are never published as retained, so replaying
+    doesn't change what the broker holds.
+
+    Args:
+        args: The command line arguments.
+        records (Iterator[Record]): The recorded messages.
+        replay (Replay): The pacing and measurements of the replay.
+
+    Returns:
+        None
+    """
+    global module_configuration
+    global nsp_configuration
+
+    module_configuration, nsp_configuration, logging_config = __load_configurations(
+        args
+    )
+    listener = __configure_logging(module_configuration.logging, logging_config)
+    addresses = {
+        device.name: (device.mqtt.host, device.mqtt.port)
+        for device in [nsp_configuration] + __get_devices()
+    }
+    if args.host:
+        addresses = {nsp_configuration.name: (args.host, args.port)}
+    clients = {}
+    for name, (host, port) in addresses.items():
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        client.connect(host, port)
+        client.loop_start()
+        clients[name] = client
+    primary = clients[nsp_configuration.name]
+    try:
+        for record in records:
+            client = clients.get(record.device, primary)
+            replay.wait(record)
+            started = time.perf_counter()
+            client.publish(record.topic, record.payload, record.qos)
+            replay.observe(started)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for client in clients.values():
+            client.disconnect()
+            client.loop_stop()
+        replay.finish()
+        __report_replay(replay)
+        listener.stop()
+
+
+def __report_replay(replay: Replay) -> None:
+    """
+    Logs and prints the statistics of a replay, with the latency of each
+    stage of handling the messages when they were handed to on_message.
+
+    Args:
+        replay (Replay): The finished replay.
+
+    Returns:
+        None
+    """
+    stats = replay.stats()
+    if dispatcher is not None:
+        stats["dropped"] = dispatcher.stats()["dropped"]
+    if metrics is not None:
+        stats["sent"] = metrics.sent.value
+        stats["failed"] = sum(counter.value for counter in metrics.failed.values())
+        for stage, histogram in metrics.stages.items():
+            count = sum(histogram.counts)
+            if count:
+                stats[f"{stage}_mean_ms"] = round(histogram.sum / count * 1000, 3)
+    report = f"replay statistics {stats}"
+    logging.info(report)
+    print(report, file=sys.stderr)
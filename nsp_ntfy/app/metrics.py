@@ -0,0 +1,419 @@
+import bisect
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+from .retry import Result
+from .startup import lazy_import
+
+http_server = lazy_import("http.server")
+
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+STAGES = ("route", "queue", "decode", "send")
+DROP_REASONS = ("duplicate", "malformed", "queue_full", "gave_up")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Dict[str, str], **extra: str) -> str:
+    pairs = {**labels, **extra}
+    if not pairs:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs.items())
+        + "}"
+    )
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A value that only goes up, such as the number of messages received.
+
+    Attributes:
+        name (str): The metric name.
+        labels (Dict[str, str]): The labels of the series.
+    """
+
+    __slots__ = ("name", "labels", "value", "_lock")
+
+    def __init__(self, name: str, labels: Dict[str, str]) -> None:
+        self.name = name
+        self.labels = labels
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        """
+        Increases the counter.
+
+        Args:
+            amount (int): The amount to add. Defaults to 1.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.value += amount
+
+    def samples(self) -> Iterator[str]:
+        yield f"{self.name}{_labels(self.labels)} {_number(self.value)}"
+
+
+class Gauge:
+    """
+    A value read from a function when the metrics are collected, such as the
+    depth of a queue, so that keeping it current costs nothing.
+
+    Attributes:
+        name (str): The metric name.
+        labels (Dict[str, str]): The labels of the series.
+        function (Callable[[], float]): Returns the current value.
+    """
+
+    __slots__ = ("name", "labels", "function")
+
+    def __init__(
+        self, name: str, labels: Dict[str, str], function: Callable[[], float]
+    ) -> None:
+        self.name = name
+        self.labels = labels
+        self.function = function
+
+    def samples(self) -> Iterator[str]:
+        try:
+            value = self.function()
+        except Exception:
+            logging.exception(f"failed to collect {self.name}")
+            return
+        yield f"{self.name}{_labels(self.labels)} {_number(value)}"
+
+
+class Histogram:
+    """
+    Counts observations, such as latencies, into fixed buckets.
+
+    Attributes:
+        name (str): The metric name.
+        labels (Dict[str, str]): The labels of the series.
+        buckets (Tuple[float, ...]): The upper bounds of the buckets, in ascending order.
+    """
+
+    __slots__ = ("name", "labels", "buckets", "counts", "sum", "_lock")
+
+    def __init__(
+        self, name: str, labels: Dict[str, str], buckets: Sequence[float]
+    ) -> None:
+        self.name = name
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """
+        Records an observation.
+
+        Args:
+            value (float): The observed value.
+
+        Returns:
+            None
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            yield f"{self.name}_bucket{_labels(self.labels, le=_number(bound))} {cumulative}"
+        yield f"{self.name}_sum{_labels(self.labels)} {_number(total)}"
+        yield f"{self.name}_count{_labels(self.labels)} {cumulative}"
+
+
+class Registry:
+    """
+    Holds metrics and renders them in the Prometheus text format.
+    """
+
+    def __init__(self) -> None:
+        self._families: Dict[str, Tuple[str, str, List]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, description: str, **labels: str) -> Counter:
+        """
+        Registers a counter series.
+
+        Args:
+            name (str): The metric name.
+            description (str): The help text of the metric.
+            **labels: The labels of the series.
+
+        Returns:
+            Counter: The counter.
+        """
+        return self._register(name, "counter", description, Counter(name, labels))
+
+    def gauge(
+        self, name: str, description: str, function: Callable[[], float], **labels: str
+    ) -> Gauge:
+        """
+        Registers a gauge series read from a function.
+
+        Args:
+            name (str): The metric name.
+            description (str): The help text of the metric.
+            function (Callable[[], float]): Returns the current value.
+            **labels: The labels of the series.
+
+        Returns:
+            Gauge: The gauge.
+        """
+        return self._register(name, "gauge", description, Gauge(name, labels, function))
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        **labels: str,
+    ) -> Histogram:
+        """
+        Registers a histogram series.
+
+        Args:
+            name (str): The metric name.
+            description (str): The help text of the metric.
+            buckets (Sequence[float]): The upper bounds of the buckets. Defaults to latency buckets in seconds.
+            **labels: The labels of the series.
+
+        Returns:
+            Histogram: The histogram.
+        """
+        return self._register(
+            name, "histogram", description, Histogram(name, labels, buckets)
+        )
+
+    def render(self) -> str:
+        """
+        Renders every metric in the Prometheus text format.
+
+        Returns:
+            str: The metrics.
+        """
+        with self._lock:
+            families = [
+                (name, kind, description, list(series))
+                for name, (kind, description, series) in self._families.items()
+            ]
+        lines = []
+        for name, kind, description, series in families:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in series:
+                lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, name: str, kind: str, description: str, metric):
+        with self._lock:
+            family = self._families.setdefault(name, (kind, description, []))
+            if family[0] != kind:
+                raise ValueError(
+                    f"metric {name} is already registered as a {family[0]}"
+                )
+            family[2].append(metric)
+        return metric
+
+
+class Metrics:
+    """
+    The metrics of the application: a latency histogram per stage of handling
+    a message, and counters for what happened to each message.
+
+    The stages are route (finding the configurations of a topic), queue (waiting
+    for a worker), decode (parsing the payload) and send (the request to ntfy).
+
+    Attributes:
+        registry (Registry): The registry the metrics are held in.
+    """
+
+    def __init__(self, registry: Registry = None) -> None:
+        self.registry = registry if registry is not None else Registry()
+        self.received = self.registry.counter(
+            "nsp_ntfy_messages_received_total", "MQTT messages received."
+        )
+        self.routed = self.registry.counter(
+            "nsp_ntfy_messages_routed_total",
+            "MQTT messages matching at least one configuration.",
+        )
+        self.unrouted = self.registry.counter(
+            "nsp_ntfy_messages_unrouted_total",
+            "MQTT messages matching no configuration.",
+        )
+        self.sent = self.registry.counter(
+            "nsp_ntfy_notifications_sent_total", "Notifications accepted by ntfy."
+        )
+        self.failed = {
+            result.value: self.registry.counter(
+                "nsp_ntfy_notifications_failed_total",
+                "Attempts to send a notification that failed.",
+                result=result.value,
+            )
+            for result in Result
+            if result is not Result.SENT
+        }
+        self.dropped = {
+            reason: self.registry.counter(
+                "nsp_ntfy_notifications_dropped_total",
+                "Messages and notifications that were dropped.",
+                reason=reason,
+            )
+            for reason in DROP_REASONS
+        }
+        self.stages = {
+            stage: self.registry.histogram(
+                "nsp_ntfy_stage_duration_seconds",
+                "The time spent in each stage of handling a message.",
+                stage=stage,
+            )
+            for stage in STAGES
+        }
+
+    def observe(self, stage: str, started: float) -> None:
+        """
+        Records the time spent in a stage.
+
+        Args:
+            stage (str): The stage.
+            started (float): The time.perf_counter() value when the stage started.
+
+        Returns:
+            None
+        """
+        self.stages[stage].observe(time.perf_counter() - started)
+
+    def record(self, result: Result, started: float) -> None:
+        """
+        Records the duration and result of an attempt to send a notification.
+
+        Args:
+            result (Result): The result of the attempt.
+            started (float): The time.perf_counter() value when the attempt started.
+
+        Returns:
+            None
+        """
+        self.observe("send", started)
+        if result is Result.SENT:
+            self.sent.inc()
+        else:
+            self.failed[result.value].inc()
+
+    def fail(self, result: Result) -> None:
+        """
+        Counts an attempt to send a notification that failed.
+
+        Args:
+            result (Result): The result of the attempt.
+
+        Returns:
+            None
+        """
+        self.failed[result.value].inc()
+
+
+class MetricsServer:
+    """
+    Serves the metrics of a registry over HTTP for Prometheus to scrape.
+
+    Attributes:
+        registry (Registry): The registry to serve.
+        host (str): The address to listen on.
+        port (int): The port to listen on.
+    """
+
+    def __init__(self, registry: Registry, host: str, port: int) -> None:
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: http_server.ThreadingHTTPServer = None
+        self._thread: threading.Thread = None
+
+    def start(self) -> None:
+        """
+        Starts serving on a background thread.
+
+        Returns:
+            None
+        """
+        registry = self.registry
+
+        class Handler(http_server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                logging.debug("metrics request " + format, *args)
+
+        self._server = http_server.ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="nsp-ntfy-metrics", daemon=True
+        )
+        self._thread.start()
+        logging.info(f"serving metrics on http://{self.host}:{self.port}/metrics")
+
+    def stop(self) -> None:
+        """
+        Stops serving.
+
+        Returns:
+            None
+        """
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
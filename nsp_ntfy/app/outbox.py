@@ -0,0 +1,245 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import Callable, List, Tuple
+
+from .request import NtfyRequest
+from .scheduler import Scheduler, Timer
+from .startup import lazy_import
+
+sqlite3 = lazy_import("sqlite3")
+futures = lazy_import("concurrent.futures")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    server TEXT NOT NULL,
+    url TEXT NOT NULL,
+    headers TEXT NOT NULL,
+    body TEXT NOT NULL
+)
+"""
+
+
+class Outbox:
+    """
+    A durable, SQLite backed store of notifications that could not be sent.
+
+    The database runs in WAL mode and notifications are written in groups, so
+    that a burst of failures costs one transaction rather than a disk sync per
+    notification. A group is committed once it holds the batch size or when the
+    flush interval elapses, whichever is first.
+
+    Attributes:
+        path (str): The path of the SQLite database.
+        batch_size (int): The number of notifications written in one transaction.
+        flush_interval (float): The seconds a notification may wait before being written.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        scheduler: Scheduler = None,
+        batch_size: int = 50,
+        flush_interval: float = 1.0,
+    ) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._scheduler = scheduler
+        self._lock = threading.Lock()
+        self._buffer: List[tuple] = []
+        self._flush_timer: Timer = None
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(SCHEMA)
+        self._stored = self._connection.execute(
+            "SELECT COUNT(*) FROM outbox"
+        ).fetchone()[0]
+        if self._stored:
+            logging.info(f"outbox contains {self._stored} unsent notifications")
+
+    def add(self, request: NtfyRequest, body: str) -> None:
+        """
+        Stores a notification to be sent later.
+
+        Args:
+            request (NtfyRequest): The compiled request of the notification.
+            body (str): The notification message.
+
+        Returns:
+            None
+        """
+        headers = json.dumps(
+            {name: value.decode("utf-8") for name, value in request.headers.items()}
+        )
+        row = (time.time(), request.server, request.url, headers, body)
+        with self._lock:
+            self._buffer.append(row)
+            if len(self._buffer) >= self.batch_size or self._scheduler is None:
+                self._write()
+            elif self._flush_timer is None:
+                self._flush_timer = self._scheduler.call_later(
+                    self.flush_interval, self.flush
+                )
+
+    def flush(self) -> None:
+        """
+        Writes every buffered notification in a single transaction.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._write()
+
+    def pending(self) -> int:
+        """
+        Counts the notifications waiting to be sent.
+
+        Returns:
+            int: The number of stored and buffered notifications.
+        """
+        with self._lock:
+            return self._stored + len(self._buffer)
+
+    def take(self, limit: int) -> List[Tuple[int, NtfyRequest, str]]:
+        """
+        Reads the oldest stored notifications without removing them.
+
+        Args:
+            limit (int): The maximum number of notifications to read.
+
+        Returns:
+            List[Tuple[int, NtfyRequest, str]]: The id, request and message of each notification.
+        """
+        with self._lock:
+            self._write()
+            rows = self._connection.execute(
+                "SELECT id, server, url, headers, body FROM outbox ORDER BY id LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            (
+                row_id,
+                NtfyRequest(
+                    server=server,
+                    url=url,
+                    headers=MappingProxyType(
+                        {
+                            name: value.encode("utf-8")
+                            for name, value in json.loads(headers).items()
+                        }
+                    ),
+                ),
+                body,
+            )
+            for row_id, server, url, headers, body in rows
+        ]
+
+    def remove(self, ids: List[int]) -> None:
+        """
+        Removes sent notifications in a single transaction.
+
+        Args:
+            ids (List[int]): The ids of the notifications to remove.
+
+        Returns:
+            None
+        """
+        if not ids:
+            return
+        with self._lock:
+            with self._transaction():
+                self._connection.executemany(
+                    "DELETE FROM outbox WHERE id = ?", [(row_id,) for row_id in ids]
+                )
+            self._stored -= len(ids)
+
+    def replay(
+        self,
+        send: Callable[[NtfyRequest, str], bool],
+        batch_size: int = 100,
+        concurrency: int = 2,
+    ) -> int:
+        """
+        Sends the stored notifications in batches, oldest first, removing the
+        ones that were sent. Replay stops after a batch in which any notification
+        could not be sent, leaving the rest for the next replay.
+
+        Args:
+            send (Callable[[NtfyRequest, str], bool]): Sends a notification, returning True once it no longer needs sending.
+            batch_size (int): The number of notifications read at a time. Defaults to 100.
+            concurrency (int): The number of notifications sent at the same time. Defaults to 2.
+
+        Returns:
+            int: The number of notifications sent.
+        """
+
+        def send_row(row: Tuple[int, NtfyRequest, str]) -> bool:
+            try:
+                return send(row[1], row[2])
+            except Exception:
+                logging.exception("failed to replay notification")
+                return False
+
+        replayed = 0
+        with futures.ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="nsp-ntfy-replay"
+        ) as executor:
+            while True:
+                batch = self.take(batch_size)
+                if not batch:
+                    break
+                results = executor.map(send_row, batch)
+                sent = [row[0] for row, result in zip(batch, results) if result]
+                self.remove(sent)
+                replayed += len(sent)
+                if len(sent) < len(batch):
+                    break
+        if replayed:
+            logging.info(f"replayed {replayed} notifications from the outbox")
+        return replayed
+
+    def close(self) -> None:
+        """
+        Writes any buffered notifications and closes the database.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._write()
+            self._connection.close()
+
+    def _write(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        with self._transaction():
+            self._connection.executemany(
+                "INSERT INTO outbox (created, server, url, headers, body) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        self._stored += len(rows)
+        logging.debug("stored %d notifications in the outbox", len(rows))
+
+    @contextmanager
+    def _transaction(self):
+        self._connection.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
@@ -0,0 +1,164 @@
+import json
+import re
+from typing import Any, Dict, Optional, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_FIELD = "notification"
+REJECT_REASONS = ("empty", "too_large", "not_object", "missing", "invalid", "not_text")
+WHITESPACE = frozenset(b" \t\r\n")
+OPEN_BRACE = ord("{")
+SURROGATE_ESCAPE = re.compile(rb"\\u[dD][89a-fA-F]")
+
+Segment = Union[str, int]
+
+
+def parse_path(path: str) -> Tuple[Segment, ...]:
+    """
+    Parses a dotted field path, such as "event.details.0.message", where
+    numeric segments index into lists.
+
+    Args:
+        path (str): The field path.
+
+    Returns:
+        Tuple[Segment, ...]: The keys and list indexes of the path.
+
+    Raises:
+        ValueError: If the path is empty or has an empty segment.
+    """
+    segments = path.split(".")
+    if not all(segments):
+        raise ValueError(f"invalid field path {path!r}")
+    return tuple(int(s) if s.isdigit() else s for s in segments)
+
+
+class PayloadExtractor:
+    """
+    Extracts the notification message from the JSON payload of MQTT messages.
+
+    The payload is read through a memoryview and never copied into a str.
+    Payloads that are empty, too large, not a JSON object or that don't
+    contain the first key of the field path are rejected before being parsed.
+    The key check looks for the key as written, so a key spelt with JSON
+    escapes is treated as missing. Payloads are parsed with orjson when it is
+    installed and the json module otherwise. Both reject text holding a lone
+    surrogate, which can't be sent as UTF-8.
+
+    Attributes:
+        max_size (int): The largest payload in bytes that is parsed.
+        extracted (int): The number of messages extracted.
+        rejected (Dict[str, int]): The number of payloads rejected for each reason.
+    """
+
+    def __init__(self, max_size: int = 262144) -> None:
+        self.max_size = max_size
+        self.extracted = 0
+        self.rejected: Dict[str, int] = dict.fromkeys(REJECT_REASONS, 0)
+        self._paths: Dict[str, Tuple[Tuple[Segment, ...], bytes]] = {}
+
+    def extract(self, payload: bytes, path: str = DEFAULT_FIELD) -> Optional[str]:
+        """
+        Extracts the value of a field from a payload.
+
+        Args:
+            payload (bytes): The MQTT payload.
+            path (str): The dotted path of the field. Defaults to "notification".
+
+        Returns:
+            Optional[str]: The value of the field, or None if the payload was rejected.
+        """
+        document = self.decode(payload, path)
+        if document is None:
+            return None
+        return self.select(document, path)
+
+    def decode(self, payload: bytes, path: Optional[str] = None) -> Optional[Any]:
+        """
+        Decodes a payload holding a JSON object.
+
+        Args:
+            payload (bytes): The MQTT payload.
+            path (Optional[str]): The dotted path of a field the payload must contain, checked before parsing. Defaults to None.
+
+        Returns:
+            Optional[Any]: The decoded object, or None if the payload was rejected.
+        """
+        view = memoryview(payload)
+        size = view.nbytes
+        if not size:
+            return self._reject("empty")
+        if size > self.max_size:
+            return self._reject("too_large")
+        for byte in view:
+            if byte not in WHITESPACE:
+                break
+        if byte != OPEN_BRACE:
+            return self._reject("not_object")
+        if path is not None:
+            _, key = self._compile(path)
+            if isinstance(payload, (bytes, bytearray)) and key not in payload:
+                return self._reject("missing")
+        try:
+            if orjson is not None:
+                return orjson.loads(view)
+            text = payload if isinstance(payload, (bytes, bytearray)) else bytes(view)
+            document = json.loads(text)
+            if SURROGATE_ESCAPE.search(text):
+                json.dumps(document, ensure_ascii=False).encode("utf-8")
+            return document
+        except ValueError:
+            return self._reject("invalid")
+
+    def select(self, document: Any, path: str = DEFAULT_FIELD) -> Optional[str]:
+        """
+        Reads the value of a field from a decoded payload.
+
+        Args:
+            document (Any): The decoded payload.
+            path (str): The dotted path of the field. Defaults to "notification".
+
+        Returns:
+            Optional[str]: The value of the field, or None if it is missing or not text.
+        """
+        segments, _ = self._compile(path)
+        value = document
+        for segment in segments:
+            try:
+                value = value[segment]
+            except (KeyError, IndexError, TypeError):
+                return self._reject("missing")
+        if isinstance(value, (dict, list)) or value is None:
+            return self._reject("not_text")
+        self.extracted += 1
+        return value if isinstance(value, str) else json.dumps(value)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Reports the extracted and rejected counts.
+
+        Returns:
+            Dict[str, int]: The extracted count and the rejected count for each reason.
+        """
+        stats = {"extracted": self.extracted}
+        stats.update(
+            (f"rejected {reason}", count) for reason, count in self.rejected.items()
+        )
+        return stats
+
+    def _compile(self, path: str) -> Tuple[Tuple[Segment, ...], bytes]:
+        compiled = self._paths.get(path)
+        if compiled is None:
+            segments = parse_path(path)
+            compiled = self._paths[path] = (
+                segments,
+                json.dumps(str(segments[0]), ensure_ascii=False).encode("utf-8"),
+            )
+        return compiled
+
+    def _reject(self, reason: str) -> None:
+        self.rejected[reason] += 1
+        return None
@@ -0,0 +1,215 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from .data.data_classes import RateLimitConfig
+from .request import NtfyRequest
+
+
+class TokenBucket:
+    """
+    A token bucket that hands out reservations rather than rejections.
+
+    Taking a token may leave the bucket in debt, in which case the next caller
+    is told to wait until the debt has been refilled. This way requests over
+    the limit are spread out in time instead of being sent and rejected.
+
+    Attributes:
+        rate (float): The tokens added per second.
+        burst (int): The maximum number of tokens held.
+        configured_rate (float): The rate the bucket recovers to after being throttled.
+    """
+
+    __slots__ = ("rate", "burst", "configured_rate", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.configured_rate = rate
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def delay(self, now: float) -> float:
+        """
+        Calculates the seconds until a token is available.
+
+        Args:
+            now (float): The current monotonic time.
+
+        Returns:
+            float: The seconds to wait, 0 if a token is available now.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        """
+        Takes a token, going into debt if there is none.
+
+        Returns:
+            None
+        """
+        self.tokens -= 1
+
+    def throttle(
+        self, factor: float, minimum: float, retry_after: Optional[float]
+    ) -> None:
+        """
+        Slows the bucket down after the server reported too many requests.
+
+        Args:
+            factor (float): The factor the rate is multiplied by.
+            minimum (float): The lowest rate the bucket is slowed to.
+            retry_after (Optional[float]): The seconds the server asked to wait.
+
+        Returns:
+            None
+        """
+        self.rate = max(self.rate * factor, minimum)
+        if retry_after:
+            self.tokens = min(self.tokens, 1 - retry_after * self.rate)
+
+    def recover(self, step: float) -> None:
+        """
+        Speeds the bucket back up towards its configured rate.
+
+        Args:
+            step (float): The fraction of the configured rate added back.
+
+        Returns:
+            None
+        """
+        if self.rate < self.configured_rate:
+            self.rate = min(
+                self.configured_rate, self.rate + self.configured_rate * step
+            )
+
+
+class RateLimiter:
+    """
+    Spaces out notifications so that ntfy's publishing limits are respected,
+    using one token bucket per ntfy topic and one per ntfy server.
+
+    The limiter adapts to the server: a 429 response multiplies the rate of the
+    topic and server by the backoff factor, and each successful notification
+    adds a step of the configured rate back.
+
+    Attributes:
+        config (RateLimitConfig): The rate limit configuration.
+    """
+
+    RECOVERY_STEP = 0.1
+
+    def __init__(self, config: RateLimitConfig) -> None:
+        self.config = config
+        self._topics: Dict[str, TokenBucket] = {}
+        self._servers: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.delayed = 0
+        self.rejected = 0
+
+    def configure_topic(self, url: str, rate: float, burst: Optional[int]) -> None:
+        """
+        Sets the rate of a ntfy topic, overriding the configured topic rate.
+
+        Args:
+            url (str): The URL of the ntfy topic.
+            rate (float): The notifications per second.
+            burst (Optional[int]): The notifications that may be sent at once.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._topics[url] = TokenBucket(rate, burst or self.config.topic_burst)
+
+    def reserve(self, request: NtfyRequest) -> Optional[float]:
+        """
+        Reserves a slot to send a notification.
+
+        Args:
+            request (NtfyRequest): The compiled request of the notification.
+
+        Returns:
+            Optional[float]: The seconds to wait before sending, or None if the
+            wait would exceed the maximum delay and the notification wasn't reserved.
+        """
+        now = time.monotonic()
+        with self._lock:
+            topic = self._topic_bucket(request)
+            server = self._server_bucket(request)
+            delay = max(topic.delay(now), server.delay(now))
+            if delay > self.config.max_delay:
+                self.rejected += 1
+                return None
+            topic.take()
+            server.take()
+            if delay:
+                self.delayed += 1
+            return delay
+
+    def throttle(self, request: NtfyRequest, retry_after: Optional[float]) -> None:
+        """
+        Slows down the topic and server of a request that was rate limited.
+
+        Args:
+            request (NtfyRequest): The compiled request that was rate limited.
+            retry_after (Optional[float]): The seconds the server asked to wait.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            for bucket in (self._topic_bucket(request), self._server_bucket(request)):
+                bucket.throttle(
+                    self.config.backoff_factor, self.config.min_rate, retry_after
+                )
+            rate = self._server_bucket(request).rate
+        logging.warning("rate limited by %s, slowing to %.2f/s", request.server, rate)
+
+    def recover(self, request: NtfyRequest) -> None:
+        """
+        Speeds up the topic and server of a request that was sent.
+
+        Args:
+            request (NtfyRequest): The compiled request that was sent.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._topic_bucket(request).recover(self.RECOVERY_STEP)
+            self._server_bucket(request).recover(self.RECOVERY_STEP)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Reports the limiter counters and the current rate of each server.
+
+        Returns:
+            Dict[str, float]: The delayed and rejected counts and server rates.
+        """
+        with self._lock:
+            stats = {"delayed": self.delayed, "rejected": self.rejected}
+            for server, bucket in self._servers.items():
+                stats[f"rate {server}"] = bucket.rate
+            return stats
+
+    def _topic_bucket(self, request: NtfyRequest) -> TokenBucket:
+        bucket = self._topics.get(request.url)
+        if bucket is None:
+            bucket = self._topics[request.url] = TokenBucket(
+                self.config.topic_rate, self.config.topic_burst
+            )
+        return bucket
+
+    def _server_bucket(self, request: NtfyRequest) -> TokenBucket:
+        bucket = self._servers.get(request.server)
+        if bucket is None:
+            bucket = self._servers[request.server] = TokenBucket(
+                self.config.server_rate, self.config.server_burst
+            )
+        return bucket
@@ -0,0 +1,301 @@
+import base64
+import json
+import logging
+import math
+import threading
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+MAX_SPEED = "max"
+
+
+class Record(NamedTuple):
+    """
+    An MQTT message captured by the recorder.
+
+    Attributes:
+        time (float): The time the message was received, in seconds since the epoch.
+        device (Optional[str]): The name of the device whose broker the message came from.
+        topic (str): The MQTT topic.
+        payload (bytes): The MQTT payload.
+        qos (int): The quality of service of the message.
+        retain (bool): Whether the message was retained by the broker.
+    """
+
+    time: float
+    device: Optional[str]
+    topic: str
+    payload: bytes
+    qos: int = 0
+    retain: bool = False
+
+
+def encode_record(record: Record) -> str:
+    """
+    Encodes a record as one compact JSON line. Payloads that are valid UTF-8
+    are stored as text and any other payload as base64, and the quality of
+    service and retain flag are only stored when they differ from the defaults.
+
+    Args:
+        record (Record): The record.
+
+    Returns:
+        str: The JSON line, ending with a newline.
+    """
+    line = {"t": round(record.time, 6), "topic": record.topic}
+    if record.device is not None:
+        line["device"] = record.device
+    try:
+        line["payload"] = record.payload.decode("utf-8")
+    except UnicodeDecodeError:
+        line["payload_b64"] = base64.b64encode(record.payload).decode("ascii")
+    if record.qos:
+        line["qos"] = record.qos
+    if record.retain:
+        line["retain"] = True
+    return json.dumps(line, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def decode_record(line: str) -> Record:
+    """
+    Decodes a JSON line written by encode_record.
+
+    Args:
+        line (str): The JSON line.
+
+    Returns:
+        Record: The record.
+
+    Raises:
+        ValueError: If the line isn't a valid record.
+    """
+    try:
+        fields = json.loads(line)
+        if "payload_b64" in fields:
+            payload = base64.b64decode(fields["payload_b64"], validate=True)
+        else:
+            payload = fields["payload"].encode("utf-8")
+        return Record(
+            float(fields["t"]),
+            fields.get("device"),
+            fields["topic"],
+            payload,
+            int(fields.get("qos", 0)),
+            bool(fields.get("retain", False)),
+        )
+    except (KeyError, TypeError, AttributeError, ValueError) as error:
+        raise ValueError(f"invalid record {line.strip()!r}: {error}") from None
+
+
+def read_records(path: str) -> Iterator[Record]:
+    """
+    Reads the records of a recording in the order they were captured. Blank
+    lines are skipped, as is a last line cut short by the recorder stopping
+    mid-write.
+
+    Args:
+        path (str): The path of the recording.
+
+    Yields:
+        Record: Each record.
+
+    Raises:
+        ValueError: If a line other than the last isn't a valid record.
+    """
+    with open(path, encoding="utf-8") as recording:
+        for number, line in enumerate(recording, 1):
+            if not line.strip():
+                continue
+            try:
+                yield decode_record(line)
+            except ValueError:
+                if not line.endswith("\n"):
+                    logging.warning(f"skipping incomplete last line {number} of {path}")
+                    return
+                raise
+
+
+class Recorder:
+    """
+    Appends the MQTT messages received by its clients to a recording, one
+    JSON line each, so a busy night can be replayed later. The file is only
+    ever appended to, so a recording can be resumed by recording to it again.
+
+    Attributes:
+        path (str): The path of the recording.
+        recorded (int): The number of messages recorded.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.recorded = 0
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record: Record) -> None:
+        """
+        Appends a record to the recording.
+
+        Args:
+            record (Record): The record.
+
+        Returns:
+            None
+        """
+        line = encode_record(record)
+        with self._lock:
+            self._file.write(line)
+            self.recorded += 1
+
+    def on_message(self, client, userdata, msg) -> None:
+        """
+        MQTT callback recording a received message, with the name of the
+        device when the user data of the client is its broker.
+
+        Args:
+            client: The MQTT client instance that received the message.
+            userdata: The private user data as set in the MQTT client constructor.
+            msg: The received message.
+
+        Returns:
+            None
+        """
+        self.write(
+            Record(
+                time.time(),
+                getattr(userdata, "name", None),
+                msg.topic,
+                msg.payload,
+                msg.qos,
+                bool(msg.retain),
+            )
+        )
+
+    def close(self) -> None:
+        """
+        Flushes and closes the recording.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._file.close()
+
+
+def parse_speed(value: str) -> float:
+    """
+    Parses a replay speed, such as "10x" for ten times real time, or "max"
+    to replay without waiting between messages.
+
+    Args:
+        value (str): The speed.
+
+    Returns:
+        float: The speed factor, or 0 for as fast as possible.
+
+    Raises:
+        ValueError: If the speed isn't a positive number.
+    """
+    text = value.strip().lower()
+    if text == MAX_SPEED:
+        return 0.0
+    try:
+        speed = float(text[:-1] if text.endswith("x") else text)
+    except ValueError:
+        raise ValueError(f"invalid speed {value!r}") from None
+    if not speed > 0 or speed == float("inf"):
+        raise ValueError(f"invalid speed {value!r}, expected a positive number")
+    return speed
+
+
+class Replay:
+    """
+    Paces the records of a recording at a multiple of the rate they were
+    captured, and measures how long handing each one over takes.
+
+    Attributes:
+        speed (float): The speed factor, or 0 for as fast as possible.
+        replayed (int): The number of records replayed.
+        max_lag (float): The furthest, in seconds, the replay fell behind the paced schedule.
+    """
+
+    def __init__(self, speed: float) -> None:
+        self.speed = speed
+        self.replayed = 0
+        self.max_lag = 0.0
+        self._durations: List[float] = []
+        self._origin: float = None
+        self._started: float = None
+        self._finished: float = None
+
+    def wait(self, record: Record) -> None:
+        """
+        Waits until a record is due, relative to the first record replayed.
+
+        Args:
+            record (Record): The record about to be replayed.
+
+        Returns:
+            None
+        """
+        now = time.perf_counter()
+        if self._origin is None:
+            self._origin = record.time
+            self._started = now
+            return
+        if not self.speed:
+            return
+        due = self._started + (record.time - self._origin) / self.speed
+        if due > now:
+            time.sleep(due - now)
+        else:
+            self.max_lag = max(self.max_lag, now - due)
+
+    def observe(self, started: float) -> None:
+        """
+        Records how long handing over a record took.
+
+        Args:
+            started (float): The time.perf_counter() value when the record was handed over.
+
+        Returns:
+            None
+        """
+        finished = time.perf_counter()
+        self._durations.append(finished - started)
+        self._finished = finished
+        self.replayed += 1
+
+    def finish(self) -> None:
+        """
+        Marks the end of the replay, such as once the handed over records
+        have been processed.
+
+        Returns:
+            None
+        """
+        self._finished = time.perf_counter()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Reports the throughput of the replay and the percentiles of the time
+        taken to hand over each record.
+
+        Returns:
+            Dict[str, float]: The record count, elapsed seconds, records per second, lag and latencies in milliseconds.
+        """
+        elapsed = self._finished - self._started if self._started is not None else 0.0
+        durations = sorted(self._durations)
+        stats = {
+            "replayed": self.replayed,
+            "elapsed": round(elapsed, 3),
+            "rate": round(self.replayed / elapsed, 1) if elapsed > 0 else 0.0,
+            "max_lag": round(self.max_lag, 3),
+        }
+        for name, quantile in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            value = (
+                durations[math.ceil(quantile * len(durations)) - 1] if durations else 0
+            )
+            stats[name] = round(value * 1000, 3)
+        stats["max_ms"] = round(durations[-1] * 1000, 3) if durations else 0.0
+        return stats
@@ -0,0 +1,118 @@
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .brokers import configurations_for
+from .data.data_classes import NtfyModuleConfig
+from .scheduler import Scheduler, Timer
+
+
+def subscriptions_of(
+    configuration: NtfyModuleConfig, device: Optional[str] = None
+) -> Dict[str, int]:
+    """
+    Lists the distinct MQTT topic filters of a module configuration with the
+    quality of service to subscribe with, the highest of any topic
+    configuration using the filter.
+
+    Args:
+        configuration (NtfyModuleConfig): The module configuration.
+        device (Optional[str]): The device to list the subscriptions of, all devices if None.
+
+    Returns:
+        Dict[str, int]: The quality of service of each topic filter in the order they are configured.
+    """
+    subscriptions: Dict[str, int] = {}
+    for topic_config in configurations_for(configuration, device):
+        topic = topic_config.mqtt_topic
+        subscriptions[topic] = max(subscriptions.get(topic, 0), topic_config.qos)
+    return subscriptions
+
+
+def diff_subscriptions(
+    old: Dict[str, int], new: Dict[str, int]
+) -> Tuple[List[Tuple[str, int]], List[str]]:
+    """
+    Compares the subscriptions of two configurations. A topic filter whose
+    quality of service changed is subscribed to again.
+
+    Args:
+        old (Dict[str, int]): The quality of service of each topic filter currently subscribed to.
+        new (Dict[str, int]): The quality of service of each topic filter of the new configuration.
+
+    Returns:
+        Tuple[List[Tuple[str, int]], List[str]]: The topic filters to subscribe to with their quality of service, and the topic filters to unsubscribe from.
+    """
+    added = [(topic, qos) for topic, qos in new.items() if old.get(topic) != qos]
+    removed = [topic for topic in old if topic not in new]
+    return added, removed
+
+
+class FileWatcher:
+    """
+    Polls a file on a scheduler and calls back when it changes.
+
+    A change is a different modification time, size or inode, so that files
+    replaced by a rename are noticed as well as files written in place. While
+    the file is missing, for example in the middle of being replaced, no
+    change is reported.
+
+    Attributes:
+        path (str): The path of the watched file.
+        interval (float): The seconds between checks.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        scheduler: Scheduler,
+        interval: float,
+        callback: Callable[[], None],
+    ) -> None:
+        self.path = path
+        self.interval = interval
+        self._scheduler = scheduler
+        self._callback = callback
+        self._signature = None
+        self._timer: Timer = None
+
+    def start(self) -> None:
+        """
+        Starts watching the file.
+
+        Returns:
+            None
+        """
+        self._signature = self._stat()
+        self._timer = self._scheduler.call_later(self.interval, self._check)
+
+    def stop(self) -> None:
+        """
+        Stops watching the file.
+
+        Returns:
+            None
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _check(self) -> None:
+        if self._timer is None:
+            return
+        try:
+            signature = self._stat()
+            if signature is not None and signature != self._signature:
+                self._signature = signature
+                logging.info(f"{self.path} changed")
+                self._callback()
+        finally:
+            if self._timer is not None:
+                self._timer = self._scheduler.call_later(self.interval, self._check)
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
@@ -0,0 +1,220 @@
+import functools
+import sys
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from .data.data_classes import Ntfy, TopicConfig
+from .dispatch import DEFAULT_PRIORITY
+from .template import NotificationTemplate
+
+DEFAULT_SERVER = "https://ntfy.sh"
+
+
+@dataclass(frozen=True, slots=True)
+class NtfyRequest:
+    """
+    An immutable, ready to send request to ntfy compiled from a topic configuration.
+    Requests whose targets have equal options share one headers mapping.
+
+    Attributes:
+        server (str): The base URL of the ntfy server without a trailing slash.
+        url (str): The URL notifications are posted to.
+        headers (Mapping[str, bytes]): The encoded headers sent with every notification.
+        template (Optional[NotificationTemplate]): The templates rendered into each notification, if any.
+        attachment (Optional[str]): The path of the capture file attached to the notification, if any.
+        priority (int): The priority the notification is dispatched with, higher is sent first.
+        topic (Optional[str]): The MQTT topic of the configuration, which shed notifications are counted against.
+    """
+
+    server: str
+    url: str
+    headers: Mapping[str, bytes]
+    template: Optional[NotificationTemplate] = field(default=None, compare=False)
+    attachment: Optional[str] = None
+    priority: int = field(default=DEFAULT_PRIORITY, compare=False)
+    topic: Optional[str] = field(default=None, compare=False)
+
+
+class Route(NamedTuple):
+    """
+    A topic configuration together with its compiled request, the compiled
+    requests of its further targets, and the priority its messages are
+    dispatched with.
+    """
+
+    config: TopicConfig
+    request: NtfyRequest
+    targets: Tuple[NtfyRequest, ...] = ()
+    priority: int = DEFAULT_PRIORITY
+
+
+def targets_of(config: TopicConfig) -> Tuple[Ntfy, ...]:
+    """
+    Lists the ntfy targets a topic configuration sends to.
+
+    Args:
+        config (TopicConfig): The topic configuration.
+
+    Returns:
+        Tuple[Ntfy, ...]: The main target followed by the further targets.
+    """
+    return (config.ntfy, *config.targets)
+
+
+def priority_of(config: TopicConfig) -> int:
+    """
+    Resolves the priority of the notifications of a topic configuration, the
+    highest of its targets, as a number from 1 to 5.
+
+    Args:
+        config (TopicConfig): The topic configuration.
+
+    Returns:
+        int: The priority, 3 for targets without one.
+    """
+    priority = 0
+    for target in targets_of(config):
+        value = target.options.priority if target.options else None
+        priority = max(priority, value or DEFAULT_PRIORITY)
+    return priority
+
+
+def resolve_server(
+    config: TopicConfig, default_server: str = None, target: Ntfy = None
+) -> str:
+    """
+    Resolves the ntfy server a topic configuration sends to.
+
+    Args:
+        config (TopicConfig): The topic configuration.
+        default_server (str): The server to use when the topic doesn't set one.
+        target (Ntfy): The target to resolve the server of. Defaults to the main target.
+
+    Returns:
+        str: The base URL of the ntfy server without a trailing slash.
+    """
+    target = target or config.ntfy
+    return (target.server or default_server or DEFAULT_SERVER).rstrip("/")
+
+
+def compile_request(
+    config: TopicConfig, default_server: str = None, target: Ntfy = None
+) -> NtfyRequest:
+    """
+    Compiles a topic configuration into the request sent for each notification.
+
+    Headers are only included for the options that are set, so a topic without
+    options relies on the defaults of the ntfy server. Templates are parsed
+    here, once, so that rendering them only looks up payload fields. The
+    request keeps the priority and topic of the configuration, so the retries
+    and digests sent with it are dispatched like the message itself.
+
+    Args:
+        config (TopicConfig): The topic configuration.
+        default_server (str): The server to use when the topic doesn't set one.
+        target (Ntfy): The target to compile the request of. Defaults to the main target.
+
+    Returns:
+        NtfyRequest: The compiled request.
+
+    Raises:
+        ValueError: If a template of the target is invalid.
+    """
+    target = target or config.ntfy
+    server = sys.intern(resolve_server(config, default_server, target))
+    options = target.options
+    if options is None:
+        headers = encode_headers(None, None, ())
+    else:
+        headers = encode_headers(options.title, options.priority, tuple(options.tags))
+    template = None
+    if options is not None and options.template is not None:
+        template = NotificationTemplate(options.template)
+    return NtfyRequest(
+        server=server,
+        url=f"{server}/{target.topic}",
+        headers=headers,
+        template=template,
+        priority=priority_of(config),
+        topic=config.mqtt_topic,
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def encode_headers(
+    title: Optional[str], priority: Any, tags: Sequence[str]
+) -> Mapping[str, bytes]:
+    """
+    Encodes the headers of the static options of a target. The headers are
+    cached, so the requests of targets with equal options share one mapping.
+
+    Args:
+        title (Optional[str]): The title of the notification.
+        priority (Any): The priority of the notification.
+        tags (Sequence[str]): The tags of the notification, as a tuple.
+
+    Returns:
+        Mapping[str, bytes]: The read-only headers.
+    """
+    headers = {}
+    if title is not None:
+        headers["Title"] = str(title).encode("utf-8")
+    if priority is not None:
+        headers["Priority"] = str(priority).encode("utf-8")
+    if tags:
+        headers["Tags"] = ",".join(tags).encode("utf-8")
+    return MappingProxyType(headers)
+
+
+def compile_route(config: TopicConfig, default_server: str = None) -> Route:
+    """
+    Compiles the requests of every target of a topic configuration.
+
+    Args:
+        config (TopicConfig): The topic configuration.
+        default_server (str): The server to use when a target doesn't set one.
+
+    Returns:
+        Route: The topic configuration and its compiled requests.
+    """
+    request, *targets = (
+        compile_request(config, default_server, target) for target in targets_of(config)
+    )
+    return Route(config, request, tuple(targets), priority_of(config))
+
+
+def render_request(
+    request: NtfyRequest, document: Any, message: Optional[str]
+) -> Tuple[NtfyRequest, Optional[str]]:
+    """
+    Renders the templates of a request with the fields of a decoded payload.
+
+    Args:
+        request (NtfyRequest): The compiled request.
+        document (Any): The decoded payload.
+        message (Optional[str]): The message read from the payload field, used without a message template.
+
+    Returns:
+        Tuple[NtfyRequest, Optional[str]]: The request with the rendered headers, and the message or None if its template couldn't be rendered.
+    """
+    template = request.template
+    if template is None:
+        return request, message
+    if template.message is not None:
+        message = template.message.render(document)
+    headers = template.headers(document)
+    if headers:
+        headers = MappingProxyType({**request.headers, **headers})
+    else:
+        headers = request.headers
+    return (
+        NtfyRequest(
+            request.server,
+            request.url,
+            headers,
+            priority=request.priority,
+            topic=request.topic,
+        ),
+        message,
+    )
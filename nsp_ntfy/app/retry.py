@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from enum import Enum
+from typing import Dict, Mapping, NamedTuple, Optional
+
+from .data.data_classes import RetryConfig
+from .startup import lazy_import
+
+requests = lazy_import("requests")
+email_utils = lazy_import("email.utils")
+
+
+class Result(Enum):
+    """
+    The result of a single attempt to send a notification.
+    """
+
+    SENT = "sent"
+    REJECTED = "rejected"
+    CONNECT_ERROR = "connect_error"
+    TIMEOUT = "timeout"
+    SERVER_ERROR = "server_error"
+    RATE_LIMITED = "rate_limited"
+    CIRCUIT_OPEN = "circuit_open"
+
+
+RETRYABLE = frozenset(
+    {
+        Result.CONNECT_ERROR,
+        Result.TIMEOUT,
+        Result.SERVER_ERROR,
+        Result.RATE_LIMITED,
+        Result.CIRCUIT_OPEN,
+    }
+)
+UNHEALTHY = frozenset({Result.CONNECT_ERROR, Result.TIMEOUT, Result.SERVER_ERROR})
+
+
+class Outcome(NamedTuple):
+    """
+    The classified outcome of an attempt to send a notification.
+
+    Attributes:
+        result (Result): The result of the attempt.
+        status (Optional[int]): The HTTP status code, if the server responded.
+        retry_after (Optional[float]): The seconds the server asked to wait before retrying.
+    """
+
+    result: Result
+    status: Optional[int] = None
+    retry_after: Optional[float] = None
+
+    @property
+    def retryable(self) -> bool:
+        """
+        Whether sending the notification again may succeed.
+        """
+        return self.result in RETRYABLE
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parses a Retry-After header given in seconds or as an HTTP date.
+
+    Args:
+        value (Optional[str]): The header value.
+
+    Returns:
+        Optional[float]: The seconds to wait, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(
+            email_utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_status(status: int, headers: Mapping[str, str]) -> Outcome:
+    """
+    Classifies the status code ntfy responded to a notification with.
+
+    Args:
+        status (int): The HTTP status code.
+        headers (Mapping[str, str]): The response headers.
+
+    Returns:
+        Outcome: The classified outcome.
+    """
+    if status < 400:
+        return Outcome(Result.SENT, status)
+    if status == 429:
+        return Outcome(
+            Result.RATE_LIMITED, status, parse_retry_after(headers.get("Retry-After"))
+        )
+    if status >= 500:
+        return Outcome(
+            Result.SERVER_ERROR, status, parse_retry_after(headers.get("Retry-After"))
+        )
+    return Outcome(Result.REJECTED, status)
+
+
+def classify_response(response: requests.Response) -> Outcome:
+    """
+    Classifies the response of ntfy to a notification.
+
+    Args:
+        response (requests.Response): The response from ntfy.
+
+    Returns:
+        Outcome: The classified outcome.
+    """
+    if response.ok:
+        return Outcome(Result.SENT, response.status_code)
+    return classify_status(response.status_code, response.headers)
+
+
+def classify_error(error: requests.RequestException) -> Outcome:
+    """
+    Classifies an error raised while sending a notification. Errors raised
+    while building the request, such as an invalid header or URL, are
+    rejected, since sending the same request again can never succeed.
+
+    Args:
+        error (requests.RequestException): The error raised by requests.
+
+    Returns:
+        Outcome: The classified outcome.
+    """
+    if isinstance(
+        error,
+        (
+            requests.exceptions.InvalidHeader,
+            requests.exceptions.InvalidURL,
+            requests.exceptions.MissingSchema,
+            requests.exceptions.InvalidSchema,
+            requests.exceptions.URLRequired,
+        ),
+    ):
+        return Outcome(Result.REJECTED)
+    if isinstance(error, requests.Timeout):
+        return Outcome(Result.TIMEOUT)
+    return Outcome(Result.CONNECT_ERROR)
+
+
+class RetryPolicy:
+    """
+    Decides whether and when a failed notification is sent again, using
+    exponential backoff with full jitter.
+
+    Attributes:
+        config (RetryConfig): The retry configuration.
+    """
+
+    def __init__(self, config: RetryConfig) -> None:
+        self.config = config
+
+    def should_retry(self, outcome: Outcome, attempt: int) -> bool:
+        """
+        Checks whether a notification should be sent again.
+
+        Args:
+            outcome (Outcome): The outcome of the last attempt.
+            attempt (int): The number of attempts made so far.
+
+        Returns:
+            bool: True if the notification should be sent again.
+        """
+        return (
+            outcome.retryable
+            and outcome.result is not Result.CIRCUIT_OPEN
+            and attempt < self.config.max_attempts
+        )
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Calculates the seconds to wait before the next attempt.
+
+        Args:
+            attempt (int): The number of attempts made so far.
+            retry_after (Optional[float]): The seconds the server asked to wait.
+
+        Returns:
+            float: The seconds to wait.
+        """
+        ceiling = min(
+            self.config.max_delay, self.config.base_delay * (2 ** (attempt - 1))
+        )
+        delay = random.uniform(0, ceiling) if self.config.jitter else ceiling
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.config.max_delay))
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Stops sending to a target that keeps failing, so that requests to it
+    fail fast instead of tying up the sender workers.
+
+    The breaker opens after a number of consecutive failures. Once the reset
+    timeout has passed a single trial request is let through, which closes the
+    breaker if it succeeds or opens it again if it fails.
+
+    Attributes:
+        failure_threshold (int): The consecutive failures that open the breaker.
+        reset_timeout (float): The seconds the breaker stays open.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Checks whether a request may be sent to the target.
+
+        Returns:
+            bool: True if the request may be sent.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record(self, outcome: Outcome) -> None:
+        """
+        Records the outcome of a request to the target. Requests rejected
+        before they reached the server neither count as failures nor close
+        the circuit.
+
+        Args:
+            outcome (Outcome): The outcome of the request.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if outcome.result in UNHEALTHY:
+                self._failures += 1
+                if (
+                    self.state == self.HALF_OPEN
+                    or self._failures >= self.failure_threshold
+                ):
+                    self.state = self.OPEN
+                    self._opened = time.monotonic()
+            elif outcome.status is not None:
+                self._failures = 0
+                self.state = self.CLOSED
+            elif self.state == self.HALF_OPEN and outcome.result is Result.REJECTED:
+                self.state = self.OPEN
+                self._opened = time.monotonic() - self.reset_timeout
+
+
+class CircuitBreakers:
+    """
+    Holds one circuit breaker per target.
+
+    Attributes:
+        config (RetryConfig): The retry configuration the breakers are created from.
+    """
+
+    def __init__(self, config: RetryConfig) -> None:
+        self.config = config
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, target: str) -> CircuitBreaker:
+        """
+        Retrieves the breaker of a target, creating it on first use.
+
+        Args:
+            target (str): The target, such as the base URL of a ntfy server.
+
+        Returns:
+            CircuitBreaker: The breaker of the target.
+        """
+        breaker = self._breakers.get(target)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(
+                    target,
+                    CircuitBreaker(
+                        self.config.breaker_threshold, self.config.breaker_reset
+                    ),
+                )
+        return breaker
+
+    def states(self) -> Dict[str, str]:
+        """
+        Reports the state of every breaker.
+
+        Returns:
+            Dict[str, str]: The state of the breaker of each target.
+        """
+        with self._lock:
+            return {target: b.state for target, b in self._breakers.items()}
@@ -0,0 +1,161 @@
+from typing import Any, Dict, Iterable, List, Tuple
+
+SEPARATOR = "/"
+SINGLE_LEVEL = "+"
+MULTI_LEVEL = "#"
+CACHE_SIZE = 4096
+
+
+class _Node:
+    __slots__ = ("children", "values")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_Node"] = {}
+        self.values: List[Tuple[int, Any]] = []
+
+
+def is_wildcard(topic_filter: str) -> bool:
+    """
+    Checks whether an MQTT topic filter contains a wildcard.
+
+    Args:
+        topic_filter (str): The MQTT topic filter.
+
+    Returns:
+        bool: True if the filter contains a '+' or '#' wildcard.
+    """
+    return SINGLE_LEVEL in topic_filter or MULTI_LEVEL in topic_filter
+
+
+def validate_filter(topic_filter: str) -> None:
+    """
+    Validates an MQTT topic filter.
+
+    Args:
+        topic_filter (str): The MQTT topic filter.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If the filter is empty or uses a wildcard incorrectly.
+    """
+    if not topic_filter:
+        raise ValueError("MQTT topic filter must not be empty")
+    levels = topic_filter.split(SEPARATOR)
+    for position, level in enumerate(levels):
+        if MULTI_LEVEL in level and (
+            level != MULTI_LEVEL or position != len(levels) - 1
+        ):
+            raise ValueError(
+                f"'{MULTI_LEVEL}' must be the last level of topic filter {topic_filter}"
+            )
+        if SINGLE_LEVEL in level and level != SINGLE_LEVEL:
+            raise ValueError(
+                f"'{SINGLE_LEVEL}' must occupy a whole level of topic filter {topic_filter}"
+            )
+
+
+class RoutingIndex:
+    """
+    Maps MQTT topics to the values configured for the topic filters they match.
+
+    Literal topic filters are held in a hash map so that the common case is a
+    single dictionary lookup. Filters containing the MQTT '+' and '#' wildcards
+    are held in a trie with one level per topic level, and the result of
+    walking the trie is cached per topic. Matches are returned in the order the
+    filters were added.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, Any]] = ()) -> None:
+        self._literal: Dict[str, Tuple[Any, ...]] = {}
+        self._literal_ordered: Dict[str, List[Tuple[int, Any]]] = {}
+        self._root = _Node()
+        self._wildcards = 0
+        self._size = 0
+        self._cache: Dict[str, Tuple[Any, ...]] = {}
+        for topic_filter, value in entries:
+            self.add(topic_filter, value)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, topic_filter: str, value: Any) -> None:
+        """
+        Adds a value for a topic filter.
+
+        Args:
+            topic_filter (str): The MQTT topic filter, which may contain wildcards.
+            value (Any): The value to return for topics matching the filter.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: If the topic filter is invalid.
+        """
+        validate_filter(topic_filter)
+        entry = (self._size, value)
+        self._size += 1
+        if is_wildcard(topic_filter):
+            node = self._root
+            for level in topic_filter.split(SEPARATOR):
+                node = node.children.setdefault(level, _Node())
+            node.values.append(entry)
+            self._wildcards += 1
+        else:
+            ordered = self._literal_ordered.setdefault(topic_filter, [])
+            ordered.append(entry)
+            self._literal[topic_filter] = tuple(v for _, v in ordered)
+        self._cache.clear()
+
+    def match(self, topic: str) -> Tuple[Any, ...]:
+        """
+        Finds every value whose topic filter matches a topic.
+
+        Args:
+            topic (str): The MQTT topic a message was published to.
+
+        Returns:
+            Tuple[Any, ...]: The matching values, in the order they were added.
+        """
+        if not self._wildcards:
+            return self._literal.get(topic, ())
+        cached = self._cache.get(topic)
+        if cached is not None:
+            return cached
+        found: List[Tuple[int, Any]] = []
+        found.extend(self._literal_ordered.get(topic, ()))
+        levels = topic.split(SEPARATOR)
+        self._match(self._root, levels, 0, not topic.startswith("$"), found)
+        if len(found) > 1:
+            found.sort(key=lambda entry: entry[0])
+        result = tuple(value for _, value in found)
+        if len(self._cache) >= CACHE_SIZE:
+            self._cache.clear()
+        self._cache[topic] = result
+        return result
+
+    def _match(
+        self,
+        node: _Node,
+        levels: List[str],
+        depth: int,
+        wildcards: bool,
+        found: List[Tuple[int, Any]],
+    ) -> None:
+        children = node.children
+        if wildcards:
+            multi = children.get(MULTI_LEVEL)
+            if multi is not None:
+                found.extend(multi.values)
+        if depth == len(levels):
+            found.extend(node.values)
+            return
+        child = children.get(levels[depth])
+        if child is not None:
+            self._match(child, levels, depth + 1, True, found)
+        if wildcards:
+            single = children.get(SINGLE_LEVEL)
+            if single is not None:
+                self._match(single, levels, depth + 1, True, found)
@@ -0,0 +1,150 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, List
+
+
+class Timer:
+    """
+    A handle to a call scheduled on a Scheduler.
+
+    Attributes:
+        deadline (float): The monotonic time the call is due.
+        cancelled (bool): Whether the call has been cancelled.
+    """
+
+    __slots__ = ("deadline", "callback", "args", "cancelled")
+
+    def __init__(self, deadline: float, callback: Callable, args: tuple) -> None:
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """
+        Cancels the call if it hasn't run yet.
+
+        Returns:
+            None
+        """
+        self.cancelled = True
+
+
+class Scheduler:
+    """
+    Runs delayed calls from a single thread using a heap of timers, so that
+    any number of pending timers costs no more than one thread.
+
+    Callbacks run on the scheduler thread and should hand long running work
+    to the dispatcher rather than doing it themselves.
+    """
+
+    def __init__(self, name: str = "nsp-ntfy-scheduler") -> None:
+        self.name = name
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: threading.Thread = None
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether scheduled calls will be run.
+        """
+        return self._running
+
+    def start(self) -> None:
+        """
+        Starts the scheduler thread.
+
+        Returns:
+            None
+        """
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(
+                target=self._run, name=self.name, daemon=True
+            )
+        self._thread.start()
+
+    def call_later(self, delay: float, callback: Callable, *args) -> Timer:
+        """
+        Schedules a call after a delay.
+
+        Args:
+            delay (float): The number of seconds to wait before the call.
+            callback (Callable): The function to call.
+            *args: The arguments to pass to the function.
+
+        Returns:
+            Timer: A handle that can be used to cancel the call.
+        """
+        timer = Timer(time.monotonic() + max(delay, 0), callback, args)
+        with self._condition:
+            heapq.heappush(self._heap, (timer.deadline, next(self._counter), timer))
+            if self._heap[0][2] is timer:
+                self._condition.notify()
+        return timer
+
+    def pending(self) -> int:
+        """
+        Counts the calls that are scheduled and not cancelled.
+
+        Returns:
+            int: The number of pending calls.
+        """
+        with self._condition:
+            return sum(1 for _, _, timer in self._heap if not timer.cancelled)
+
+    def stop(self, run_pending: bool = False) -> None:
+        """
+        Stops the scheduler thread.
+
+        Args:
+            run_pending (bool): Whether to run the pending calls immediately before stopping. Defaults to False.
+
+        Returns:
+            None
+        """
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+        with self._condition:
+            heap, self._heap = self._heap, []
+        if run_pending:
+            for _, _, timer in sorted(heap):
+                self._call(timer)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._running:
+                    if self._heap:
+                        wait = self._heap[0][0] - time.monotonic()
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = None
+                    self._condition.wait(wait)
+                if not self._running:
+                    return
+                _, _, timer = heapq.heappop(self._heap)
+            self._call(timer)
+
+    def _call(self, timer: Timer) -> None:
+        if timer.cancelled:
+            return
+        timer.cancelled = True
+        try:
+            timer.callback(*timer.args)
+        except Exception:
+            logging.exception("scheduled call failed")
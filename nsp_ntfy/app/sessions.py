@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Dict
+
+from .data.data_classes import HttpConfig
+from .startup import lazy_import
+
+requests = lazy_import("requests")
+
+
+class SessionPool:
+    """
+    Holds one long-lived HTTP session per ntfy server so that consecutive
+    notifications reuse warm keep-alive connections instead of opening a new
+    TCP and TLS connection each time.
+
+    Attributes:
+        config (HttpConfig): The HTTP configuration used for every session.
+    """
+
+    def __init__(self, config: HttpConfig) -> None:
+        self.config = config
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        """
+        The connect and read timeouts passed to each request.
+        """
+        return (self.config.connect_timeout, self.config.read_timeout)
+
+    def session(self, server: str) -> requests.Session:
+        """
+        Retrieves the session for a server, creating it on first use.
+
+        Args:
+            server (str): The base URL of the ntfy server.
+
+        Returns:
+            requests.Session: The session for the server.
+        """
+        session = self._sessions.get(server)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(server)
+                if session is None:
+                    session = self._create_session()
+                    self._sessions[server] = session
+                    logging.debug(f"created connection pool for {server}")
+        return session
+
+    def post(self, server: str, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a POST request using the pooled session for the server.
+
+        Args:
+            server (str): The base URL of the ntfy server.
+            url (str): The full URL to post to.
+            **kwargs: Additional arguments passed to the request.
+
+        Returns:
+            requests.Response: The response from the server.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session(server).post(url, **kwargs)
+
+    def put(self, server: str, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a PUT request using the pooled session for the server.
+
+        Args:
+            server (str): The base URL of the ntfy server.
+            url (str): The full URL to put to.
+            **kwargs: Additional arguments passed to the request.
+
+        Returns:
+            requests.Response: The response from the server.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session(server).put(url, **kwargs)
+
+    def close(self) -> None:
+        """
+        Closes every session and its connections.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.config.pool_size
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        if not self.config.keep_alive:
+            session.headers["Connection"] = "close"
+        return session
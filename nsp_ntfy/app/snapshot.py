@@ -0,0 +1,94 @@
+import hashlib
+import logging
+import os
+import pickle
+from typing import Any, Optional, Sequence, Tuple
+
+from .data import data_classes, runtime
+
+Signature = Tuple[int, int, str]
+
+
+class ConfigSnapshot:
+    """
+    Stores the configurations read from a set of files once they have been
+    validated, so that the next start can load them without parsing the files
+    and building the configuration classes again.
+
+    A snapshot is only used while every file has the same modification time,
+    size and SHA-256 hash as when it was stored, and the configuration
+    classes haven't changed. The snapshot is a pickle, so it must be kept
+    where only the user running the application can write.
+
+    Attributes:
+        path (str): The path of the snapshot file.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def load(self, sources: Sequence[str]) -> Optional[Any]:
+        """
+        Loads the configurations stored for a set of files.
+
+        Args:
+            sources (Sequence[str]): The paths of the configuration files.
+
+        Returns:
+            Optional[Any]: The stored configurations, or None if there is no usable snapshot.
+        """
+        try:
+            with open(self.path, "rb") as file:
+                key, configurations = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception as error:
+            logging.warning(f"ignoring unreadable configuration snapshot: {error}")
+            return None
+        if key != self._key(sources):
+            return None
+        return configurations
+
+    def save(self, sources: Sequence[str], configurations: Any) -> None:
+        """
+        Stores the configurations read from a set of files, replacing any
+        previous snapshot.
+
+        Args:
+            sources (Sequence[str]): The paths of the configuration files.
+            configurations (Any): The configurations read from the files.
+
+        Returns:
+            None
+        """
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, "wb") as file:
+                pickle.dump(
+                    (self._key(sources), configurations),
+                    file,
+                    pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(temporary, self.path)
+        except OSError as error:
+            logging.warning(f"failed to store configuration snapshot: {error}")
+
+    def _key(self, sources: Sequence[str]) -> Tuple:
+        return (
+            self.VERSION,
+            self._signature(data_classes.__file__),
+            self._signature(runtime.__file__),
+            tuple(self._signature(source) for source in sources),
+        )
+
+    @staticmethod
+    def _signature(path: str) -> Optional[Signature]:
+        try:
+            with open(path, "rb") as file:
+                stat = os.fstat(file.fileno())
+                digest = hashlib.sha256(file.read()).hexdigest()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, digest
@@ -0,0 +1,77 @@
+import importlib.util
+import sys
+import time
+from types import ModuleType
+from typing import Dict
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Imports a module lazily: the module is only loaded when one of its
+    attributes is first used, so modules needed by only some modes don't
+    slow down starting the application.
+
+    Annotations that name the module are evaluated when a function is
+    defined, so modules that use a lazy module in their annotations import
+    annotations from __future__.
+
+    Args:
+        name (str): The absolute name of the module.
+
+    Returns:
+        ModuleType: The module, loaded on first use.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+class StartupProfile:
+    """
+    Measures how long each stage of starting the application takes.
+
+    Attributes:
+        started (float): The performance counter when starting began.
+        timings (Dict[str, float]): The seconds taken by each stage in order.
+    """
+
+    def __init__(self, started: float = None) -> None:
+        self.started = time.perf_counter() if started is None else started
+        self.timings: Dict[str, float] = {}
+        self._last = self.started
+
+    def mark(self, stage: str) -> None:
+        """
+        Records the end of a stage, which began when the previous stage ended.
+
+        Args:
+            stage (str): The name of the stage.
+
+        Returns:
+            None
+        """
+        now = time.perf_counter()
+        self.timings[stage] = now - self._last
+        self._last = now
+
+    def report(self) -> str:
+        """
+        Describes the time taken by each stage and in total.
+
+        Returns:
+            str: The timings in milliseconds.
+        """
+        stages = ", ".join(
+            f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in self.timings.items()
+        )
+        return f"{stages}, total {(self._last - self.started) * 1000:.1f}ms"
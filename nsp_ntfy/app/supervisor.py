@@ -0,0 +1,203 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .startup import lazy_import
+
+multiprocessing = lazy_import("multiprocessing")
+
+
+def aggregate(reports: Iterable[Dict]) -> Dict:
+    """
+    Sums the numeric statistics of several workers, key by key. Nested
+    dictionaries are summed recursively and other values are left out.
+
+    Args:
+        reports (Iterable[Dict]): The statistics of each worker.
+
+    Returns:
+        Dict: The summed statistics.
+    """
+    total: Dict = {}
+    for report in reports:
+        for key, value in report.items():
+            if isinstance(value, dict):
+                total[key] = aggregate([total.get(key, {}), value])
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                total[key] = total.get(key, 0) + value
+    return total
+
+
+class _Slot:
+    __slots__ = ("process", "started", "delay", "restart_at")
+
+    def __init__(self) -> None:
+        self.process: multiprocessing.Process = None
+        self.started = 0.0
+        self.delay = 0.0
+        self.restart_at: Optional[float] = None
+
+
+class Supervisor:
+    """
+    Runs a number of worker processes, restarting any that exit until the
+    supervisor is stopped, and collects the statistics the workers report.
+
+    The target is called in each worker as target(index, reports, *args),
+    where reports is a queue on which the worker puts (index, statistics)
+    tuples. A worker that exits is restarted after a delay that doubles each
+    time it exits again within a minute of starting, up to a minute.
+
+    Attributes:
+        target (Callable): The function run by each worker.
+        workers (int): The number of workers.
+        args (tuple): The further arguments passed to the target.
+        stats_interval (float): The seconds between logging the aggregated statistics.
+    """
+
+    POLL_INTERVAL = 0.5
+    RESTART_DELAY = 1.0
+    MAX_RESTART_DELAY = 60.0
+    STABLE_AFTER = 60.0
+    SHUTDOWN_TIMEOUT = 30.0
+
+    def __init__(
+        self,
+        target: Callable,
+        workers: int,
+        args: tuple = (),
+        stats_interval: float = 60.0,
+        context: str = "spawn",
+    ) -> None:
+        self.target = target
+        self.workers = workers
+        self.args = args
+        self.stats_interval = stats_interval
+        self.restarts = 0
+        self._context = multiprocessing.get_context(context)
+        self._reports = self._context.Queue()
+        self._slots: List[_Slot] = [_Slot() for _ in range(workers)]
+        self._stats: Dict[int, Dict] = {}
+        self._stopping = threading.Event()
+
+    def run(self) -> None:
+        """
+        Starts the workers and supervises them until stop() is called,
+        then stops the workers.
+
+        Returns:
+            None
+        """
+        for index in range(self.workers):
+            self._start(index)
+        logging.info(f"supervisor started {self.workers} workers")
+        next_report = time.monotonic() + self.stats_interval
+        try:
+            while not self._stopping.wait(self.POLL_INTERVAL):
+                self._collect()
+                self._restart_exited()
+                if time.monotonic() >= next_report:
+                    next_report += self.stats_interval
+                    logging.info(f"worker statistics {self.stats()}")
+        finally:
+            self._stop_workers()
+            self._collect()
+            logging.info(f"worker statistics {self.stats()}, {self.restarts} restarts")
+
+    def stop(self) -> None:
+        """
+        Asks the supervisor to stop. Safe to call from a signal handler.
+
+        Returns:
+            None
+        """
+        self._stopping.set()
+
+    def signal_workers(self, signum: int) -> None:
+        """
+        Sends a signal to every running worker.
+
+        Args:
+            signum (int): The signal number.
+
+        Returns:
+            None
+        """
+        for slot in self._slots:
+            if slot.process is not None and slot.process.is_alive():
+                try:
+                    os.kill(slot.process.pid, signum)
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict:
+        """
+        Aggregates the latest statistics reported by each worker.
+
+        Returns:
+            Dict: The summed statistics and the number of workers alive.
+        """
+        stats = aggregate(self._stats.values())
+        stats["workers_alive"] = sum(
+            1
+            for slot in self._slots
+            if slot.process is not None and slot.process.is_alive()
+        )
+        return stats
+
+    def _start(self, index: int) -> None:
+        slot = self._slots[index]
+        slot.process = self._context.Process(
+            target=self.target,
+            args=(index, self._reports, *self.args),
+            name=f"nsp-ntfy-worker-{index}",
+        )
+        slot.process.start()
+        slot.started = time.monotonic()
+        slot.restart_at = None
+
+    def _restart_exited(self) -> None:
+        now = time.monotonic()
+        for index, slot in enumerate(self._slots):
+            if slot.process.is_alive():
+                continue
+            if slot.restart_at is None:
+                if now - slot.started >= self.STABLE_AFTER or not slot.delay:
+                    slot.delay = self.RESTART_DELAY
+                else:
+                    slot.delay = min(slot.delay * 2, self.MAX_RESTART_DELAY)
+                slot.restart_at = now + slot.delay
+                logging.warning(
+                    f"worker {index} exited with code {slot.process.exitcode}, "
+                    f"restarting in {slot.delay:.1f}s"
+                )
+            elif now >= slot.restart_at:
+                self.restarts += 1
+                self._start(index)
+
+    def _collect(self) -> None:
+        while True:
+            try:
+                index, stats = self._reports.get_nowait()
+            except queue.Empty:
+                return
+            self._stats[index] = stats
+
+    def _stop_workers(self) -> None:
+        processes = [
+            slot.process
+            for slot in self._slots
+            if slot.process is not None and slot.process.is_alive()
+        ]
+        for process in processes:
+            process.terminate()
+        deadline = time.monotonic() + self.SHUTDOWN_TIMEOUT
+        for process in processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logging.warning(f"{process.name} did not stop, killing it")
+                process.kill()
+                process.join()
@@ -0,0 +1,137 @@
+import json
+import string
+from typing import Any, Dict, List, Optional, Tuple
+
+from .data.data_classes import NtfyTemplate
+from .payload import Segment, parse_path
+
+_FORMATTER = string.Formatter()
+_CONTROL = str.maketrans(dict.fromkeys([*range(0x20), 0x7F], " "))
+
+Part = Tuple[str, Optional[Tuple[Segment, ...]], str]
+
+
+class Template:
+    """
+    A text template whose placeholders, such as "{pass.time}", are replaced
+    by the payload field at that dotted path. A placeholder may end with a
+    format specification, such as "{elevation:.1f}", and "{{" and "}}" stand
+    for literal braces.
+
+    The template is parsed once when it is compiled, so rendering only looks
+    up the fields of the decoded payload and joins the parts.
+
+    Attributes:
+        source (str): The template text.
+    """
+
+    __slots__ = ("source", "_parts")
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self._parts: List[Part] = []
+        try:
+            for literal, name, spec, conversion in _FORMATTER.parse(source):
+                if conversion:
+                    raise ValueError("conversions aren't supported")
+                segments = None if name is None else parse_path(name)
+                self._parts.append((literal, segments, spec or ""))
+        except ValueError as error:
+            raise ValueError(f"invalid template {source!r}: {error}") from None
+
+    def render(self, document: Any) -> Optional[str]:
+        """
+        Renders the template with the fields of a decoded payload.
+
+        Args:
+            document (Any): The decoded payload.
+
+        Returns:
+            Optional[str]: The rendered text, or None if a field is missing or can't be formatted.
+        """
+        pieces = []
+        for literal, segments, spec in self._parts:
+            if literal:
+                pieces.append(literal)
+            if segments is None:
+                continue
+            value = document
+            try:
+                for segment in segments:
+                    value = value[segment]
+            except (KeyError, IndexError, TypeError):
+                return None
+            if value is None:
+                return None
+            if isinstance(value, str) and not spec:
+                pieces.append(value)
+            elif isinstance(value, (dict, list)):
+                pieces.append(json.dumps(value))
+            else:
+                try:
+                    pieces.append(format(value, spec))
+                except (TypeError, ValueError):
+                    return None
+        return "".join(pieces)
+
+
+class NotificationTemplate:
+    """
+    The compiled templates of the options of an ntfy target.
+
+    Attributes:
+        title (Optional[Template]): The title template.
+        message (Optional[Template]): The message template.
+        priority (Optional[Template]): The priority template.
+        tags (List[Template]): The tag templates.
+    """
+
+    __slots__ = ("title", "message", "priority", "tags")
+
+    def __init__(self, config: NtfyTemplate) -> None:
+        self.title = Template(config.title) if config.title is not None else None
+        self.message = Template(config.message) if config.message is not None else None
+        self.priority = (
+            Template(str(config.priority)) if config.priority is not None else None
+        )
+        self.tags = [Template(tag) for tag in config.tags]
+
+    def headers(self, document: Any) -> Dict[str, bytes]:
+        """
+        Renders the headers of a notification. A header whose template can't
+        be rendered is left out, so the static option applies instead. Line
+        breaks and other control characters in payload fields are replaced
+        by spaces, so a payload can't add headers of its own.
+
+        Args:
+            document (Any): The decoded payload.
+
+        Returns:
+            Dict[str, bytes]: The encoded headers that were rendered.
+        """
+        headers = {}
+        if self.title is not None:
+            title = _header_value(self.title.render(document))
+            if title is not None:
+                headers["Title"] = title.encode("utf-8")
+        if self.priority is not None:
+            priority = _header_value(self.priority.render(document))
+            if priority:
+                headers["Priority"] = priority.encode("utf-8")
+        if self.tags:
+            tags = [
+                tag
+                for tag in (_header_value(t.render(document)) for t in self.tags)
+                if tag
+            ]
+            if tags:
+                headers["Tags"] = ",".join(tags).encode("utf-8")
+        return headers
+
+
+def _header_value(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    if not value.isprintable():
+        value = value.translate(_CONTROL)
+    return value.strip()
@@ -1,11 +1,59 @@
 import argparse
+import time
 
-from .app.main import run
+
+def __add_configurations(parser: argparse.ArgumentParser, required: bool) -> None:
+    parser.add_argument("-c", "--configuration", type=str, required=required)
+    parser.add_argument("-nsp", "--nsp_configuration", type=str, required=required)
+    parser.add_argument("--snapshot", type=str, default=None)
 
 
 def nsp_ntfy():
+    started = time.perf_counter()
     parser = argparse.ArgumentParser()
-    parser.add_argument("-c", "--configuration", type=str, required=True)
-    parser.add_argument("-nsp", "--nsp_configuration", type=str, required=True)
+    __add_configurations(parser, required=False)
+    parser.add_argument("--async", dest="async_mode", action="store_true")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--share-group", type=str, default="nsp-ntfy")
+    parser.add_argument("--profile-startup", action="store_true")
+    commands = parser.add_subparsers(dest="command")
+    record = commands.add_parser(
+        "record", help="record the messages of the configured topics to a file"
+    )
+    __add_configurations(record, required=True)
+    record.add_argument("-o", "--output", type=str, required=True)
+    record.add_argument("--duration", type=float, default=None)
+    replay = commands.add_parser(
+        "replay", help="replay a recording to measure throughput and latency"
+    )
+    __add_configurations(replay, required=True)
+    replay.add_argument("recording", type=str)
+    replay.add_argument("--speed", type=str, default="1x")
+    replay.add_argument("--publish", action="store_true")
+    replay.add_argument("--host", type=str, default=None)
+    replay.add_argument("--port", type=int, default=1883)
+    replay.set_defaults(async_mode=False)
     arguments = parser.parse_args(None)
-    run(arguments)
+    if arguments.command is None and not (
+        arguments.configuration and arguments.nsp_configuration
+    ):
+        parser.error(
+            "the following arguments are required: -c/--configuration, -nsp/--nsp_configuration"
+        )
+
+    from .app import main
+    from .app.startup import StartupProfile
+
+    if arguments.command == "record":
+        main.run_record(arguments)
+        return
+    if arguments.command == "replay":
+        main.run_replay(arguments)
+        return
+    if arguments.profile_startup:
+        main.startup_profile = StartupProfile(started)
+        main.startup_profile.mark("import")
+    if arguments.workers > 0:
+        main.run_workers(arguments)
+    else:
+        main.run(arguments)
@@ -0,0 +1,280 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import dataclasses
+from types import MappingProxyType
+
+import pytest
+
+from nsp_ntfy.app.aio import (
+    AsyncEngine,
+    AsyncHttpClient,
+    AsyncioHelper,
+    InvalidHeader,
+)
+from nsp_ntfy.app.data.data_classes import HttpConfig, Ntfy, RetryConfig, TopicConfig
+from nsp_ntfy.app.request import compile_request
+from nsp_ntfy.app.retry import CircuitBreakers, Outcome, Result
+
+
+async def serve(responses):
+    """
+    Starts a local HTTP server answering each request with the next response,
+    recording the requests and the connections they arrived on.
+    """
+    received = []
+
+    async def handle(reader, writer):
+        connection = object()
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":")[1])
+                body = await reader.readexactly(length)
+                received.append((connection, head, body))
+                writer.write(responses.pop(0))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}", received
+
+
+def test_post_reuses_kept_connection():
+    async def scenario():
+        server, base, received = await serve(
+            [
+                b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}",
+                b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n2\r\n{}\r\n0\r\n\r\n",
+            ]
+        )
+        client = AsyncHttpClient(HttpConfig())
+        first = await client.post(f"{base}/topic", b"one", {"Title": b"T"})
+        second = await client.post(f"{base}/topic", "twö".encode("utf-8"), {})
+        await client.close()
+        server.close()
+        return first, second, received
+
+    # Act
+    first, second, received = asyncio.run(scenario())
+
+    # Assert
+    assert first[0] == 200 and second[0] == 200
+    assert received[0][0] is received[1][0]
+    assert received[0][1].startswith(b"POST /topic HTTP/1.1\r\n")
+    assert b"Title: T\r\n" in received[0][1]
+    assert received[1][2] == "twö".encode("utf-8")
+
+
+def test_post_without_keep_alive_opens_new_connections():
+    async def scenario():
+        server, base, received = await serve(
+            [b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n"] * 2
+        )
+        client = AsyncHttpClient(HttpConfig(keep_alive=False))
+        await client.post(f"{base}/topic", b"one", {})
+        await client.post(f"{base}/topic", b"two", {})
+        await client.close()
+        server.close()
+        return received
+
+    # Act
+    received = asyncio.run(scenario())
+
+    # Assert
+    assert received[0][0] is not received[1][0]
+    assert b"Connection: close\r\n" in received[0][1]
+
+
+def test_deliver_classifies_rate_limited_response():
+    async def scenario():
+        server, base, _ = await serve(
+            [
+                b"HTTP/1.1 429 Too Many Requests\r\nRetry-After: 7\r\nContent-Length: 0\r\n\r\n"
+            ]
+        )
+        engine = AsyncEngine(HttpConfig(), CircuitBreakers(RetryConfig()), MagicMock())
+        engine._semaphore = asyncio.Semaphore(1)
+        request = compile_request(
+            TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="topic", server=base))
+        )
+        outcome = await engine.deliver(request, "message")
+        await engine._http.close()
+        server.close()
+        return outcome
+
+    # Act
+    outcome = asyncio.run(scenario())
+
+    # Assert
+    assert outcome == Outcome(Result.RATE_LIMITED, 429, 7.0)
+
+
+def test_deliver_classifies_refused_connection():
+    async def scenario():
+        server = await asyncio.start_server(lambda r, w: None, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        server.close()
+        await server.wait_closed()
+        engine = AsyncEngine(HttpConfig(), CircuitBreakers(RetryConfig()), MagicMock())
+        engine._semaphore = asyncio.Semaphore(1)
+        request = compile_request(
+            TopicConfig(
+                mqtt_topic="t",
+                ntfy=Ntfy(topic="topic", server=f"http://127.0.0.1:{port}"),
+            )
+        )
+        return await engine.deliver(request, "message")
+
+    # Act
+    outcome = asyncio.run(scenario())
+
+    # Assert
+    assert outcome.result is Result.CONNECT_ERROR
+
+
+def test_engine_sends_attempts_and_reports_outcomes():
+    # Arrange
+    on_outcome = MagicMock()
+    client = MagicMock()
+    client.is_connected.return_value = False
+    engine = AsyncEngine(
+        HttpConfig(max_in_flight=2), CircuitBreakers(RetryConfig()), on_outcome
+    )
+    responses = [b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n"] * 3
+
+    def start():
+        async def begin():
+            server, base, _ = await serve(responses)
+            request = compile_request(
+                TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="topic", server=base))
+            )
+            for attempt in range(3):
+                engine.attempt(request, f"message {attempt}", 1)
+            while engine.completed < 3:
+                await asyncio.sleep(0.01)
+            engine.stop()
+
+        asyncio.get_running_loop().create_task(begin())
+
+    # Act
+    engine.run([client], start)
+
+    # Assert
+    assert on_outcome.call_count == 3
+    assert all(
+        call.args[3] == Outcome(Result.SENT, 200) for call in on_outcome.call_args_list
+    )
+    assert engine.stats() == {"pending": 0, "in_flight": 0, "completed": 3}
+    assert not engine.running
+
+
+def test_asyncio_helper_registers_socket_callbacks():
+    # Arrange
+    loop = MagicMock()
+    client = MagicMock()
+    sock = MagicMock()
+    helper = AsyncioHelper(loop, client)
+
+    # Act
+    helper.on_socket_register_write(client, None, sock)
+    helper.on_socket_unregister_write(client, None, sock)
+
+    # Assert
+    assert client.on_socket_open == helper.on_socket_open
+    loop.add_writer.assert_called_once_with(sock, client.loop_write)
+    loop.remove_writer.assert_called_once_with(sock)
+
+
+def test_engine_disconnects_each_client_and_chains_handlers():
+    # Arrange
+    engine = AsyncEngine(HttpConfig(), CircuitBreakers(RetryConfig()), MagicMock())
+    clients = [MagicMock(), MagicMock()]
+    handlers = [MagicMock(), MagicMock()]
+    for client, handler in zip(clients, handlers):
+        client.on_disconnect = handler
+        client.is_connected.return_value = True
+        client.disconnect.side_effect = lambda client=client: (
+            client.on_disconnect(client, None, None, 0, None)
+        )
+
+    # Act
+    engine.run(clients, engine.stop)
+
+    # Assert
+    for client, handler in zip(clients, handlers):
+        client.disconnect.assert_called_once()
+        handler.assert_called_once_with(client, None, None, 0, None)
+    assert not engine.running
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [
+        {"Title": b"ISS\r\nX-Injected: 1"},
+        {"Title": b"ISS\nX-Injected: 1"},
+        {"Title": b"ISS\x00"},
+        {"X-Injected: 1\r\nTitle": b"ISS"},
+    ],
+)
+def test_encode_rejects_headers_breaking_the_request(headers):
+    # Arrange
+    client = AsyncHttpClient(HttpConfig())
+
+    # Act / Assert
+    with pytest.raises(InvalidHeader):
+        client._encode("ntfy.sh", "/topic", b"message", headers)
+
+
+def test_deliver_rejects_request_with_line_break_in_header():
+    async def scenario():
+        server, url, received = await serve([])
+        engine = AsyncEngine(HttpConfig(), CircuitBreakers(RetryConfig()), MagicMock())
+        engine._semaphore = asyncio.Semaphore(1)
+        request = compile_request(
+            TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="topic", server=url))
+        )
+        request = dataclasses.replace(
+            request, headers=MappingProxyType({"Title": b"ISS\r\nX-Injected: 1"})
+        )
+        outcome = await engine.deliver(request, "message")
+        server.close()
+        await server.wait_closed()
+        return outcome, received
+
+    # Act
+    outcome, received = asyncio.run(scenario())
+
+    # Assert
+    assert outcome.result is Result.REJECTED
+    assert not outcome.retryable
+    assert received == []
+
+
+def test_deliver_rejects_message_that_cannot_be_encoded():
+    async def scenario():
+        server, url, received = await serve([])
+        engine = AsyncEngine(HttpConfig(), CircuitBreakers(RetryConfig()), MagicMock())
+        engine._semaphore = asyncio.Semaphore(1)
+        request = compile_request(
+            TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="topic", server=url))
+        )
+        outcome = await engine.deliver(request, "\ud800")
+        server.close()
+        await server.wait_closed()
+        return outcome, received
+
+    # Act
+    outcome, received = asyncio.run(scenario())
+
+    # Assert
+    assert outcome.result is Result.REJECTED
+    assert not outcome.retryable
+    assert received == []
@@ -0,0 +1,199 @@
+import os
+import sys
+import threading
+import time
+
+from nsp_ntfy.app.attachments import Attachments, Upload
+from nsp_ntfy.app.data.data_classes import AttachmentConfig, DownscaleConfig
+
+SHRINK = [
+    sys.executable,
+    "-c",
+    "import sys; open(sys.argv[2], 'wb').write(open(sys.argv[1], 'rb').read(4))",
+    "{input}",
+    "{output}",
+]
+
+
+def capture(tmp_path, name="frame.jpg", size=64):
+    directory = tmp_path / "captures"
+    directory.mkdir(exist_ok=True)
+    path = directory / name
+    path.write_bytes(b"x" * size)
+    return directory, path
+
+
+def test_locate_resolves_capture_in_directory(tmp_path):
+    # Arrange
+    directory, path = capture(tmp_path)
+    attachments = Attachments(AttachmentConfig(directories=[str(directory)]))
+
+    # Act
+    result = attachments.locate(
+        {"file": str(directory / ".." / "captures" / "frame.jpg")}
+    )
+
+    # Assert
+    assert result == os.path.realpath(path)
+
+
+def test_locate_rejects_files_outside_directories(tmp_path):
+    # Arrange
+    directory, _ = capture(tmp_path)
+    secret = tmp_path / "secret.txt"
+    secret.write_text("secret")
+    (directory / "link.jpg").symlink_to(secret)
+    attachments = Attachments(AttachmentConfig(directories=[str(directory)]))
+
+    # Act
+    results = [
+        attachments.locate({"file": str(secret)}),
+        attachments.locate({"file": str(directory / ".." / "secret.txt")}),
+        attachments.locate({"file": str(directory / "link.jpg")}),
+    ]
+
+    # Assert
+    assert results == [None, None, None]
+    assert attachments.stats()["rejected outside"] == 3
+
+
+def test_locate_ignores_payload_without_capture(tmp_path):
+    # Arrange
+    attachments = Attachments(AttachmentConfig(directories=[str(tmp_path)]))
+
+    # Act
+    result = attachments.locate({"notification": "meteor"})
+
+    # Assert
+    assert result is None
+    assert not any(attachments.rejected.values())
+
+
+def test_open_streams_capture(tmp_path):
+    # Arrange
+    directory, path = capture(tmp_path)
+    attachments = Attachments(AttachmentConfig(directories=[str(directory)]))
+
+    # Act
+    with attachments.open(str(path)) as upload:
+        first = upload.file.read(8)
+        size = upload.size
+
+    # Assert
+    assert first == b"x" * 8
+    assert size == 64
+    assert upload.file.closed
+    assert upload.filename == "frame.jpg"
+    assert attachments.attached == 1
+
+
+def test_open_leaves_out_capture_over_size_limit(tmp_path):
+    # Arrange
+    directory, path = capture(tmp_path, size=100)
+    attachments = Attachments(
+        AttachmentConfig(directories=[str(directory)], max_size=99)
+    )
+
+    # Act
+    with attachments.open(str(path)) as upload:
+        result = upload
+
+    # Assert
+    assert result is None
+    assert attachments.stats()["rejected too_large"] == 1
+
+
+def test_open_shrinks_capture_in_separate_process(tmp_path):
+    # Arrange
+    directory, path = capture(tmp_path, size=100)
+    attachments = Attachments(
+        AttachmentConfig(
+            directories=[str(directory)],
+            max_size=10,
+            downscale=DownscaleConfig(command=SHRINK),
+        )
+    )
+
+    # Act
+    with attachments.open(str(path)) as upload:
+        size = upload.size
+        shrunk = upload.file.name
+
+    # Assert
+    assert size == 4
+    assert not os.path.exists(shrunk)
+    assert path.stat().st_size == 100
+    assert attachments.downscaled == 1
+
+
+def test_open_attaches_original_when_shrinking_fails(tmp_path):
+    # Arrange
+    directory, path = capture(tmp_path)
+    attachments = Attachments(
+        AttachmentConfig(
+            directories=[str(directory)],
+            downscale=DownscaleConfig(command=[sys.executable, "-c", "exit(1)"]),
+        )
+    )
+
+    # Act
+    with attachments.open(str(path)) as upload:
+        size = upload.size
+
+    # Assert
+    assert size == 64
+    assert attachments.downscale_failed == 1
+
+
+def test_submit_caps_concurrent_uploads(tmp_path):
+    # Arrange
+    attachments = Attachments(
+        AttachmentConfig(directories=[str(tmp_path)], max_concurrent=2)
+    )
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def upload():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    # Act
+    for _ in range(6):
+        attachments.submit(upload)
+    attachments.stop()
+
+    # Assert
+    assert peak[0] == 2
+
+
+def test_upload_headers_carry_message_and_filename():
+    # Arrange
+    upload = Upload(None, "frame.jpg", 10)
+
+    # Act
+    headers = upload.headers("Meteor\ncaptured °")
+
+    # Assert
+    assert headers == {
+        "Filename": b"frame.jpg",
+        "Message": "Meteor\\ncaptured °".encode("utf-8"),
+    }
+
+
+def test_upload_headers_escape_carriage_returns():
+    # Arrange
+    upload = Upload(None, "frame\r\n.jpg", 10)
+
+    # Act
+    headers = upload.headers("Meteor\r\nX-Injected: 1\rcaptured\x00")
+
+    # Assert
+    assert headers == {
+        "Filename": b"frame.jpg",
+        "Message": b"Meteor\\nX-Injected: 1\\ncaptured",
+    }
@@ -0,0 +1,79 @@
+from unittest.mock import MagicMock
+
+from nsp_ntfy.app.brokers import Broker, configurations_for
+from nsp_ntfy.app.data.data_classes import (
+    DeviceConfig,
+    LoggingConfig,
+    MQTTConfig,
+    Ntfy,
+    NtfyModuleConfig,
+    TopicConfig,
+)
+
+
+def module_config():
+    return NtfyModuleConfig(
+        logging=LoggingConfig(),
+        configurations=[
+            TopicConfig(mqtt_topic="nsp/a", ntfy=Ntfy(topic="a")),
+            TopicConfig(mqtt_topic="nsp/b", ntfy=Ntfy(topic="b"), device="garden"),
+            TopicConfig(mqtt_topic="nsp/c", ntfy=Ntfy(topic="c"), device="roof"),
+        ],
+    )
+
+
+def test_configurations_for_device():
+    # Arrange
+    configuration = module_config()
+
+    # Act
+    garden = configurations_for(configuration, "garden")
+
+    # Assert
+    assert [c.mqtt_topic for c in garden] == ["nsp/a", "nsp/b"]
+
+
+def test_configurations_for_all_devices():
+    # Arrange
+    configuration = module_config()
+
+    # Act
+    result = configurations_for(configuration, None)
+
+    # Assert
+    assert [c.mqtt_topic for c in result] == ["nsp/a", "nsp/b", "nsp/c"]
+
+
+def test_broker_is_user_data_of_client():
+    # Arrange
+    client = MagicMock()
+    device = DeviceConfig(name="garden", mqtt=MQTTConfig())
+
+    # Act
+    broker = Broker(device, client)
+
+    # Assert
+    client.user_data_set.assert_called_once_with(broker)
+    assert broker.name == "garden"
+
+
+def test_broker_stats():
+    # Arrange
+    broker = Broker(DeviceConfig(name="garden", mqtt=MQTTConfig()), MagicMock())
+    broker.connected = True
+    broker.connects = 2
+    broker.connect_failures = 1
+    broker.disconnects = 1
+    broker.messages = 5
+
+    # Act
+    stats = broker.stats()
+
+    # Assert
+    assert stats == {
+        "connected": 1,
+        "connects": 2,
+        "connect_failures": 1,
+        "disconnects": 1,
+        "messages": 5,
+    }
@@ -0,0 +1,123 @@
+import dataclasses
+from types import MappingProxyType
+from unittest.mock import MagicMock
+
+from nsp_ntfy.app.coalesce import Coalescer
+from nsp_ntfy.app.data.data_classes import CoalesceConfig, Ntfy, TopicConfig
+from nsp_ntfy.app.request import compile_request
+from nsp_ntfy.app.scheduler import Timer
+
+
+def fake_scheduler():
+    scheduler = MagicMock()
+    scheduler.call_later.side_effect = lambda delay, callback, *args: Timer(
+        delay, callback, args
+    )
+    return scheduler
+
+
+def request(topic="ntfy-topic"):
+    return compile_request(TopicConfig(mqtt_topic="nsp", ntfy=Ntfy(topic=topic)))
+
+
+def test_window_flush_sends_one_digest():
+    # Arrange
+    scheduler = fake_scheduler()
+    send = MagicMock()
+    coalescer = Coalescer(scheduler, send)
+    ntfy_request = request()
+    config = CoalesceConfig(window_ms=500, max_messages=10)
+
+    # Act
+    coalescer.add(ntfy_request, config, "first")
+    coalescer.add(ntfy_request, config, "second")
+    delay, callback, *args = scheduler.call_later.call_args.args
+    callback(*args)
+
+    # Assert
+    scheduler.call_later.assert_called_once()
+    assert delay == 0.5
+    send.assert_called_once_with(ntfy_request, "first\nsecond")
+    assert coalescer.stats() == {"received": 2, "sent": 1, "open_windows": 0}
+
+
+def test_full_window_is_sent_immediately():
+    # Arrange
+    scheduler = fake_scheduler()
+    send = MagicMock()
+    coalescer = Coalescer(scheduler, send)
+    ntfy_request = request()
+    config = CoalesceConfig(window_ms=500, max_messages=2)
+
+    # Act
+    coalescer.add(ntfy_request, config, "first")
+    coalescer.add(ntfy_request, config, "second")
+    coalescer.add(ntfy_request, config, "third")
+
+    # Assert
+    send.assert_called_once_with(ntfy_request, "first\nsecond")
+    assert coalescer.stats()["open_windows"] == 1
+
+
+def test_windows_are_kept_per_request():
+    # Arrange
+    send = MagicMock()
+    coalescer = Coalescer(fake_scheduler(), send)
+    first, second = request("first"), request("second")
+    config = CoalesceConfig()
+
+    # Act
+    coalescer.add(first, config, "a")
+    coalescer.add(second, config, "b")
+    coalescer.flush()
+
+    # Assert
+    assert send.call_count == 2
+    send.assert_any_call(first, "a")
+    send.assert_any_call(second, "b")
+
+
+def test_stale_timer_does_not_send_new_window():
+    # Arrange
+    scheduler = fake_scheduler()
+    send = MagicMock()
+    coalescer = Coalescer(scheduler, send)
+    ntfy_request = request()
+    config = CoalesceConfig(max_messages=1)
+    coalescer.add(ntfy_request, config, "first")
+    _, callback, *args = scheduler.call_later.call_args.args
+
+    # Act
+    callback(*args)
+
+    # Assert
+    send.assert_called_once_with(ntfy_request, "first")
+
+
+def test_windows_are_kept_per_rendered_headers_and_attachment():
+    # Arrange
+    send = MagicMock()
+    coalescer = Coalescer(fake_scheduler(), send)
+    compiled = request()
+    iss = dataclasses.replace(compiled, headers=MappingProxyType({"Title": b"ISS"}))
+    also_iss = dataclasses.replace(
+        compiled, headers=MappingProxyType({"Title": b"ISS"})
+    )
+    hubble = dataclasses.replace(
+        compiled, headers=MappingProxyType({"Title": b"Hubble"})
+    )
+    attached = dataclasses.replace(iss, attachment="/captures/frame.jpg")
+    config = CoalesceConfig()
+
+    # Act
+    coalescer.add(iss, config, "a")
+    coalescer.add(also_iss, config, "b")
+    coalescer.add(hubble, config, "c")
+    coalescer.add(attached, config, "d")
+    coalescer.flush()
+
+    # Assert
+    assert send.call_count == 3
+    send.assert_any_call(iss, "a\nb")
+    send.assert_any_call(hubble, "c")
+    send.assert_any_call(attached, "d")
@@ -0,0 +1,75 @@
+from unittest.mock import patch
+
+from nsp_ntfy.app.dedup import DedupCache
+
+
+def test_repeated_message_is_seen():
+    # Arrange
+    cache = DedupCache(ttl=60, max_entries=10)
+
+    # Act
+    first = cache.seen("nsp/events", b'{"notification": "a"}')
+    second = cache.seen("nsp/events", b'{"notification": "a"}')
+
+    # Assert
+    assert not first
+    assert second
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "size": 1}
+
+
+def test_same_payload_on_other_topic_is_not_seen():
+    # Arrange
+    cache = DedupCache(ttl=60, max_entries=10)
+    cache.seen("nsp/events", b"payload")
+
+    # Act
+    result = cache.seen("nsp/other", b"payload")
+
+    # Assert
+    assert not result
+
+
+@patch("nsp_ntfy.app.dedup.time.monotonic")
+def test_expired_message_is_not_seen(mock_monotonic):
+    # Arrange
+    cache = DedupCache(ttl=10, max_entries=10)
+    mock_monotonic.return_value = 100
+    cache.seen("nsp/events", b"payload")
+
+    # Act
+    mock_monotonic.return_value = 111
+    result = cache.seen("nsp/events", b"payload")
+
+    # Assert
+    assert not result
+    assert cache.stats()["evictions"] == 1
+    assert len(cache) == 1
+
+
+def test_oldest_message_is_evicted_when_full():
+    # Arrange
+    cache = DedupCache(ttl=60, max_entries=2)
+    cache.seen("nsp/events", b"first")
+    cache.seen("nsp/events", b"second")
+
+    # Act
+    cache.seen("nsp/events", b"third")
+
+    # Assert
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+    assert not cache.seen("nsp/events", b"first")
+
+
+def test_same_message_from_other_device_is_not_seen():
+    # Arrange
+    cache = DedupCache(ttl=60, max_entries=10)
+    cache.seen("nsp/events", b"payload", "roof")
+
+    # Act
+    other = cache.seen("nsp/events", b"payload", "garden")
+    repeated = cache.seen("nsp/events", b"payload", "roof")
+
+    # Assert
+    assert not other
+    assert repeated
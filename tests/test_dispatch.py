@@ -0,0 +1,260 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from nsp_ntfy.app.dispatch import Dispatcher, PriorityBuffer
+
+
+def test_submit_runs_job_on_worker():
+    # Arrange
+    dispatcher = Dispatcher(workers=2, queue_size=10)
+    job = MagicMock()
+    dispatcher.start()
+
+    # Act
+    queued = dispatcher.submit(job, "message", "config")
+    dispatcher.stop(drain=True)
+
+    # Assert
+    assert queued
+    job.assert_called_once_with("message", "config")
+    assert dispatcher.stats()["dispatched"] == 1
+
+
+def test_submit_drops_when_queue_full():
+    # Arrange
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking_job():
+        started.set()
+        release.wait()
+
+    dispatcher = Dispatcher(workers=1, queue_size=1)
+    dispatcher.start()
+    dispatcher.submit(blocking_job)
+    started.wait(1)
+
+    # Act
+    first = dispatcher.submit(MagicMock())
+    second = dispatcher.submit(MagicMock())
+    stats = dispatcher.stats()
+    release.set()
+    dispatcher.stop(drain=True)
+
+    # Assert
+    assert first
+    assert not second
+    assert stats["queue_depth"] == 1
+    assert stats["workers_busy"] == 1
+    assert stats["dropped"] == 1
+
+
+@pytest.mark.parametrize("overflow", ["drop_newest", "drop_lowest", "block"])
+def test_resubmit_queues_past_full_queue_without_waiting(overflow):
+    # Arrange
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking_job():
+        started.set()
+        release.wait()
+
+    dispatcher = Dispatcher(
+        workers=1, queue_size=1, overflow=overflow, block_timeout=5.0
+    )
+    dispatcher.start()
+    dispatcher.submit(blocking_job)
+    started.wait(1)
+    dispatcher.submit(MagicMock())
+    job = MagicMock()
+
+    # Act
+    begun = time.monotonic()
+    queued = dispatcher.resubmit(job, "retry", priority=1, topic="nsp/events")
+    waited = time.monotonic() - begun
+    stats = dispatcher.stats()
+    release.set()
+    dispatcher.stop(drain=True)
+
+    # Assert
+    assert queued
+    assert waited < 1.0
+    assert stats["queue_depth"] == 2
+    assert stats["dropped"] == 0
+    job.assert_called_once_with("retry")
+
+
+def test_submit_before_start_is_dropped():
+    # Arrange
+    dispatcher = Dispatcher(workers=1, queue_size=1)
+    job = MagicMock()
+
+    # Act
+    queued = dispatcher.submit(job)
+
+    # Assert
+    assert not queued
+    job.assert_not_called()
+    assert dispatcher.stats()["dropped"] == 1
+
+
+def test_failed_job_does_not_stop_worker():
+    # Arrange
+    dispatcher = Dispatcher(workers=1, queue_size=10)
+    job = MagicMock()
+    dispatcher.start()
+
+    # Act
+    dispatcher.submit(MagicMock(side_effect=RuntimeError("boom")))
+    dispatcher.submit(job)
+    dispatcher.stop(drain=True)
+
+    # Assert
+    job.assert_called_once()
+    assert dispatcher.stats()["failed"] == 1
+    assert dispatcher.stats()["workers_alive"] == 0
+
+
+def test_stop_without_drain_discards_queue():
+    # Arrange
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking_job():
+        started.set()
+        release.wait()
+
+    dispatcher = Dispatcher(workers=1, queue_size=5)
+    dispatcher.start()
+    dispatcher.submit(blocking_job)
+    started.wait(1)
+    job = MagicMock()
+    dispatcher.submit(job)
+    dispatcher.submit(job)
+
+    # Act
+    threading.Timer(0.05, release.set).start()
+    dispatcher.stop(drain=False)
+
+    # Assert
+    job.assert_not_called()
+    assert dispatcher.stats()["dropped"] == 2
+
+
+def test_priority_buffer_orders_by_priority_then_arrival():
+    # Arrange
+    buffer = PriorityBuffer(10)
+    for item, priority in [("a", 1), ("b", 5), ("c", 3), ("d", 5), ("e", 1)]:
+        buffer.put(item, priority)
+
+    # Act
+    items = [buffer.get() for _ in range(5)]
+
+    # Assert
+    assert items == ["b", "d", "c", "a", "e"]
+
+
+def test_priority_buffer_drop_lowest_evicts_oldest_least_urgent():
+    # Arrange
+    buffer = PriorityBuffer(2, overflow="drop_lowest")
+    buffer.put("low-1", 1)
+    buffer.put("low-2", 1)
+
+    # Act
+    urgent = buffer.put("urgent", 5)
+    chatter = PriorityBuffer(1, overflow="drop_lowest")
+    chatter.put("high", 4)
+    rejected = chatter.put("low", 1)
+
+    # Assert
+    assert urgent == (True, "low-1")
+    assert [buffer.get(), buffer.get()] == ["urgent", "low-2"]
+    assert rejected == (False, None)
+
+
+def test_priority_buffer_drop_lowest_never_evicts_control_items():
+    # Arrange
+    buffer = PriorityBuffer(2, overflow="drop_lowest")
+    buffer.put_control("retry", 3)
+    buffer.put("n1", 3)
+
+    # Act
+    added = buffer.put("n2", 3)
+    full = PriorityBuffer(1, overflow="drop_lowest")
+    full.put_control("digest", 1)
+    rejected = full.put("urgent", 5)
+
+    # Assert
+    assert added == (True, "n1")
+    assert [buffer.get(), buffer.get()] == ["retry", "n2"]
+    assert buffer.qsize() == 0
+    assert rejected == (False, None)
+    assert full.get() == "digest"
+
+
+def test_priority_buffer_block_waits_for_room():
+    # Arrange
+    buffer = PriorityBuffer(1, overflow="block", block_timeout=5)
+    buffer.put("first", 3)
+    threading.Timer(0.05, buffer.get).start()
+
+    # Act
+    queued = buffer.put("second", 3)
+
+    # Assert
+    assert queued == (True, None)
+    assert buffer.get() == "second"
+
+
+def test_priority_buffer_block_gives_up_after_timeout():
+    # Arrange
+    buffer = PriorityBuffer(1, overflow="block", block_timeout=0.01)
+    buffer.put("first", 3)
+
+    # Act
+    queued = buffer.put("second", 3)
+
+    # Assert
+    assert queued == (False, None)
+
+
+def test_priority_buffer_rejects_unknown_policy():
+    # Act & Assert
+    with pytest.raises(ValueError):
+        PriorityBuffer(1, overflow="drop_random")
+
+
+def test_dispatcher_counts_shed_jobs_per_topic():
+    # Arrange
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking_job():
+        started.set()
+        release.wait()
+
+    on_shed = MagicMock()
+    dispatcher = Dispatcher(
+        workers=1, queue_size=1, overflow="drop_lowest", on_shed=on_shed
+    )
+    dispatcher.start()
+    dispatcher.submit(blocking_job)
+    started.wait(1)
+    low, urgent = MagicMock(), MagicMock()
+
+    # Act
+    dispatcher.submit(low, priority=1, topic="nsp/chatter")
+    dispatcher.submit(urgent, priority=5, topic="nsp/alert")
+    dispatcher.submit(low, priority=1, topic="nsp/chatter")
+    release.set()
+    dispatcher.stop(drain=True)
+
+    # Assert
+    urgent.assert_called_once_with()
+    low.assert_not_called()
+    assert dispatcher.shed() == {"nsp/chatter": 2}
+    assert dispatcher.stats()["dropped"] == 2
+    assert on_shed.call_count == 2
@@ -0,0 +1,128 @@
+import json
+import logging
+import queue
+
+from nsp_ntfy.app.data.data_classes import (
+    LoggingConfig,
+    LoggingFormatConfig,
+    LoggingRotationConfig,
+    ModuleLoggingConfig,
+    __configure_logging,
+)
+from nsp_ntfy.app.logs import (
+    BatchedRotatingFileHandler,
+    DeferredQueueHandler,
+    JsonFormatter,
+    LogListener,
+)
+
+
+def make_record(msg, *args, level=logging.INFO):
+    return logging.LogRecord("root", level, __file__, 1, msg, args, None)
+
+
+def test_deferred_queue_handler_queues_records_unformatted():
+    # Arrange
+    records = queue.SimpleQueue()
+    handler = DeferredQueueHandler(records)
+    record = make_record("found configuration for %s", "nsp/a")
+
+    # Act
+    handler.handle(record)
+
+    # Assert
+    queued = records.get_nowait()
+    assert queued is record
+    assert queued.args == ("nsp/a",)
+
+
+def test_batched_handler_flushes_once_queue_is_empty(tmp_path):
+    # Arrange
+    path = tmp_path / "test.log"
+    records = queue.SimpleQueue()
+    handler = BatchedRotatingFileHandler(str(path), records)
+    records.put(make_record("waiting"))
+
+    # Act
+    handler.handle(make_record("first"))
+    written_while_pending = path.read_text()
+    records.get_nowait()
+    handler.handle(make_record("second"))
+
+    # Assert
+    assert written_while_pending == ""
+    assert path.read_text() == "first\nsecond\n"
+    handler.close()
+
+
+def test_batched_handler_rotates(tmp_path):
+    # Arrange
+    path = tmp_path / "test.log"
+    handler = BatchedRotatingFileHandler(str(path), queue.SimpleQueue(), 10, 1)
+
+    # Act
+    handler.handle(make_record("first line"))
+    handler.handle(make_record("second line"))
+    handler.close()
+
+    # Assert
+    assert (tmp_path / "test.log.1").read_text() == "first line\n"
+    assert path.read_text() == "second line\n"
+
+
+def test_json_formatter():
+    # Arrange
+    formatter = JsonFormatter(datefmt="%Y")
+    record = make_record("status %s", 503, level=logging.WARNING)
+
+    # Act
+    entry = json.loads(formatter.format(record))
+
+    # Assert
+    assert entry["level"] == "WARNING"
+    assert entry["message"] == "status 503"
+    assert set(entry) == {"time", "level", "thread", "message"}
+
+
+def test_log_listener_can_stop_twice():
+    # Arrange
+    listener = LogListener(queue.SimpleQueue(), logging.NullHandler())
+    listener.start()
+
+    # Act
+    listener.stop()
+    listener.stop()
+
+    # Assert
+    assert listener._thread is None
+
+
+def test_configure_logging_writes_structured_records_from_listener(tmp_path):
+    # Arrange
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    root.handlers = []
+    module_logging = ModuleLoggingConfig(file="test.log", structured=True)
+    root_logging = LoggingConfig(
+        path=str(tmp_path),
+        level="INFO",
+        format=LoggingFormatConfig(date="%Y", output="%(message)s"),
+        rotation=LoggingRotationConfig(size=1048576, backup=1),
+    )
+
+    try:
+        # Act
+        listener = __configure_logging(module_logging, root_logging)
+        logging.info("sent %d notifications", 3)
+        listener.stop()
+    finally:
+        for handler in root.handlers:
+            handler.close()
+        root.handlers, root.level = saved_handlers, saved_level
+
+    # Assert
+    lines = (tmp_path / "test.log").read_text().splitlines()
+    assert [json.loads(line)["message"] for line in lines] == [
+        "configuration created",
+        "sent 3 notifications",
+    ]
@@ -1,30 +1,79 @@
+import dataclasses
+import time
 import unittest
 import pytest
-from unittest.mock import patch, MagicMock
+import requests
+from unittest.mock import call, patch, MagicMock
 from nsp_ntfy.app.data.data_classes import (
     TopicConfig,
     Ntfy,
     NtfyModuleConfig,
     LoggingConfig,
+    DispatchConfig,
+    HttpConfig,
+    PayloadConfig,
+    CoalesceConfig,
+    RetryConfig,
+    MQTTConfig,
+    NtfyOptions,
+    NtfyTemplate,
+    MqttSessionConfig,
+    AttachmentConfig,
+    OutboxConfig,
 )
 from nsp_ntfy.app.main import (
     get_configuration,
     send_notification,
     on_connect,
     on_message,
+    get_server,
+    deliver,
+    post_notification,
+    attempt_notification,
+    resubmit,
+    submit,
     __get_module_configuration,
     __get_nsp_configuration,
     DeviceConfig,
     run,
+    get_configurations,
+    build_routing_index,
+    reload_configuration,
+    replay_outbox,
+    get_routes,
+    get_subscription,
+    get_worker_file,
+    get_worker_port,
+    run_worker,
+    build_device_indexes,
+    build_rate_limiter,
+    get_client_id,
+    render_notifications,
+    run_record,
+    run_replay,
 )
+import nsp_ntfy.app.main as main
+from nsp_ntfy.app.attachments import Attachments
+from nsp_ntfy.app.brokers import Broker
+from nsp_ntfy.app.dedup import DedupCache
+from nsp_ntfy.app.metrics import Metrics
+from nsp_ntfy.app.payload import PayloadExtractor
+from nsp_ntfy.app.recording import Record, encode_record, read_records
+from nsp_ntfy.app.retry import CircuitBreakers, Outcome, Result
+from nsp_ntfy.app.request import Route, compile_request, compile_route
+from nsp_ntfy.app.routing import RoutingIndex
 
 
-@patch("nsp_ntfy.app.main.module_configuration", autospec=True)
-def test_get_configuration_found(mock_module_configuration):
+def route(config):
+    return Route(config, compile_request(config))
+
+
+@patch("nsp_ntfy.app.main.routing_index", new_callable=RoutingIndex)
+def test_get_configuration_found(mock_routing_index):
     # Arrange
     topic = "test/topic"
     expected_config = TopicConfig(mqtt_topic=topic, ntfy=Ntfy(topic=topic))
-    mock_module_configuration.configurations = [expected_config]
+    mock_routing_index.add(topic, route(expected_config))
 
     # Act
     result = get_configuration(topic)
@@ -33,13 +82,14 @@ def test_get_configuration_found(mock_module_configuration):
     assert result == expected_config
 
 
-@patch("nsp_ntfy.app.main.module_configuration", autospec=True)
-def test_get_configuration_not_found(mock_module_configuration):
+@patch("nsp_ntfy.app.main.routing_index", new_callable=RoutingIndex)
+def test_get_configuration_not_found(mock_routing_index):
     # Arrange
     topic = "test/topic"
-    mock_module_configuration.configurations = [
-        TopicConfig(mqtt_topic="other/topic", ntfy=Ntfy(topic="other/topic"))
-    ]
+    mock_routing_index.add(
+        "other/topic",
+        route(TopicConfig(mqtt_topic="other/topic", ntfy=Ntfy(topic="other/topic"))),
+    )
 
     # Act
     result = get_configuration(topic)
@@ -48,11 +98,10 @@ def test_get_configuration_not_found(mock_module_configuration):
     assert result is None
 
 
-@patch("nsp_ntfy.app.main.module_configuration", autospec=True)
-def test_get_configuration_empty_configurations(mock_module_configuration):
+@patch("nsp_ntfy.app.main.routing_index", new_callable=RoutingIndex)
+def test_get_configuration_empty_configurations(mock_routing_index):
     # Arrange
     topic = "test/topic"
-    mock_module_configuration.configurations = []
 
     # Act
     result = get_configuration(topic)
@@ -60,12 +109,12 @@ def test_get_configuration_empty_configurations(mock_module_configuration):
     assert result is None
 
 
-@patch("nsp_ntfy.app.main.module_configuration", autospec=True)
-def test_get_configuration_found_second(mock_module_configuration):
+@patch("nsp_ntfy.app.main.routing_index", new_callable=RoutingIndex)
+def test_get_configuration_found_second(mock_routing_index):
     # Arrange
     topic = "test/topic"
     expected_config = TopicConfig(mqtt_topic=topic, ntfy=Ntfy(topic=topic))
-    mock_module_configuration.configurations = [expected_config]
+    mock_routing_index.add(topic, route(expected_config))
 
     # Act
     result = get_configuration(topic)
@@ -74,13 +123,14 @@ def test_get_configuration_found_second(mock_module_configuration):
     assert result == expected_config
 
 
-@patch("nsp_ntfy.app.main.module_configuration", autospec=True)
-def test_get_configuration_not_found_third(mock_module_configuration):
+@patch("nsp_ntfy.app.main.routing_index", new_callable=RoutingIndex)
+def test_get_configuration_not_found_third(mock_routing_index):
     # Arrange
     topic = "test/topic"
-    mock_module_configuration.configurations = [
-        TopicConfig(mqtt_topic="other/topic", ntfy=Ntfy(topic="other/topic"))
-    ]
+    mock_routing_index.add(
+        "other/topic",
+        route(TopicConfig(mqtt_topic="other/topic", ntfy=Ntfy(topic="other/topic"))),
+    )
 
     # Act
     result = get_configuration(topic)
@@ -89,11 +139,10 @@ def test_get_configuration_not_found_third(mock_module_configuration):
     assert result is None
 
 
-@patch("nsp_ntfy.app.main.module_configuration", autospec=True)
-def test_get_configuration_empty_configurations_second(mock_module_configuration):
+@patch("nsp_ntfy.app.main.routing_index", new_callable=RoutingIndex)
+def test_get_configuration_empty_configurations_second(mock_routing_index):
     # Arrange
     topic = "test/topic"
-    mock_module_configuration.configurations = []
 
     # Act
     result = get_configuration(topic)
@@ -101,6 +150,40 @@ def test_get_configuration_empty_configurations_second(mock_module_configuration
     assert result is None
 
 
+@patch("nsp_ntfy.app.main.routing_index", new_callable=RoutingIndex)
+def test_get_configurations_wildcards(mock_routing_index):
+    # Arrange
+    literal = TopicConfig(mqtt_topic="nsp/iss/events", ntfy=Ntfy(topic="literal"))
+    single = TopicConfig(mqtt_topic="nsp/+/events", ntfy=Ntfy(topic="single"))
+    multi = TopicConfig(mqtt_topic="nsp/#", ntfy=Ntfy(topic="multi"))
+    for config in [single, literal, multi]:
+        mock_routing_index.add(config.mqtt_topic, route(config))
+
+    # Act
+    result = get_configurations("nsp/iss/events")
+
+    # Assert
+    assert result == (single, literal, multi)
+    assert get_configuration("nsp/iss/events") == single
+
+
+def test_build_routing_index():
+    # Arrange
+    config = TopicConfig(mqtt_topic="nsp/+/events", ntfy=Ntfy(topic="single"))
+    module_config = NtfyModuleConfig(logging=LoggingConfig(), configurations=[config])
+
+    # Act
+    result = build_routing_index(module_config)
+
+    # Assert
+    assert [r.config for r in result.match("nsp/satellite/events")] == [config]
+    assert result.match("nsp/satellite/events")[0].request.url == (
+        "https://ntfy.sh/single"
+    )
+    assert result.match("nsp/satellite") == ()
+
+
+@patch("nsp_ntfy.app.main.module_configuration", NtfyModuleConfig(LoggingConfig()))
 @patch("nsp_ntfy.app.main.logging")
 def test_on_connect(mock_logging):
     # Arrange
@@ -108,6 +191,7 @@ def test_on_connect(mock_logging):
     userdata = MagicMock()
     flags = MagicMock()
     reason_code = MagicMock()
+    reason_code.is_failure = False
     properties = MagicMock()
 
     # Act
@@ -115,9 +199,56 @@ def test_on_connect(mock_logging):
 
     # Assert
     mock_logging.info.assert_called_once_with("connected to MQTT broker")
+    client.subscribe.assert_not_called()
+
+
+def test_on_connect_subscribes_in_one_packet():
+    # Arrange
+    configuration = NtfyModuleConfig(
+        logging=LoggingConfig(),
+        configurations=[
+            TopicConfig(mqtt_topic="nsp/a", ntfy=Ntfy(topic="a")),
+            TopicConfig(mqtt_topic="nsp/b", ntfy=Ntfy(topic="b"), qos=1),
+            TopicConfig(mqtt_topic="nsp/a", ntfy=Ntfy(topic="c"), qos=2),
+            TopicConfig(mqtt_topic="nsp/d", ntfy=Ntfy(topic="d"), device="other"),
+        ],
+    )
+    client = MagicMock()
+    garden = broker(client, "garden")
+    reason_code = MagicMock()
+    reason_code.is_failure = False
+
+    # Act
+    with (
+        patch("nsp_ntfy.app.main.module_configuration", configuration),
+        patch("nsp_ntfy.app.main.logging"),
+    ):
+        on_connect(client, garden, MagicMock(), reason_code, None)
+
+    # Assert
+    client.subscribe.assert_called_once_with([("nsp/a", 2), ("nsp/b", 1)])
+    assert garden.connected
+    assert garden.connects == 1
+
+
+@patch("nsp_ntfy.app.main.logging")
+def test_on_connect_failure_does_not_subscribe(mock_logging):
+    # Arrange
+    client = MagicMock()
+    garden = broker(client, "garden")
+    reason_code = MagicMock()
+    reason_code.is_failure = True
+
+    # Act
+    on_connect(client, garden, MagicMock(), reason_code, None)
+
+    # Assert
+    client.subscribe.assert_not_called()
+    assert not garden.connected
+    mock_logging.error.assert_called_once()
 
 
-@patch("nsp_ntfy.app.main.get_configuration")
+@patch("nsp_ntfy.app.main.get_routes")
 @patch("nsp_ntfy.app.main.send_notification")
 @patch("nsp_ntfy.app.main.logging")
 def test_on_message_with_configuration(
@@ -130,18 +261,184 @@ def test_on_message_with_configuration(
     msg.topic = "test/topic"
     msg.payload = b'{"notification": "test message"}'
     topic_config = MagicMock()
-    mock_get_configuration.return_value = topic_config
+    request = MagicMock()
+    mock_get_configuration.return_value = (Route(topic_config, request),)
 
     # Act
     on_message(client, userdata, msg)
 
     # Assert
-    mock_get_configuration.assert_called_once_with("test/topic")
-    mock_logging.debug.assert_called_once_with("found configuration for test/topic")
-    mock_send_notification.assert_called_once_with(msg, topic_config)
+    mock_get_configuration.assert_called_once_with("test/topic", None)
+    mock_logging.debug.assert_called_once_with(
+        "found configuration for %s", "test/topic"
+    )
+    mock_send_notification.assert_called_once_with(msg, topic_config, request, ())
+
+
+@patch("nsp_ntfy.app.main.dispatcher")
+@patch("nsp_ntfy.app.main.get_routes")
+@patch("nsp_ntfy.app.main.send_notification")
+@patch("nsp_ntfy.app.main.logging")
+def test_on_message_with_dispatcher(
+    mock_logging, mock_send_notification, mock_get_configuration, mock_dispatcher
+):
+    # Arrange
+    msg = MagicMock()
+    msg.topic = "test/topic"
+    topic_config = MagicMock()
+    request = MagicMock()
+    topic_config.mqtt_topic = "test/#"
+    mock_get_configuration.return_value = (Route(topic_config, request),)
+
+    # Act
+    on_message(MagicMock(), MagicMock(), msg)
+
+    # Assert
+    mock_dispatcher.submit.assert_called_once_with(
+        mock_send_notification,
+        msg,
+        topic_config,
+        request,
+        (),
+        priority=3,
+        topic="test/#",
+    )
+    mock_send_notification.assert_not_called()
+
+
+@patch("nsp_ntfy.app.main.metrics", new_callable=Metrics)
+@patch("nsp_ntfy.app.main.get_routes")
+@patch("nsp_ntfy.app.main.send_notification")
+@patch("nsp_ntfy.app.main.logging")
+def test_on_message_counts_routed_and_unrouted_messages(
+    mock_logging, mock_send_notification, mock_get_routes, mock_metrics
+):
+    # Arrange
+    msg = MagicMock()
+    msg.topic = "test/topic"
+    mock_get_routes.side_effect = [(Route(MagicMock(), MagicMock()),), ()]
+
+    # Act
+    on_message(MagicMock(), MagicMock(), msg)
+    on_message(MagicMock(), MagicMock(), msg)
+
+    # Assert
+    assert mock_metrics.received.value == 2
+    assert mock_metrics.routed.value == 1
+    assert mock_metrics.unrouted.value == 1
+    assert sum(mock_metrics.stages["route"].counts) == 2
+
+
+@patch("nsp_ntfy.app.main.metrics", new_callable=Metrics)
+@patch("nsp_ntfy.app.main.sessions")
+def test_send_notification_records_stage_metrics(mock_sessions, mock_metrics):
+    # Arrange
+    msg = MagicMock()
+    msg.payload = b'{"notification": "test message"}'
+    msg.timestamp = time.monotonic()
+    mock_sessions.post.return_value.ok = True
+    config = TopicConfig(mqtt_topic="test/topic", ntfy=Ntfy(topic="test_topic"))
+
+    # Act
+    send_notification(msg, config)
+
+    # Assert
+    for stage in ("queue", "decode", "send"):
+        assert sum(mock_metrics.stages[stage].counts) == 1
+    assert mock_metrics.sent.value == 1
+
+
+@patch("nsp_ntfy.app.main.post_notification")
+@patch("nsp_ntfy.app.main.logging")
+def test_send_notification_reads_configured_field(mock_logging, mock_post_notification):
+    # Arrange
+    msg = MagicMock()
+    msg.payload = b'{"event": {"details": [{"text": "nested message"}]}}'
+    config = TopicConfig(
+        mqtt_topic="test/topic",
+        ntfy=Ntfy(topic="test_topic"),
+        field="event.details.0.text",
+    )
+
+    # Act
+    send_notification(msg, config)
+
+    # Assert
+    mock_post_notification.assert_called_once()
+    assert mock_post_notification.call_args.args[1] == "nested message"
+
+
+@pytest.mark.parametrize(
+    "payload", [b'{"notification": ', b'{"notification": "\\ud800"}']
+)
+@patch("nsp_ntfy.app.main.metrics", new_callable=Metrics)
+@patch("nsp_ntfy.app.main.post_notification")
+@patch("nsp_ntfy.app.main.logging")
+def test_send_notification_drops_malformed_payload(
+    mock_logging, mock_post_notification, mock_metrics, payload
+):
+    # Arrange
+    msg = MagicMock()
+    msg.topic = "test/topic"
+    msg.payload = payload
+    msg.timestamp = time.monotonic()
+    config = TopicConfig(mqtt_topic="test/topic", ntfy=Ntfy(topic="test_topic"))
+
+    # Act
+    with patch("nsp_ntfy.app.payload.orjson", None):
+        send_notification(msg, config)
+
+    # Assert
+    mock_post_notification.assert_not_called()
+    mock_logging.warning.assert_called_once_with(
+        "dropping malformed payload for %s", "test/topic"
+    )
+    assert mock_metrics.dropped["malformed"].value == 1
+
+
+@patch("nsp_ntfy.app.main.deduplicator", new=DedupCache(ttl=60, max_entries=10))
+@patch("nsp_ntfy.app.main.get_routes")
+@patch("nsp_ntfy.app.main.send_notification")
+def test_on_message_drops_duplicates(mock_send_notification, mock_get_routes):
+    # Arrange
+    msg = MagicMock()
+    msg.topic = "test/topic"
+    msg.payload = b'{"notification": "test message"}'
+    mock_get_routes.return_value = (Route(MagicMock(), MagicMock()),)
+
+    # Act
+    on_message(MagicMock(), MagicMock(), msg)
+    on_message(MagicMock(), MagicMock(), msg)
+
+    # Assert
+    mock_get_routes.assert_called_once_with("test/topic", None)
+    mock_send_notification.assert_called_once()
 
 
-@patch("nsp_ntfy.app.main.get_configuration")
+@patch("nsp_ntfy.app.main.deduplicator", new=DedupCache(ttl=60, max_entries=10))
+@patch("nsp_ntfy.app.main.get_routes")
+@patch("nsp_ntfy.app.main.send_notification")
+def test_on_message_keeps_same_message_from_each_device(
+    mock_send_notification, mock_get_routes
+):
+    # Arrange
+    msg = MagicMock()
+    msg.topic = "nsp/observation"
+    msg.payload = b'{"notification": "Observation started"}'
+    mock_get_routes.return_value = (Route(MagicMock(), MagicMock()),)
+    roof, garden = broker(MagicMock(), "roof"), broker(MagicMock(), "garden")
+
+    # Act
+    on_message(roof.client, roof, msg)
+    on_message(garden.client, garden, msg)
+    on_message(garden.client, garden, msg)
+
+    # Assert
+    assert mock_send_notification.call_count == 2
+    assert main.deduplicator.stats()["hits"] == 1
+
+
+@patch("nsp_ntfy.app.main.get_routes")
 @patch("nsp_ntfy.app.main.logging")
 def test_on_message_without_configuration(mock_logging, mock_get_configuration):
     # Arrange
@@ -149,47 +446,553 @@ def test_on_message_without_configuration(mock_logging, mock_get_configuration):
     userdata = MagicMock()
     msg = MagicMock()
     msg.topic = "test/topic"
-    mock_get_configuration.return_value = None
+    mock_get_configuration.return_value = ()
 
     # Act
     on_message(client, userdata, msg)
 
     # Assert
-    mock_get_configuration.assert_called_once_with("test/topic")
-    mock_logging.warn.assert_called_once_with(
-        "no configuration found for topic test/topic"
+    mock_get_configuration.assert_called_once_with("test/topic", None)
+    mock_logging.warning.assert_called_once_with(
+        "no configuration found for topic %s", "test/topic"
     )
 
 
-@patch("nsp_ntfy.app.main.requests.post")
+@patch("nsp_ntfy.app.main.sessions")
 @patch("nsp_ntfy.app.main.logging")
-def test_send_notification(mock_logging, mock_requests_post):
+def test_send_notification(mock_logging, mock_sessions):
     # Arrange
     msg = MagicMock()
     msg.payload = b'{"notification": "test message"}'
     config = MagicMock()
+    config.field = None
+    config.ntfy.server = None
     config.ntfy.topic = "test_topic"
     config.ntfy.options.title = "Test Title"
-    config.ntfy.options.priority = "high"
+    config.ntfy.options.priority = 4
     config.ntfy.options.tags = ["tag1", "tag2"]
+    config.ntfy.options.template = None
+    config.targets = []
 
     # Act
     send_notification(msg, config)
 
     # Assert
     mock_logging.debug.assert_called_once_with(
-        "sending notification to ntfy test message"
+        "sending notification to ntfy %s", "test message"
     )
-    mock_requests_post.assert_called_once_with(
+    mock_sessions.post.assert_called_once_with(
+        "https://ntfy.sh",
         "https://ntfy.sh/test_topic",
         data="test message",
         headers={
-            "Title": "Test Title",
-            "Priority": "high",
-            "Tags": "tag1,tag2",
+            "Title": b"Test Title",
+            "Priority": b"4",
+            "Tags": b"tag1,tag2",
         },
     )
-    mock_logging.info.assert_called_once_with("notification sent to ntfy")
+    mock_logging.info.assert_called_once_with("notification sent to ntfy")
+
+
+@patch("nsp_ntfy.app.main.sessions")
+@patch("nsp_ntfy.app.main.logging")
+def test_send_notification_with_compiled_request(mock_logging, mock_sessions):
+    # Arrange
+    msg = MagicMock()
+    msg.payload = b'{"notification": "test message"}'
+    config = TopicConfig(mqtt_topic="test/topic", ntfy=Ntfy(topic="test_topic"))
+    request = compile_request(config, "http://localhost:8080")
+
+    # Act
+    send_notification(msg, config, request)
+
+    # Assert
+    mock_sessions.post.assert_called_once_with(
+        "http://localhost:8080",
+        "http://localhost:8080/test_topic",
+        data="test message",
+        headers={},
+    )
+
+
+@patch("nsp_ntfy.app.main.coalescer")
+@patch("nsp_ntfy.app.main.sessions")
+def test_send_notification_coalesced(mock_sessions, mock_coalescer):
+    # Arrange
+    msg = MagicMock()
+    msg.payload = b'{"notification": "test message"}'
+    config = TopicConfig(
+        mqtt_topic="test/topic",
+        ntfy=Ntfy(topic="test_topic"),
+        coalesce=CoalesceConfig(window_ms=100, max_messages=5),
+    )
+    request = compile_request(config)
+
+    # Act
+    send_notification(msg, config, request)
+
+    # Assert
+    mock_coalescer.add.assert_called_once_with(request, config.coalesce, "test message")
+    mock_sessions.post.assert_not_called()
+
+
+@patch("nsp_ntfy.app.main.coalescer")
+@patch("nsp_ntfy.app.main.sessions")
+def test_send_notification_coalesces_rendered_request(mock_sessions, mock_coalescer):
+    # Arrange
+    msg = MagicMock()
+    msg.payload = b'{"notification": "test message", "satellite": "ISS"}'
+    config = TopicConfig(
+        mqtt_topic="test/topic",
+        ntfy=Ntfy(
+            topic="test_topic",
+            options=NtfyOptions(
+                title="Pass", template=NtfyTemplate(title="{satellite} pass")
+            ),
+        ),
+        coalesce=CoalesceConfig(window_ms=100, max_messages=5),
+    )
+    request = compile_request(config)
+
+    # Act
+    send_notification(msg, config, request)
+
+    # Assert
+    rendered, coalesce, body = mock_coalescer.add.call_args.args
+    assert rendered.headers["Title"] == b"ISS pass"
+    assert coalesce is config.coalesce
+    assert body == "test message"
+    mock_sessions.post.assert_not_called()
+
+
+@patch("nsp_ntfy.app.main.resubmit")
+@patch("nsp_ntfy.app.main.post_notification")
+@patch("nsp_ntfy.app.main.extractor")
+def test_send_notification_fans_out_to_targets(
+    mock_extractor, mock_post_notification, mock_resubmit
+):
+    # Arrange
+    msg = MagicMock()
+    mock_extractor.extract.return_value = "test message"
+    config = TopicConfig(
+        mqtt_topic="test/topic",
+        ntfy=Ntfy(topic="main"),
+        targets=[Ntfy(topic="backup"), Ntfy(topic="phone")],
+    )
+    route = compile_route(config)
+
+    # Act
+    send_notification(msg, config, route.request, route.targets)
+
+    # Assert
+    mock_extractor.extract.assert_called_once()
+    assert mock_resubmit.call_args_list == [
+        call(mock_post_notification, target, "test message") for target in route.targets
+    ]
+    mock_post_notification.assert_called_once_with(route.request, "test message")
+
+
+@patch("nsp_ntfy.app.main.resubmit")
+@patch("nsp_ntfy.app.main.post_notification")
+@patch("nsp_ntfy.app.main.extractor")
+@patch("nsp_ntfy.app.main.module_configuration", None)
+def test_send_notification_compiles_targets_on_demand(
+    mock_extractor, mock_post_notification, mock_resubmit
+):
+    # Arrange
+    mock_extractor.extract.return_value = "test message"
+    config = TopicConfig(
+        mqtt_topic="test/topic",
+        ntfy=Ntfy(topic="main"),
+        targets=[Ntfy(topic="backup", server="http://localhost")],
+    )
+
+    # Act
+    send_notification(MagicMock(), config)
+
+    # Assert
+    target = mock_resubmit.call_args.args[1]
+    assert target.url == "http://localhost/backup"
+    assert mock_post_notification.call_args.args[0].url == "https://ntfy.sh/main"
+
+
+@patch("nsp_ntfy.app.main.resubmit")
+@patch("nsp_ntfy.app.main.post_notification")
+def test_send_notification_renders_templates_per_target(
+    mock_post_notification, mock_resubmit
+):
+    # Arrange
+    msg = MagicMock()
+    msg.payload = b'{"notification": "plain", "satellite": "ISS"}'
+    config = TopicConfig(
+        mqtt_topic="test/topic",
+        ntfy=Ntfy(topic="main"),
+        targets=[
+            Ntfy(
+                topic="phone",
+                options=NtfyOptions(
+                    title=None,
+                    template=NtfyTemplate(message="{satellite} is overhead"),
+                ),
+            ),
+            Ntfy(
+                topic="broken",
+                options=NtfyOptions(
+                    title=None, template=NtfyTemplate(message="{missing}")
+                ),
+            ),
+        ],
+    )
+    route = compile_route(config)
+
+    # Act
+    send_notification(msg, config, route.request, route.targets)
+
+    # Assert
+    mock_post_notification.assert_called_once_with(route.request, "plain")
+    target, message = mock_resubmit.call_args.args[1:]
+    assert mock_resubmit.call_count == 1
+    assert target.url == "https://ntfy.sh/phone"
+    assert message == "ISS is overhead"
+
+
+@patch("nsp_ntfy.app.main.dispatcher")
+def test_resubmit_keeps_priority_and_topic_of_request(mock_dispatcher):
+    # Arrange
+    mock_dispatcher.running = True
+    job = MagicMock()
+    request = compile_request(
+        TopicConfig(
+            mqtt_topic="nsp/events",
+            ntfy=Ntfy(topic="t", options=NtfyOptions(title=None, priority=5)),
+        )
+    )
+
+    # Act
+    resubmit(job, request, "message", 2)
+
+    # Assert
+    mock_dispatcher.resubmit.assert_called_once_with(
+        job, request, "message", 2, priority=5, topic="nsp/events"
+    )
+    mock_dispatcher.submit.assert_not_called()
+    job.assert_not_called()
+
+
+@patch("nsp_ntfy.app.main.engine")
+@patch("nsp_ntfy.app.main.logging")
+def test_connect_further_broker_retries_on_event_loop_in_async_mode(
+    mock_logging, mock_engine
+):
+    # Arrange
+    mock_engine.running = True
+    client = MagicMock()
+    client.connect.side_effect = ConnectionRefusedError(111, "Connection refused")
+    garden = broker(client, "garden")
+
+    # Act
+    getattr(main, "__connect_further")(garden)
+
+    # Assert
+    mock_engine.reconnect_later.assert_called_once_with(client)
+    assert garden.connect_failures == 1
+    mock_logging.error.assert_called_once()
+
+
+@patch("nsp_ntfy.app.main.RateLimiter")
+def test_build_rate_limiter_applies_rate_of_each_target(mock_rate_limiter):
+    # Arrange
+    configuration = NtfyModuleConfig(
+        logging=LoggingConfig(),
+        configurations=[
+            TopicConfig(
+                mqtt_topic="nsp/a",
+                ntfy=Ntfy(topic="main"),
+                targets=[Ntfy(topic="backup", rate=0.5, burst=2)],
+            )
+        ],
+    )
+
+    # Act
+    limiter = build_rate_limiter(configuration)
+
+    # Assert
+    limiter.configure_topic.assert_called_once_with("https://ntfy.sh/backup", 0.5, 2)
+
+
+@patch("nsp_ntfy.app.main.sessions")
+def test_deliver_connection_error_is_retried(mock_sessions):
+    # Arrange
+    mock_sessions.post.side_effect = requests.ConnectionError("refused")
+    request = compile_request(TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="t")))
+
+    # Act
+    result = deliver(request, "message")
+
+    # Assert
+    assert result.result is Result.CONNECT_ERROR
+    assert result.retryable
+
+
+@pytest.mark.parametrize(
+    "status,expected",
+    [
+        (200, Result.SENT),
+        (400, Result.REJECTED),
+        (429, Result.RATE_LIMITED),
+        (503, Result.SERVER_ERROR),
+    ],
+)
+@patch("nsp_ntfy.app.main.breakers", new=CircuitBreakers(RetryConfig()))
+@patch("nsp_ntfy.app.main.sessions")
+def test_deliver_status_codes(mock_sessions, status, expected):
+    # Arrange
+    mock_sessions.post.return_value.ok = status < 400
+    mock_sessions.post.return_value.status_code = status
+    mock_sessions.post.return_value.headers = {}
+    request = compile_request(TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="t")))
+
+    # Act
+    result = deliver(request, "message")
+
+    # Assert
+    assert result.result is expected
+
+
+@patch("nsp_ntfy.app.main.breakers", new=CircuitBreakers(RetryConfig()))
+@patch("nsp_ntfy.app.main.sessions")
+def test_deliver_fails_fast_when_circuit_open(mock_sessions):
+    # Arrange
+    mock_sessions.post.side_effect = requests.ConnectionError("refused")
+    request = compile_request(TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="t")))
+    for _ in range(RetryConfig().breaker_threshold):
+        deliver(request, "message")
+    mock_sessions.post.reset_mock()
+
+    # Act
+    result = deliver(request, "message")
+
+    # Assert
+    assert result.result is Result.CIRCUIT_OPEN
+    mock_sessions.post.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "error", [UnicodeEncodeError("utf-8", "\ud800", 0, 1, "surrogate"), OSError()]
+)
+@patch("nsp_ntfy.app.main.breakers")
+@patch("nsp_ntfy.app.main.sessions")
+@patch("nsp_ntfy.app.main.logging")
+def test_deliver_records_unexpected_error_of_half_open_trial(
+    mock_logging, mock_sessions, mock_breakers, error
+):
+    # Arrange
+    breakers = CircuitBreakers(RetryConfig(breaker_threshold=1, breaker_reset=0.0))
+    mock_breakers.get.side_effect = breakers.get
+    request = compile_request(TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="t")))
+    mock_sessions.post.side_effect = requests.ConnectionError("refused")
+    deliver(request, "message")
+    mock_sessions.post.side_effect = error
+
+    # Act
+    rejected = deliver(request, "message")
+    mock_sessions.post.side_effect = None
+    mock_sessions.post.return_value.ok = True
+    mock_sessions.post.return_value.status_code = 200
+    mock_sessions.post.return_value.headers = {}
+    healthy = deliver(request, "message")
+
+    # Assert
+    assert rejected.result is Result.REJECTED
+    assert not rejected.retryable
+    assert healthy.result is Result.SENT
+    mock_logging.exception.assert_called_once()
+
+
+@patch("nsp_ntfy.app.main.extractor", new=PayloadExtractor())
+def test_render_notifications_attaches_capture(tmp_path):
+    # Arrange
+    capture = tmp_path / "meteor.jpg"
+    capture.write_bytes(b"jpeg")
+    config = TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="t"))
+    request = compile_request(config)
+    payload = f'{{"notification": "Meteor", "file": "{capture}"}}'.encode()
+    uploads = Attachments(AttachmentConfig(directories=[str(tmp_path)]))
+
+    # Act
+    with patch("nsp_ntfy.app.main.attachments", new=uploads):
+        notifications = render_notifications(payload, config, (request,))
+
+    # Assert
+    [(rendered, message)] = notifications
+    assert rendered.attachment == str(capture.resolve())
+    assert message == "Meteor"
+
+
+@patch("nsp_ntfy.app.main.breakers", new=CircuitBreakers(RetryConfig()))
+@patch("nsp_ntfy.app.main.sessions")
+def test_deliver_streams_attachment(mock_sessions, tmp_path):
+    # Arrange
+    capture = tmp_path / "meteor.jpg"
+    capture.write_bytes(b"jpeg")
+    mock_sessions.put.return_value.ok = True
+    mock_sessions.put.return_value.status_code = 200
+    request = compile_request(TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="t")))
+    request = dataclasses.replace(request, attachment=str(capture))
+    uploads = Attachments(AttachmentConfig(directories=[str(tmp_path)]))
+
+    # Act
+    with patch("nsp_ntfy.app.main.attachments", new=uploads):
+        result = deliver(request, "Meteor captured")
+
+    # Assert
+    assert result.result is Result.SENT
+    mock_sessions.post.assert_not_called()
+    (server, url), kwargs = mock_sessions.put.call_args
+    assert url == request.url
+    assert kwargs["data"].name == str(capture)
+    assert kwargs["headers"]["Filename"] == b"meteor.jpg"
+    assert kwargs["headers"]["Message"] == b"Meteor captured"
+
+
+@patch("nsp_ntfy.app.main.breakers", new=CircuitBreakers(RetryConfig()))
+@patch("nsp_ntfy.app.main.sessions")
+def test_deliver_posts_message_when_attachment_too_large(mock_sessions, tmp_path):
+    # Arrange
+    capture = tmp_path / "meteor.jpg"
+    capture.write_bytes(b"jpeg")
+    mock_sessions.post.return_value.ok = True
+    mock_sessions.post.return_value.status_code = 200
+    request = compile_request(TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="t")))
+    request = dataclasses.replace(request, attachment=str(capture))
+    uploads = Attachments(AttachmentConfig(directories=[str(tmp_path)], max_size=1))
+
+    # Act
+    with patch("nsp_ntfy.app.main.attachments", new=uploads):
+        result = deliver(request, "Meteor captured")
+
+    # Assert
+    assert result.result is Result.SENT
+    mock_sessions.put.assert_not_called()
+    mock_sessions.post.assert_called_once_with(
+        request.server, request.url, data="Meteor captured", headers=request.headers
+    )
+
+
+@patch("nsp_ntfy.app.main.scheduler")
+@patch("nsp_ntfy.app.main.outbox")
+@patch("nsp_ntfy.app.main.deliver")
+def test_post_notification_schedules_retry(mock_deliver, mock_outbox, mock_scheduler):
+    # Arrange
+    mock_deliver.return_value = Outcome(Result.RATE_LIMITED, 429, 5.0)
+    request = compile_request(TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="t")))
+
+    # Act
+    post_notification(request, "message")
+
+    # Assert
+    delay, *args = mock_scheduler.call_later.call_args.args
+    assert delay >= 5.0
+    assert args == [resubmit, post_notification, request, "message", 2]
+    mock_outbox.add.assert_not_called()
+
+
+@patch("nsp_ntfy.app.main.scheduler")
+@patch("nsp_ntfy.app.main.rate_limiter")
+@patch("nsp_ntfy.app.main.deliver")
+def test_post_notification_waits_for_rate_limit(
+    mock_deliver, mock_rate_limiter, mock_scheduler
+):
+    # Arrange
+    mock_rate_limiter.reserve.return_value = 2.5
+    request = compile_request(TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="t")))
+
+    # Act
+    post_notification(request, "message")
+
+    # Assert
+    mock_scheduler.call_later.assert_called_once_with(
+        2.5, resubmit, attempt_notification, request, "message", 1
+    )
+    mock_deliver.assert_not_called()
+
+
+@patch("nsp_ntfy.app.main.rate_limiter")
+@patch("nsp_ntfy.app.main.deliver")
+def test_attempt_notification_throttles_when_rate_limited(
+    mock_deliver, mock_rate_limiter
+):
+    # Arrange
+    mock_deliver.return_value = Outcome(Result.RATE_LIMITED, 429, 30.0)
+    request = compile_request(TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="t")))
+
+    # Act
+    attempt_notification(request, "message", 3)
+
+    # Assert
+    mock_rate_limiter.throttle.assert_called_once_with(request, 30.0)
+
+
+@patch("nsp_ntfy.app.main.outbox")
+@patch("nsp_ntfy.app.main.deliver")
+def test_post_notification_stores_failed_notification(mock_deliver, mock_outbox):
+    # Arrange
+    mock_deliver.return_value = Outcome(Result.TIMEOUT)
+    request = compile_request(TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="t")))
+
+    # Act
+    post_notification(request, "message", attempt=3)
+
+    # Assert
+    mock_outbox.add.assert_called_once_with(request, "message")
+
+
+@patch("nsp_ntfy.app.main.outbox")
+@patch("nsp_ntfy.app.main.start_replay")
+@patch("nsp_ntfy.app.main.deliver")
+def test_post_notification_replays_outbox_after_success(
+    mock_deliver, mock_start_replay, mock_outbox
+):
+    # Arrange
+    mock_deliver.return_value = Outcome(Result.SENT, 200)
+    mock_outbox.pending.return_value = 3
+    request = compile_request(TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="t")))
+
+    # Act
+    post_notification(request, "message")
+
+    # Assert
+    mock_outbox.add.assert_not_called()
+    mock_start_replay.assert_called_once()
+
+
+@patch("nsp_ntfy.app.main.module_configuration", autospec=True)
+def test_get_server_from_module_configuration(mock_module_configuration):
+    # Arrange
+    mock_module_configuration.server = "http://localhost:8080/"
+    config = TopicConfig(mqtt_topic="test/topic", ntfy=Ntfy(topic="test_topic"))
+
+    # Act
+    result = get_server(config)
+
+    # Assert
+    assert result == "http://localhost:8080"
+
+
+@patch("nsp_ntfy.app.main.module_configuration", autospec=True)
+def test_get_server_from_topic_configuration(mock_module_configuration):
+    # Arrange
+    mock_module_configuration.server = "https://ntfy.sh"
+    config = TopicConfig(
+        mqtt_topic="test/topic",
+        ntfy=Ntfy(topic="test_topic", server="https://ntfy.example.com"),
+    )
+
+    # Act
+    result = get_server(config)
+
+    # Assert
+    assert result == "https://ntfy.example.com"
 
 
 @patch("nsp_ntfy.app.main.isfile")
@@ -323,9 +1126,11 @@ def test_get_nsp_configuration_success_merge(
 @patch("nsp_ntfy.app.main.__get_nsp_configuration")
 @patch("nsp_ntfy.app.main.__configure_logging")
 @patch("nsp_ntfy.app.main.mqtt.Client")
+@patch("nsp_ntfy.app.main.signal")
 @patch("nsp_ntfy.app.main.logging")
 def test_run_mqtt_enabled(
     mock_logging,
+    mock_signal,
     mock_mqtt_client,
     mock_configure_logging,
     mock_get_nsp_configuration,
@@ -333,19 +1138,35 @@ def test_run_mqtt_enabled(
 ):
     # Arrange
     args = MagicMock()
+    args.snapshot = None
     args.configuration = "path/to/module/config.json"
     args.nsp_configuration = "path/to/nsp/config.json"
+    args.async_mode = False
 
     mock_module_config = MagicMock()
     mock_module_config.logging = MagicMock()
     mock_module_config.configurations = [
         TopicConfig(mqtt_topic="test/topic", ntfy=Ntfy(topic="test_topic"))
     ]
+    mock_module_config.dispatch = DispatchConfig(workers=1, queue_size=1)
+    mock_module_config.http = HttpConfig()
+    mock_module_config.dedup = None
+    mock_module_config.outbox = None
+    mock_module_config.retry = RetryConfig()
+    mock_module_config.rate_limit = None
+    mock_module_config.metrics = None
+    mock_module_config.payload = PayloadConfig()
+    mock_module_config.watch = None
+    mock_module_config.devices = []
+    mock_module_config.mqtt_session = None
+    mock_module_config.attachments = None
+    mock_module_config.server = None
     mock_get_module_configuration.return_value = mock_module_config
 
     mock_nsp_config = MagicMock()
     mock_nsp_config.mqtt.enabled = True
     mock_nsp_config.mqtt.host = "mqtt://localhost"
+    mock_nsp_config.mqtt.port = 1883
     mock_logging_config = MagicMock()
     mock_get_nsp_configuration.return_value = (mock_nsp_config, mock_logging_config)
 
@@ -363,9 +1184,518 @@ def test_run_mqtt_enabled(
     )
     mock_mqtt_instance.on_connect = on_connect
     mock_mqtt_instance.on_message = on_message
-    mock_mqtt_instance.connect.assert_called_once_with("mqtt://localhost")
-    mock_mqtt_instance.subscribe.assert_called_once_with("test/topic")
+    mock_mqtt_instance.connect.assert_called_once_with("mqtt://localhost", 1883)
+    mock_mqtt_instance.subscribe.assert_not_called()
     mock_mqtt_instance.loop_forever.assert_called_once()
+    handled = [call.args[0] for call in mock_signal.signal.call_args_list]
+    assert handled == [mock_signal.SIGHUP, mock_signal.SIGTERM]
+
+
+@patch("nsp_ntfy.app.main.__get_module_configuration")
+@patch("nsp_ntfy.app.main.__get_nsp_configuration")
+@patch("nsp_ntfy.app.main.__configure_logging")
+@patch("nsp_ntfy.app.main.mqtt.Client")
+@patch("nsp_ntfy.app.main.signal")
+@patch("nsp_ntfy.app.main.logging")
+def test_run_connects_to_each_device(
+    mock_logging,
+    mock_signal,
+    mock_mqtt_client,
+    mock_configure_logging,
+    mock_get_nsp_configuration,
+    mock_get_module_configuration,
+):
+    # Arrange
+    args = MagicMock()
+    args.snapshot = None
+    args.configuration = "path/to/module/config.json"
+    args.nsp_configuration = "path/to/nsp/config.json"
+    args.async_mode = False
+
+    mock_module_config = MagicMock()
+    mock_module_config.logging = MagicMock()
+    mock_module_config.configurations = [
+        TopicConfig(mqtt_topic="test/topic", ntfy=Ntfy(topic="test_topic"))
+    ]
+    mock_module_config.dispatch = DispatchConfig(workers=1, queue_size=1)
+    mock_module_config.http = HttpConfig()
+    mock_module_config.dedup = None
+    mock_module_config.outbox = None
+    mock_module_config.retry = RetryConfig()
+    mock_module_config.rate_limit = None
+    mock_module_config.metrics = None
+    mock_module_config.payload = PayloadConfig()
+    mock_module_config.watch = None
+    mock_module_config.mqtt_session = None
+    mock_module_config.attachments = None
+    mock_module_config.server = None
+    mock_module_config.devices = [
+        DeviceConfig(
+            name="garden", mqtt=MQTTConfig(enabled=True, host="garden.local", port=1884)
+        )
+    ]
+    mock_module_config.configurations.append(
+        TopicConfig(mqtt_topic="garden/topic", ntfy=Ntfy(topic="g"), device="garden")
+    )
+    mock_get_module_configuration.return_value = mock_module_config
+
+    mock_nsp_config = MagicMock()
+    mock_nsp_config.name = "roof"
+    mock_nsp_config.mqtt.enabled = True
+    mock_nsp_config.mqtt.host = "mqtt://localhost"
+    mock_nsp_config.mqtt.port = 1883
+    mock_get_nsp_configuration.return_value = (mock_nsp_config, MagicMock())
+
+    primary, garden = MagicMock(), MagicMock()
+    mock_mqtt_client.side_effect = [primary, garden]
+
+    # Act
+    run(args)
+
+    # Assert
+    primary.connect.assert_called_once_with("mqtt://localhost", 1883)
+    primary.loop_forever.assert_called_once()
+    garden.connect.assert_called_once_with("garden.local", 1884)
+    garden.loop_start.assert_called_once()
+    garden.loop_stop.assert_called_once()
+    assert [b.name for b in main.brokers] == ["roof", "garden"]
+
+
+@patch("nsp_ntfy.app.main.__get_module_configuration")
+@patch("nsp_ntfy.app.main.__get_nsp_configuration")
+@patch("nsp_ntfy.app.main.__configure_logging")
+@patch("nsp_ntfy.app.main.mqtt.Client")
+@patch("nsp_ntfy.app.main.signal")
+@patch("nsp_ntfy.app.main.logging")
+def test_run_keeps_running_when_further_broker_refuses(
+    mock_logging,
+    mock_signal,
+    mock_mqtt_client,
+    mock_configure_logging,
+    mock_get_nsp_configuration,
+    mock_get_module_configuration,
+):
+    # Arrange
+    args = MagicMock()
+    args.snapshot = None
+    args.configuration = "path/to/module/config.json"
+    args.nsp_configuration = "path/to/nsp/config.json"
+    args.async_mode = False
+
+    mock_module_config = MagicMock()
+    mock_module_config.logging = MagicMock()
+    mock_module_config.configurations = [
+        TopicConfig(mqtt_topic="test/topic", ntfy=Ntfy(topic="test_topic"))
+    ]
+    mock_module_config.dispatch = DispatchConfig(workers=1, queue_size=1)
+    mock_module_config.http = HttpConfig()
+    mock_module_config.dedup = None
+    mock_module_config.outbox = None
+    mock_module_config.retry = RetryConfig()
+    mock_module_config.rate_limit = None
+    mock_module_config.metrics = None
+    mock_module_config.payload = PayloadConfig()
+    mock_module_config.watch = None
+    mock_module_config.mqtt_session = None
+    mock_module_config.attachments = None
+    mock_module_config.server = None
+    mock_module_config.devices = [
+        DeviceConfig(
+            name="garden", mqtt=MQTTConfig(enabled=True, host="garden.local", port=1884)
+        )
+    ]
+    mock_module_config.configurations.append(
+        TopicConfig(mqtt_topic="garden/topic", ntfy=Ntfy(topic="g"), device="garden")
+    )
+    mock_get_module_configuration.return_value = mock_module_config
+
+    mock_nsp_config = MagicMock()
+    mock_nsp_config.name = "roof"
+    mock_nsp_config.mqtt.enabled = True
+    mock_nsp_config.mqtt.host = "mqtt://localhost"
+    mock_nsp_config.mqtt.port = 1883
+    mock_get_nsp_configuration.return_value = (mock_nsp_config, MagicMock())
+
+    primary, garden = MagicMock(), MagicMock()
+    mock_mqtt_client.side_effect = [primary, garden]
+    garden.connect.side_effect = ConnectionRefusedError(111, "Connection refused")
+
+    # Act
+    run(args)
+
+    # Assert
+    primary.loop_forever.assert_called_once()
+    garden.loop_start.assert_called_once()
+    assert main.brokers[1].stats()["connect_failures"] == 1
+    assert main.brokers[1].stats()["connected"] == 0
+
+
+@patch("nsp_ntfy.app.main.__get_module_configuration")
+@patch("nsp_ntfy.app.main.__get_nsp_configuration")
+@patch("nsp_ntfy.app.main.__configure_logging")
+@patch("nsp_ntfy.app.main.mqtt.Client")
+@patch("nsp_ntfy.app.aio.AsyncEngine")
+@patch("nsp_ntfy.app.main.signal")
+@patch("nsp_ntfy.app.main.logging")
+def test_run_async_mode(
+    mock_logging,
+    mock_signal,
+    mock_engine,
+    mock_mqtt_client,
+    mock_configure_logging,
+    mock_get_nsp_configuration,
+    mock_get_module_configuration,
+):
+    # Arrange
+    args = MagicMock()
+    args.snapshot = None
+    args.async_mode = True
+
+    mock_module_config = MagicMock()
+    mock_module_config.configurations = [
+        TopicConfig(mqtt_topic="test/topic", ntfy=Ntfy(topic="test_topic"))
+    ]
+    mock_module_config.http = HttpConfig()
+    mock_module_config.dedup = None
+    mock_module_config.outbox = None
+    mock_module_config.retry = RetryConfig()
+    mock_module_config.rate_limit = None
+    mock_module_config.metrics = None
+    mock_module_config.payload = PayloadConfig()
+    mock_module_config.watch = None
+    mock_module_config.devices = []
+    mock_module_config.mqtt_session = None
+    mock_module_config.attachments = None
+    mock_module_config.server = None
+    mock_get_module_configuration.return_value = mock_module_config
+
+    mock_nsp_config = MagicMock()
+    mock_nsp_config.mqtt.enabled = True
+    mock_nsp_config.mqtt.host = "mqtt://localhost"
+    mock_nsp_config.mqtt.port = 1883
+    mock_get_nsp_configuration.return_value = (mock_nsp_config, MagicMock())
+
+    mock_mqtt_instance = MagicMock()
+    mock_mqtt_client.return_value = mock_mqtt_instance
+    mock_engine.return_value.run.side_effect = lambda client, start: start()
+
+    # Act
+    with patch("nsp_ntfy.app.main.dispatcher", None):
+        run(args)
+
+    # Assert
+    mock_engine.return_value.run.assert_called_once()
+    mock_mqtt_instance.connect.assert_called_once_with("mqtt://localhost", 1883)
+    mock_mqtt_instance.subscribe.assert_not_called()
+    mock_mqtt_instance.loop_forever.assert_not_called()
+
+
+def test_connect_keeps_persistent_session():
+    # Arrange
+    configuration = NtfyModuleConfig(
+        logging=LoggingConfig(),
+        mqtt_session=MqttSessionConfig(client_id="bridge", expiry=600),
+    )
+    client = MagicMock()
+    roof = Broker(DeviceConfig(name="roof", mqtt=MQTTConfig(port=1884)), client)
+
+    with (
+        patch("nsp_ntfy.app.main.module_configuration", configuration),
+        patch("nsp_ntfy.app.main.brokers", [roof]),
+        patch("nsp_ntfy.app.main.startup_profile", None),
+    ):
+        # Act
+        main.__connect()
+
+    # Assert
+    client.connect.assert_called_once()
+    assert client.connect.call_args.args == ("mqtt://localhost", 1884)
+    assert client.connect.call_args.kwargs["clean_start"] is False
+    assert client.connect.call_args.kwargs["properties"].SessionExpiryInterval == 600
+
+
+@pytest.mark.parametrize(
+    "session, primary, index, expected",
+    [
+        (None, True, None, ""),
+        (MqttSessionConfig(client_id="bridge"), True, None, "bridge"),
+        (MqttSessionConfig(client_id="bridge"), False, None, "bridge-garden"),
+        (MqttSessionConfig(client_id="bridge"), False, 2, "bridge-garden-2"),
+    ],
+)
+def test_get_client_id(session, primary, index, expected):
+    # Arrange
+    configuration = NtfyModuleConfig(logging=LoggingConfig(), mqtt_session=session)
+    device = DeviceConfig(name="garden", mqtt=MQTTConfig())
+
+    with (
+        patch("nsp_ntfy.app.main.module_configuration", configuration),
+        patch("nsp_ntfy.app.main.worker_index", index),
+    ):
+        # Act
+        result = get_client_id(device, primary)
+
+    # Assert
+    assert result == expected
+
+
+@patch("nsp_ntfy.app.main.engine")
+@patch("nsp_ntfy.app.main.deliver")
+def test_attempt_notification_hands_off_to_async_engine(mock_deliver, mock_engine):
+    # Arrange
+    mock_engine.running = True
+    request = compile_request(TopicConfig(mqtt_topic="t", ntfy=Ntfy(topic="t")))
+
+    # Act
+    attempt_notification(request, "message", 2)
+
+    # Assert
+    mock_engine.attempt.assert_called_once_with(request, "message", 2)
+    mock_deliver.assert_not_called()
+
+
+def module_config(*topics):
+    return NtfyModuleConfig(
+        logging=LoggingConfig(),
+        configurations=[
+            TopicConfig(mqtt_topic=topic, ntfy=Ntfy(topic=topic.replace("/", "-")))
+            for topic in topics
+        ],
+    )
+
+
+def broker(client, name="test"):
+    return Broker(DeviceConfig(name=name, mqtt=MQTTConfig()), client)
+
+
+@patch("nsp_ntfy.app.main.__get_module_configuration")
+@patch("nsp_ntfy.app.main.logging")
+def test_reload_configuration_swaps_routes_and_resubscribes(
+    mock_logging, mock_get_module_configuration
+):
+    # Arrange
+    current = module_config("nsp/a", "nsp/b")
+    mock_get_module_configuration.return_value = module_config("nsp/b", "nsp/c")
+    mqttc = MagicMock()
+
+    with (
+        patch("nsp_ntfy.app.main.module_configuration", current),
+        patch("nsp_ntfy.app.main.routing_index", build_routing_index(current)),
+        patch("nsp_ntfy.app.main.brokers", [broker(mqttc)]),
+    ):
+        # Act
+        reloaded = reload_configuration("config.json")
+
+        # Assert
+        assert reloaded
+        assert get_routes("nsp/a") == ()
+        assert get_routes("nsp/c")[0].config.ntfy.topic == "nsp-c"
+    mqttc.subscribe.assert_called_once_with([("nsp/c", 0)])
+    mqttc.unsubscribe.assert_called_once_with(["nsp/a"])
+
+
+@patch("nsp_ntfy.app.main.__get_module_configuration")
+@patch("nsp_ntfy.app.main.logging")
+def test_reload_configuration_keeps_current_when_invalid(
+    mock_logging, mock_get_module_configuration
+):
+    # Arrange
+    current = module_config("nsp/a")
+    mock_get_module_configuration.side_effect = ValueError("bad json")
+    mqttc = MagicMock()
+
+    with (
+        patch("nsp_ntfy.app.main.module_configuration", current),
+        patch("nsp_ntfy.app.main.routing_index", build_routing_index(current)),
+        patch("nsp_ntfy.app.main.brokers", [broker(mqttc)]),
+    ):
+        # Act
+        reloaded = reload_configuration("config.json")
+
+        # Assert
+        assert not reloaded
+        assert get_routes("nsp/a")
+    mqttc.subscribe.assert_not_called()
+    mqttc.unsubscribe.assert_not_called()
+    mock_logging.error.assert_called_once()
+
+
+@patch("nsp_ntfy.app.main.__get_module_configuration")
+@patch("nsp_ntfy.app.main.logging")
+def test_outbox_replay_keeps_startup_settings_after_reload(
+    mock_logging, mock_get_module_configuration
+):
+    # Arrange
+    current = module_config("nsp/a")
+    current.outbox = OutboxConfig(
+        replay_interval=12.0, replay_batch=7, replay_concurrency=3
+    )
+    mock_get_module_configuration.return_value = module_config("nsp/a")
+    mock_outbox = MagicMock()
+    mock_outbox.pending.return_value = 0
+    mock_scheduler = MagicMock()
+
+    with (
+        patch("nsp_ntfy.app.main.module_configuration", current),
+        patch("nsp_ntfy.app.main.outbox_configuration", current.outbox),
+        patch("nsp_ntfy.app.main.routing_index", build_routing_index(current)),
+        patch("nsp_ntfy.app.main.brokers", [broker(MagicMock())]),
+        patch("nsp_ntfy.app.main.outbox", mock_outbox),
+        patch("nsp_ntfy.app.main.scheduler", mock_scheduler),
+    ):
+        reload_configuration("config.json")
+
+        # Act
+        replay_outbox()
+        getattr(main, "__schedule_replay")()
+
+    # Assert
+    mock_outbox.replay.assert_called_once_with(unittest.mock.ANY, 7, 3)
+    mock_scheduler.call_later.assert_called_once_with(12.0, unittest.mock.ANY)
+
+
+@patch("nsp_ntfy.app.main.__get_module_configuration")
+@patch("nsp_ntfy.app.main.logging")
+def test_reload_configuration_resubscribes_shared_subscriptions(
+    mock_logging, mock_get_module_configuration
+):
+    # Arrange
+    current = module_config("nsp/a")
+    mock_get_module_configuration.return_value = module_config("nsp/c")
+    mqttc = MagicMock()
+
+    with (
+        patch("nsp_ntfy.app.main.module_configuration", current),
+        patch("nsp_ntfy.app.main.routing_index", build_routing_index(current)),
+        patch("nsp_ntfy.app.main.brokers", [broker(mqttc)]),
+        patch("nsp_ntfy.app.main.share_group", "group"),
+    ):
+        # Act
+        reload_configuration("config.json")
+
+    # Assert
+    mqttc.subscribe.assert_called_once_with([("$share/group/nsp/c", 0)])
+    mqttc.unsubscribe.assert_called_once_with(["$share/group/nsp/a"])
+
+
+@patch("nsp_ntfy.app.main.__get_module_configuration")
+@patch("nsp_ntfy.app.main.logging")
+def test_reload_configuration_resubscribes_each_device(
+    mock_logging, mock_get_module_configuration
+):
+    # Arrange
+    current = module_config("nsp/a")
+    configuration = module_config("nsp/a", "nsp/b")
+    configuration.configurations[1].device = "garden"
+    mock_get_module_configuration.return_value = configuration
+    primary, garden = MagicMock(), MagicMock()
+
+    with (
+        patch("nsp_ntfy.app.main.module_configuration", current),
+        patch("nsp_ntfy.app.main.routing_index", build_routing_index(current)),
+        patch("nsp_ntfy.app.main.device_indexes", {}),
+        patch(
+            "nsp_ntfy.app.main.brokers",
+            [broker(primary, "roof"), broker(garden, "garden")],
+        ),
+    ):
+        # Act
+        reload_configuration("config.json")
+
+        # Assert
+        assert get_routes("nsp/b") == ()
+        assert get_routes("nsp/b", "garden")[0].config.ntfy.topic == "nsp-b"
+    primary.subscribe.assert_not_called()
+    garden.subscribe.assert_called_once_with([("nsp/b", 0)])
+
+
+def test_build_device_indexes_scopes_topic_configurations():
+    # Arrange
+    configuration = module_config("nsp/a", "nsp/b")
+    configuration.configurations[1].device = "garden"
+
+    # Act
+    primary = build_routing_index(configuration, "roof")
+    indexes = build_device_indexes(configuration, ["garden"])
+
+    # Assert
+    assert [r.config.mqtt_topic for r in primary.match("nsp/b")] == []
+    assert [r.config.mqtt_topic for r in indexes["garden"].match("nsp/b")] == ["nsp/b"]
+    assert [r.config.mqtt_topic for r in indexes["garden"].match("nsp/a")] == ["nsp/a"]
+
+
+@patch("nsp_ntfy.app.main.get_routes")
+@patch("nsp_ntfy.app.main.logging")
+def test_on_message_routes_by_device_of_broker(mock_logging, mock_get_routes):
+    # Arrange
+    garden = broker(MagicMock(), "garden")
+    msg = MagicMock()
+    msg.topic = "nsp/b"
+    mock_get_routes.return_value = ()
+
+    # Act
+    on_message(garden.client, garden, msg)
+
+    # Assert
+    mock_get_routes.assert_called_once_with("nsp/b", "garden")
+    assert garden.messages == 1
+
+
+@pytest.mark.parametrize(
+    "index, name, expected",
+    [
+        (None, "nsp-ntfy.log", "nsp-ntfy.log"),
+        (2, "nsp-ntfy.log", "nsp-ntfy-2.log"),
+        (0, "outbox", "outbox-0"),
+    ],
+)
+def test_get_worker_file(index, name, expected):
+    # Act
+    with patch("nsp_ntfy.app.main.worker_index", index):
+        result = get_worker_file(name)
+
+    # Assert
+    assert result == expected
+
+
+@pytest.mark.parametrize(
+    "index, port, expected",
+    [
+        (None, 9464, 9464),
+        (0, 9464, 9464),
+        (3, 9464, 9467),
+        (3, 0, 0),
+    ],
+)
+def test_get_worker_port(index, port, expected):
+    # Act
+    with patch("nsp_ntfy.app.main.worker_index", index):
+        result = get_worker_port(port)
+
+    # Assert
+    assert result == expected
+
+
+@patch("nsp_ntfy.app.main.run")
+def test_run_worker_joins_share_group_and_reports_stats(mock_run):
+    # Arrange
+    reports = MagicMock()
+    args = MagicMock()
+
+    with (
+        patch("nsp_ntfy.app.main.worker_index", None),
+        patch("nsp_ntfy.app.main.share_group", None),
+        patch("nsp_ntfy.app.main.stats_reporter", None),
+    ):
+        # Act
+        run_worker(3, reports, args, "group")
+        main.stats_reporter({"sent": 1})
+
+        # Assert
+        assert main.worker_index == 3
+        assert get_subscription("nsp/#") == "$share/group/nsp/#"
+    mock_run.assert_called_once_with(args)
+    reports.put.assert_called_once_with((3, {"sent": 1}))
 
 
 @patch("nsp_ntfy.app.main.__get_module_configuration")
@@ -382,6 +1712,7 @@ def test_run_mqtt_disabled(
 ):
     # Arrange
     args = MagicMock()
+    args.snapshot = None
     args.configuration = "path/to/module/config.json"
     args.nsp_configuration = "path/to/nsp/config.json"
 
@@ -407,3 +1738,161 @@ def test_run_mqtt_disabled(
         "MQTT on NSP not enabled in configuration, exiting NSP-NTFY."
     )
     mock_mqtt_client.assert_not_called()
+
+
+@patch("nsp_ntfy.app.main.__get_module_configuration")
+@patch("nsp_ntfy.app.main.__get_nsp_configuration")
+def test_load_configurations_uses_snapshot(
+    mock_get_nsp_configuration, mock_get_module_configuration, tmp_path
+):
+    # Arrange
+    module_path = tmp_path / "module.json"
+    nsp_path = tmp_path / "nsp.json"
+    module_path.write_text("{}")
+    nsp_path.write_text("{}")
+    args = MagicMock()
+    args.configuration = str(module_path)
+    args.nsp_configuration = str(nsp_path)
+    args.snapshot = str(tmp_path / "snapshot")
+    configuration = module_config("nsp/a")
+    mock_get_module_configuration.return_value = configuration
+    mock_get_nsp_configuration.return_value = (
+        DeviceConfig(name="test", mqtt={"enabled": False}),
+        LoggingConfig(),
+    )
+
+    # Act
+    first = main.__load_configurations(args)
+    second = main.__load_configurations(args)
+
+    # Assert
+    assert first == second
+    mock_get_module_configuration.assert_called_once_with(args.configuration)
+    mock_get_nsp_configuration.assert_called_once_with(args.nsp_configuration)
+
+
+def replay_configurations():
+    module_config = NtfyModuleConfig.from_dict(
+        {
+            "configurations": [{"mqtt_topic": "nsp/a", "ntfy": {"topic": "a"}}],
+            "logging": {"file": "nsp-ntfy.log"},
+            "devices": [
+                {
+                    "name": "roof",
+                    "mqtt": {"enabled": True, "host": "roof", "port": 1884},
+                }
+            ],
+        }
+    )
+    nsp_config = DeviceConfig(
+        name="pi", mqtt=MQTTConfig(enabled=True, host="localhost", port=1883)
+    )
+    return module_config, nsp_config, MagicMock()
+
+
+def write_recording(tmp_path):
+    path = tmp_path / "night.jsonl"
+    path.write_text(
+        encode_record(Record(1.0, "pi", "nsp/a", b"first"))
+        + encode_record(Record(2.0, "roof", "nsp/a", b"second", qos=1, retain=True))
+    )
+    return str(path)
+
+
+@patch("nsp_ntfy.app.main.__load_configurations")
+@patch("nsp_ntfy.app.main.__configure_logging")
+@patch("nsp_ntfy.app.main.mqtt.Client")
+@patch("nsp_ntfy.app.main.signal")
+@patch("nsp_ntfy.app.main.brokers", new=[])
+def test_run_record_captures_each_device(
+    mock_signal, mock_mqtt_client, mock_configure_logging, mock_load, tmp_path
+):
+    # Arrange
+    mock_load.return_value = replay_configurations()
+    clients = [MagicMock(), MagicMock()]
+    mock_mqtt_client.side_effect = clients
+    output = tmp_path / "night.jsonl"
+    args = MagicMock(output=str(output), duration=None)
+
+    def receive():
+        message = MagicMock(topic="nsp/a", payload=b"meteor", qos=0, retain=0)
+        clients[1].on_message(clients[1], main.brokers[1], message)
+
+    clients[0].loop_forever.side_effect = receive
+
+    # Act
+    run_record(args)
+
+    # Assert
+    clients[0].connect.assert_called_once_with("localhost", 1883)
+    clients[1].connect.assert_called_once_with("roof", 1884)
+    clients[1].loop_start.assert_called_once()
+    clients[1].loop_stop.assert_called_once()
+    assert clients[0].on_connect is on_connect
+    [record] = read_records(str(output))
+    assert (record.device, record.topic, record.payload) == ("roof", "nsp/a", b"meteor")
+    mock_configure_logging.return_value.stop.assert_called_once()
+
+
+@patch("nsp_ntfy.app.main.metrics", new=None)
+@patch("nsp_ntfy.app.main.dispatcher", new=None)
+@patch("nsp_ntfy.app.main.on_message")
+@patch("nsp_ntfy.app.main.run")
+def test_run_replay_feeds_recording_to_on_message(mock_run, mock_on_message, tmp_path):
+    # Arrange
+    primary = Broker(DeviceConfig(name="pi", mqtt=MQTTConfig()), MagicMock())
+    roof = Broker(DeviceConfig(name="roof", mqtt=MQTTConfig()), MagicMock())
+    args = MagicMock(recording=write_recording(tmp_path), speed="max", publish=False)
+
+    def run_bridge(arguments):
+        with patch("nsp_ntfy.app.main.brokers", new=[primary, roof]):
+            main.message_source()
+
+    mock_run.side_effect = run_bridge
+
+    # Act
+    run_replay(args)
+
+    # Assert
+    mock_run.assert_called_once_with(args)
+    first, second = mock_on_message.call_args_list
+    assert first.args[:2] == (primary.client, primary)
+    assert (first.args[2].topic, first.args[2].payload) == ("nsp/a", b"first")
+    assert second.args[:2] == (roof.client, roof)
+    assert (second.args[2].qos, second.args[2].retain) == (1, True)
+    assert main.message_source is None
+
+
+@patch("nsp_ntfy.app.main.__load_configurations")
+@patch("nsp_ntfy.app.main.__configure_logging")
+@patch("nsp_ntfy.app.main.mqtt.Client")
+def test_run_replay_publishes_to_broker_of_device(
+    mock_mqtt_client, mock_configure_logging, mock_load, tmp_path
+):
+    # Arrange
+    mock_load.return_value = replay_configurations()
+    clients = [MagicMock(), MagicMock()]
+    mock_mqtt_client.side_effect = clients
+    args = MagicMock(
+        recording=write_recording(tmp_path), speed="10x", publish=True, host=None
+    )
+
+    # Act
+    run_replay(args)
+
+    # Assert
+    clients[0].connect.assert_called_once_with("localhost", 1883)
+    clients[0].publish.assert_called_once_with("nsp/a", b"first", 0)
+    clients[1].publish.assert_called_once_with("nsp/a", b"second", 1)
+    for client in clients:
+        client.disconnect.assert_called_once()
+        client.loop_stop.assert_called_once()
+
+
+def test_run_replay_recording_not_found(tmp_path):
+    # Arrange
+    args = MagicMock(recording=str(tmp_path / "missing.jsonl"))
+
+    # Act / Assert
+    with pytest.raises(IOError):
+        run_replay(args)
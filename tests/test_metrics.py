@@ -0,0 +1,109 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from nsp_ntfy.app.metrics import Metrics, MetricsServer, Registry
+from nsp_ntfy.app.retry import Result
+
+
+def test_histogram_renders_cumulative_buckets():
+    # Arrange
+    registry = Registry()
+    histogram = registry.histogram(
+        "latency_seconds", "Latency.", buckets=(0.1, 1.0), stage="send"
+    )
+
+    # Act
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5.0)
+    text = registry.render()
+
+    # Assert
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{stage="send",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{stage="send",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{stage="send",le="+Inf"} 3' in text
+    assert 'latency_seconds_sum{stage="send"} 5.55' in text
+    assert 'latency_seconds_count{stage="send"} 3' in text
+
+
+def test_counters_with_labels_share_one_family():
+    # Arrange
+    registry = Registry()
+    first = registry.counter("dropped_total", "Dropped.", reason="a")
+    second = registry.counter("dropped_total", "Dropped.", reason='b"c')
+
+    # Act
+    first.inc()
+    second.inc(2)
+    text = registry.render()
+
+    # Assert
+    assert text.count("# TYPE dropped_total counter") == 1
+    assert 'dropped_total{reason="a"} 1' in text
+    assert 'dropped_total{reason="b\\"c"} 2' in text
+
+
+def test_registering_a_name_as_another_type_fails():
+    # Arrange
+    registry = Registry()
+    registry.counter("value", "A counter.")
+
+    # Act / Assert
+    with pytest.raises(ValueError):
+        registry.gauge("value", "A gauge.", lambda: 1)
+
+
+def test_failing_gauge_is_skipped():
+    # Arrange
+    registry = Registry()
+    registry.gauge("broken", "Broken.", lambda: 1 / 0)
+    registry.gauge("depth", "Depth.", lambda: 3)
+
+    # Act
+    text = registry.render()
+
+    # Assert
+    assert "depth 3" in text
+    assert "\nbroken " not in text
+
+
+def test_metrics_record_results():
+    # Arrange
+    metrics = Metrics()
+
+    # Act
+    metrics.record(Result.SENT, 0.0)
+    metrics.record(Result.TIMEOUT, 0.0)
+
+    # Assert
+    assert metrics.sent.value == 1
+    assert metrics.failed["timeout"].value == 1
+    assert sum(metrics.stages["send"].counts) == 2
+
+
+def test_server_serves_metrics():
+    # Arrange
+    metrics = Metrics()
+    metrics.received.inc()
+    server = MetricsServer(metrics.registry, "127.0.0.1", 0)
+    server.start()
+
+    try:
+        # Act
+        with urllib.request.urlopen(
+            f"http://127.0.0.1:{server.port}/metrics"
+        ) as response:
+            content_type = response.headers["Content-Type"]
+            body = response.read().decode("utf-8")
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"http://127.0.0.1:{server.port}/other")
+    finally:
+        server.stop()
+
+    # Assert
+    assert content_type.startswith("text/plain; version=0.0.4")
+    assert "nsp_ntfy_messages_received_total 1" in body
+    assert error.value.code == 404
@@ -0,0 +1,96 @@
+from unittest.mock import MagicMock
+
+from nsp_ntfy.app.data.data_classes import Ntfy, NtfyOptions, TopicConfig
+from nsp_ntfy.app.outbox import Outbox
+from nsp_ntfy.app.request import compile_request
+
+
+def request():
+    return compile_request(
+        TopicConfig(
+            mqtt_topic="nsp/events",
+            ntfy=Ntfy(topic="ntfy-topic", options=NtfyOptions(title="Night Sky 🛰")),
+        )
+    )
+
+
+def test_add_and_take_round_trip(tmp_path):
+    # Arrange
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    ntfy_request = request()
+
+    # Act
+    outbox.add(ntfy_request, "message")
+    result = outbox.take(10)
+
+    # Assert
+    assert len(result) == 1
+    _, stored_request, body = result[0]
+    assert stored_request == ntfy_request
+    assert body == "message"
+
+
+def test_notifications_are_buffered_until_batch_is_full(tmp_path):
+    # Arrange
+    scheduler = MagicMock()
+    outbox = Outbox(str(tmp_path / "outbox.db"), scheduler, batch_size=3)
+
+    # Act
+    outbox.add(request(), "first")
+    outbox.add(request(), "second")
+    stored_before = Outbox(str(tmp_path / "outbox.db")).pending()
+    outbox.add(request(), "third")
+    stored_after = Outbox(str(tmp_path / "outbox.db")).pending()
+
+    # Assert
+    scheduler.call_later.assert_called_once_with(1.0, outbox.flush)
+    assert stored_before == 0
+    assert stored_after == 3
+    scheduler.call_later.return_value.cancel.assert_called_once()
+
+
+def test_outbox_survives_restart(tmp_path):
+    # Arrange
+    path = str(tmp_path / "outbox.db")
+    outbox = Outbox(path, MagicMock())
+    outbox.add(request(), "message")
+    outbox.close()
+
+    # Act
+    reopened = Outbox(path)
+
+    # Assert
+    assert reopened.pending() == 1
+    assert reopened.take(1)[0][2] == "message"
+
+
+def test_replay_removes_sent_notifications(tmp_path):
+    # Arrange
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    for index in range(5):
+        outbox.add(request(), f"message {index}")
+    send = MagicMock(return_value=True)
+
+    # Act
+    replayed = outbox.replay(send, batch_size=2, concurrency=2)
+
+    # Assert
+    assert replayed == 5
+    assert send.call_count == 5
+    assert outbox.pending() == 0
+
+
+def test_replay_stops_when_server_is_unavailable(tmp_path):
+    # Arrange
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    for index in range(5):
+        outbox.add(request(), f"message {index}")
+    send = MagicMock(side_effect=[True, False])
+
+    # Act
+    replayed = outbox.replay(send, batch_size=2, concurrency=1)
+
+    # Assert
+    assert replayed == 1
+    assert outbox.pending() == 4
+    assert outbox.take(1)[0][2] == "message 1"
@@ -0,0 +1,148 @@
+from unittest.mock import patch
+
+import pytest
+
+from nsp_ntfy.app.payload import PayloadExtractor, parse_path
+
+
+def test_parse_path_with_list_index():
+    # Act
+    segments = parse_path("event.details.0.text")
+
+    # Assert
+    assert segments == ("event", "details", 0, "text")
+
+
+@pytest.mark.parametrize("path", ["", "event..text", "event."])
+def test_parse_path_rejects_empty_segments(path):
+    # Act / Assert
+    with pytest.raises(ValueError):
+        parse_path(path)
+
+
+def test_extract_default_field():
+    # Arrange
+    extractor = PayloadExtractor()
+
+    # Act
+    message = extractor.extract(b' {"notification": "ISS pass", "other": [1, 2]}')
+
+    # Assert
+    assert message == "ISS pass"
+    assert extractor.stats()["extracted"] == 1
+
+
+def test_extract_from_bytearray_and_memoryview():
+    # Arrange
+    extractor = PayloadExtractor()
+    payload = b'{"notification": "ISS pass"}'
+
+    # Act
+    from_bytearray = extractor.extract(bytearray(payload))
+    from_memoryview = extractor.extract(memoryview(payload))
+
+    # Assert
+    assert from_bytearray == from_memoryview == "ISS pass"
+
+
+def test_extract_number_as_text():
+    # Arrange
+    extractor = PayloadExtractor()
+
+    # Act
+    message = extractor.extract(b'{"event": {"count": 3}}', "event.count")
+
+    # Assert
+    assert message == "3"
+
+
+@pytest.mark.parametrize(
+    "payload, reason",
+    [
+        (b"", "empty"),
+        (b"x" * 41, "too_large"),
+        (b'["notification"]', "not_object"),
+        (b'{"message": "no notification"}', "missing"),
+        (b'{"notification": ', "invalid"),
+        (b'{"notification": {"a": 1}}', "not_text"),
+        (b'{"notification": null}', "not_text"),
+        (b'{"notification": "\xff"}', "invalid"),
+    ],
+)
+def test_extract_rejects_and_counts(payload, reason):
+    # Arrange
+    extractor = PayloadExtractor(max_size=40)
+
+    # Act
+    message = extractor.extract(payload)
+
+    # Assert
+    assert message is None
+    assert extractor.rejected[reason] == 1
+
+
+def test_missing_key_is_rejected_without_parsing():
+    # Arrange
+    extractor = PayloadExtractor()
+
+    # Act
+    with (
+        patch("nsp_ntfy.app.payload.json.loads") as mock_loads,
+        patch("nsp_ntfy.app.payload.orjson") as mock_orjson,
+    ):
+        message = extractor.extract(b'{"message": "hello"}')
+
+    # Assert
+    assert message is None
+    mock_loads.assert_not_called()
+    mock_orjson.loads.assert_not_called()
+
+
+def test_extract_without_orjson():
+    # Arrange
+    extractor = PayloadExtractor()
+
+    # Act
+    with patch("nsp_ntfy.app.payload.orjson", None):
+        message = extractor.extract(memoryview(b'{"notification": "fallback"}'))
+
+    # Assert
+    assert message == "fallback"
+
+
+@pytest.mark.parametrize(
+    "payload, expected",
+    [
+        (b'{"notification": "\\ud800"}', None),
+        (b'{"notification": {"text": "\\uDC00 pass"}}', None),
+        (b'{"notification": "\\ud83d\\ude80 launch"}', "\U0001f680 launch"),
+    ],
+)
+def test_extract_without_orjson_rejects_lone_surrogates(payload, expected):
+    # Arrange
+    extractor = PayloadExtractor()
+
+    # Act
+    with patch("nsp_ntfy.app.payload.orjson", None):
+        message = extractor.extract(payload)
+
+    # Assert
+    assert message == expected
+    assert extractor.rejected["invalid"] == (expected is None)
+
+
+def test_decode_then_select_fields():
+    # Arrange
+    extractor = PayloadExtractor()
+
+    # Act
+    document = extractor.decode(b'{"satellite": "ISS", "pass": {"time": "21:04"}}')
+    satellite = extractor.select(document, "satellite")
+    missing = extractor.select(document, "notification")
+
+    # Assert
+    assert document == {"satellite": "ISS", "pass": {"time": "21:04"}}
+    assert satellite == "ISS"
+    assert missing is None
+    assert extractor.stats()["extracted"] == 1
+    assert extractor.stats()["rejected missing"] == 1
@@ -0,0 +1,101 @@
+from unittest.mock import patch
+
+from nsp_ntfy.app.data.data_classes import Ntfy, RateLimitConfig, TopicConfig
+from nsp_ntfy.app.ratelimit import RateLimiter, TokenBucket
+from nsp_ntfy.app.request import compile_request
+
+
+def request(topic="ntfy-topic"):
+    return compile_request(TopicConfig(mqtt_topic="nsp", ntfy=Ntfy(topic=topic)))
+
+
+def test_token_bucket_allows_burst_then_spaces_out():
+    # Arrange
+    bucket = TokenBucket(rate=2, burst=2)
+    now = bucket.updated
+
+    # Act
+    delays = []
+    for _ in range(4):
+        delays.append(bucket.delay(now))
+        bucket.take()
+
+    # Assert
+    assert delays == [0, 0, 0.5, 1.0]
+
+
+def test_token_bucket_refills_over_time():
+    # Arrange
+    bucket = TokenBucket(rate=1, burst=1)
+    now = bucket.updated
+    bucket.take()
+
+    # Act
+    delay = bucket.delay(now + 1)
+
+    # Assert
+    assert delay == 0
+
+
+@patch("nsp_ntfy.app.ratelimit.time.monotonic", return_value=100)
+def test_reserve_uses_slowest_bucket(mock_monotonic):
+    # Arrange
+    limiter = RateLimiter(
+        RateLimitConfig(topic_rate=10, topic_burst=10, server_rate=1, server_burst=1)
+    )
+
+    # Act
+    first = limiter.reserve(request("first"))
+    second = limiter.reserve(request("second"))
+
+    # Assert
+    assert first == 0
+    assert second == 1
+    assert limiter.stats()["delayed"] == 1
+
+
+@patch("nsp_ntfy.app.ratelimit.time.monotonic", return_value=100)
+def test_reserve_rejects_beyond_max_delay(mock_monotonic):
+    # Arrange
+    limiter = RateLimiter(RateLimitConfig(topic_rate=1, topic_burst=1, max_delay=1))
+
+    # Act
+    results = [limiter.reserve(request()) for _ in range(4)]
+
+    # Assert
+    assert results == [0, 1, None, None]
+    assert limiter.stats()["rejected"] == 2
+
+
+@patch("nsp_ntfy.app.ratelimit.time.monotonic", return_value=100)
+def test_configured_topic_rate_overrides_default(mock_monotonic):
+    # Arrange
+    limiter = RateLimiter(RateLimitConfig(topic_rate=1, topic_burst=1))
+    limiter.configure_topic(request().url, rate=4, burst=1)
+
+    # Act
+    limiter.reserve(request())
+    delay = limiter.reserve(request())
+
+    # Assert
+    assert delay == 0.25
+
+
+@patch("nsp_ntfy.app.ratelimit.time.monotonic", return_value=100)
+def test_throttle_slows_down_and_recover_speeds_up(mock_monotonic):
+    # Arrange
+    limiter = RateLimiter(RateLimitConfig(server_rate=1, backoff_factor=0.5))
+    ntfy_request = request()
+
+    # Act
+    limiter.throttle(ntfy_request, retry_after=10)
+    throttled = limiter.stats()[f"rate {ntfy_request.server}"]
+    delay = limiter.reserve(ntfy_request)
+    for _ in range(10):
+        limiter.recover(ntfy_request)
+    recovered = limiter.stats()[f"rate {ntfy_request.server}"]
+
+    # Assert
+    assert throttled == 0.5
+    assert delay == 10
+    assert recovered == 1
@@ -0,0 +1,163 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+from nsp_ntfy.app.recording import (
+    Record,
+    Recorder,
+    Replay,
+    decode_record,
+    encode_record,
+    parse_speed,
+    read_records,
+)
+
+
+def test_encode_record_round_trips_text_payload():
+    # Arrange
+    record = Record(1700000000.25, "pi", "nsp/meteor", '{"n": "é"}'.encode(), 1, True)
+
+    # Act
+    line = encode_record(record)
+
+    # Assert
+    assert line.endswith("\n")
+    assert '"payload":"{\\"n\\": \\"é\\"}"' in line
+    assert decode_record(line) == record
+
+
+def test_encode_record_round_trips_binary_payload():
+    # Arrange
+    record = Record(1.5, None, "nsp/raw", b"\xff\x00")
+
+    # Act
+    line = encode_record(record)
+
+    # Assert
+    assert line == '{"t":1.5,"topic":"nsp/raw","payload_b64":"/wA="}\n'
+    assert decode_record(line) == record
+
+
+def test_decode_record_rejects_invalid_line():
+    # Act / Assert
+    with pytest.raises(ValueError, match="invalid record"):
+        decode_record('{"t": 1, "payload": "x"}')
+
+
+def test_recorder_appends_messages_with_device(tmp_path):
+    # Arrange
+    path = tmp_path / "night.jsonl"
+    path.write_text(encode_record(Record(1.0, None, "nsp/old", b"old")))
+    recorder = Recorder(str(path))
+    broker = MagicMock()
+    broker.name = "roof"
+    msg = MagicMock(topic="nsp/new", payload=b"new", qos=0, retain=0)
+
+    # Act
+    recorder.on_message(None, broker, msg)
+    recorder.close()
+
+    # Assert
+    records = list(read_records(str(path)))
+    assert [r.topic for r in records] == ["nsp/old", "nsp/new"]
+    assert records[1].device == "roof"
+    assert recorder.recorded == 1
+
+
+def test_read_records_skips_incomplete_last_line(tmp_path):
+    # Arrange
+    path = tmp_path / "night.jsonl"
+    path.write_text(encode_record(Record(1.0, None, "nsp/a", b"a")) + '{"t":2,"to')
+
+    # Act
+    records = list(read_records(str(path)))
+
+    # Assert
+    assert [r.topic for r in records] == ["nsp/a"]
+
+
+def test_read_records_rejects_corrupt_line(tmp_path):
+    # Arrange
+    path = tmp_path / "night.jsonl"
+    path.write_text('{"t":2,"to\n' + encode_record(Record(1.0, None, "nsp/a", b"a")))
+
+    # Act / Assert
+    with pytest.raises(ValueError):
+        list(read_records(str(path)))
+
+
+@pytest.mark.parametrize(
+    "value,expected", [("10x", 10.0), ("0.5X", 0.5), ("2", 2.0), ("max", 0.0)]
+)
+def test_parse_speed(value, expected):
+    # Act / Assert
+    assert parse_speed(value) == expected
+
+
+@pytest.mark.parametrize("value", ["0x", "-1x", "fast", "infx", "nanx"])
+def test_parse_speed_rejects_invalid_speed(value):
+    # Act / Assert
+    with pytest.raises(ValueError):
+        parse_speed(value)
+
+
+@patch("nsp_ntfy.app.recording.time")
+def test_replay_waits_at_multiple_of_recorded_rate(mock_time):
+    # Arrange
+    mock_time.perf_counter.side_effect = [100.0, 100.5, 101.0, 101.0]
+    replay = Replay(10.0)
+
+    # Act
+    replay.wait(Record(50.0, None, "nsp/a", b""))
+    replay.wait(Record(60.0, None, "nsp/a", b""))
+    replay.wait(Record(60.0, None, "nsp/a", b""))
+    replay.wait(Record(70.0, None, "nsp/a", b""))
+
+    # Assert
+    assert mock_time.sleep.call_args_list == [((0.5,),), ((1.0,),)]
+    assert replay.max_lag == 0.0
+
+
+@patch("nsp_ntfy.app.recording.time")
+def test_replay_records_lag_and_never_waits_at_max_speed(mock_time):
+    # Arrange
+    mock_time.perf_counter.side_effect = [0.0, 3.0]
+    paced = Replay(1.0)
+    unpaced = Replay(0.0)
+
+    # Act
+    paced.wait(Record(0.0, None, "nsp/a", b""))
+    paced.wait(Record(1.0, None, "nsp/a", b""))
+    mock_time.perf_counter.side_effect = [0.0, 0.0]
+    unpaced.wait(Record(0.0, None, "nsp/a", b""))
+    unpaced.wait(Record(100.0, None, "nsp/a", b""))
+
+    # Assert
+    assert paced.max_lag == 2.0
+    mock_time.sleep.assert_not_called()
+
+
+@patch("nsp_ntfy.app.recording.time")
+def test_replay_stats(mock_time):
+    # Arrange
+    mock_time.perf_counter.side_effect = [10.0, 10.002, 10.0, 10.004, 12.0]
+    replay = Replay(0.0)
+
+    # Act
+    replay.wait(Record(0.0, None, "nsp/a", b""))
+    replay.observe(10.0)
+    replay.wait(Record(0.0, None, "nsp/a", b""))
+    replay.observe(10.0)
+    replay.finish()
+    stats = replay.stats()
+
+    # Assert
+    assert stats == {
+        "replayed": 2,
+        "elapsed": 2.0,
+        "rate": 1.0,
+        "max_lag": 0.0,
+        "p50_ms": 2.0,
+        "p95_ms": 4.0,
+        "p99_ms": 4.0,
+        "max_ms": 4.0,
+    }
@@ -0,0 +1,95 @@
+import os
+from unittest.mock import MagicMock
+
+from nsp_ntfy.app.data.data_classes import (
+    ModuleLoggingConfig,
+    Ntfy,
+    NtfyModuleConfig,
+    TopicConfig,
+)
+from nsp_ntfy.app.reload import (
+    FileWatcher,
+    diff_subscriptions,
+    subscriptions_of,
+)
+
+
+def test_subscriptions_of_uses_highest_qos_per_topic():
+    # Arrange
+    configuration = NtfyModuleConfig(
+        logging=ModuleLoggingConfig(),
+        configurations=[
+            TopicConfig(mqtt_topic="b", ntfy=Ntfy(topic="1"), qos=1),
+            TopicConfig(mqtt_topic="a/#", ntfy=Ntfy(topic="2")),
+            TopicConfig(mqtt_topic="b", ntfy=Ntfy(topic="3")),
+        ],
+    )
+
+    # Act
+    result = subscriptions_of(configuration)
+
+    # Assert
+    assert list(result.items()) == [("b", 1), ("a/#", 0)]
+
+
+def test_diff_subscriptions_resubscribes_changed_qos():
+    # Act
+    added, removed = diff_subscriptions({"a": 0, "b": 0}, {"b": 1, "c": 0})
+
+    # Assert
+    assert added == [("b", 1), ("c", 0)]
+    assert removed == ["a"]
+
+
+def test_file_watcher_calls_back_on_change(tmp_path):
+    # Arrange
+    path = tmp_path / "config.json"
+    path.write_text("{}")
+    scheduler = MagicMock()
+    callback = MagicMock()
+    watcher = FileWatcher(str(path), scheduler, 5.0, callback)
+    watcher.start()
+    check = scheduler.call_later.call_args.args[1]
+
+    # Act
+    check()
+    path.write_text('{"changed": true}')
+    check()
+
+    # Assert
+    callback.assert_called_once()
+    assert scheduler.call_later.call_count == 3
+
+
+def test_file_watcher_ignores_missing_file(tmp_path):
+    # Arrange
+    path = tmp_path / "config.json"
+    path.write_text("{}")
+    scheduler = MagicMock()
+    callback = MagicMock()
+    watcher = FileWatcher(str(path), scheduler, 5.0, callback)
+    watcher.start()
+    check = scheduler.call_later.call_args.args[1]
+
+    # Act
+    os.remove(path)
+    check()
+
+    # Assert
+    callback.assert_not_called()
+
+
+def test_file_watcher_stops(tmp_path):
+    # Arrange
+    path = tmp_path / "config.json"
+    path.write_text("{}")
+    scheduler = MagicMock()
+    watcher = FileWatcher(str(path), scheduler, 5.0, MagicMock())
+    watcher.start()
+    timer = scheduler.call_later.return_value
+
+    # Act
+    watcher.stop()
+
+    # Assert
+    timer.cancel.assert_called_once()
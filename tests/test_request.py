@@ -0,0 +1,238 @@
+import pytest
+
+from nsp_ntfy.app.data.data_classes import (
+    Ntfy,
+    NtfyOptions,
+    NtfyTemplate,
+    TopicConfig,
+)
+from nsp_ntfy.app.request import (
+    compile_request,
+    compile_route,
+    priority_of,
+    render_request,
+    resolve_server,
+)
+
+
+def test_compile_request_with_options():
+    # Arrange
+    config = TopicConfig(
+        mqtt_topic="nsp/events",
+        ntfy=Ntfy(
+            topic="ntfy-topic",
+            options=NtfyOptions(title="Night Sky Pi 🛰", priority=4, tags=["a", "b"]),
+        ),
+    )
+
+    # Act
+    request = compile_request(config)
+
+    # Assert
+    assert request.server == "https://ntfy.sh"
+    assert request.url == "https://ntfy.sh/ntfy-topic"
+    assert dict(request.headers) == {
+        "Title": "Night Sky Pi 🛰".encode("utf-8"),
+        "Priority": b"4",
+        "Tags": b"a,b",
+    }
+    assert request.priority == 4
+    assert request.topic == "nsp/events"
+
+
+def test_render_request_keeps_priority_and_topic():
+    # Arrange
+    config = TopicConfig(
+        mqtt_topic="nsp/events",
+        ntfy=Ntfy(
+            topic="ntfy-topic",
+            options=NtfyOptions(
+                title=None, priority=5, template=NtfyTemplate(title="{satellite}")
+            ),
+        ),
+    )
+    request = compile_request(config)
+
+    # Act
+    rendered, _ = render_request(request, {"satellite": "ISS"}, "message")
+
+    # Assert
+    assert rendered.headers["Title"] == b"ISS"
+    assert rendered.priority == 5
+    assert rendered.topic == "nsp/events"
+
+
+def test_compile_request_without_options():
+    # Arrange
+    config = TopicConfig(mqtt_topic="nsp/events", ntfy=Ntfy(topic="ntfy-topic"))
+
+    # Act
+    request = compile_request(config, "http://localhost:8080/")
+
+    # Assert
+    assert request.url == "http://localhost:8080/ntfy-topic"
+    assert dict(request.headers) == {}
+
+
+def test_compile_request_skips_unset_options():
+    # Arrange
+    config = TopicConfig(
+        mqtt_topic="nsp/events",
+        ntfy=Ntfy(topic="ntfy-topic", options=NtfyOptions(title=None, priority=None)),
+    )
+
+    # Act
+    request = compile_request(config)
+
+    # Assert
+    assert dict(request.headers) == {}
+
+
+def test_compiled_request_is_immutable():
+    # Arrange
+    request = compile_request(
+        TopicConfig(mqtt_topic="nsp/events", ntfy=Ntfy(topic="ntfy-topic"))
+    )
+
+    # Act & Assert
+    with pytest.raises(TypeError):
+        request.headers["Title"] = b"changed"
+    with pytest.raises(AttributeError):
+        request.url = "changed"
+
+
+def test_resolve_server_prefers_topic_server():
+    # Arrange
+    config = TopicConfig(
+        mqtt_topic="nsp/events",
+        ntfy=Ntfy(topic="ntfy-topic", server="https://ntfy.example.com/"),
+    )
+
+    # Act
+    result = resolve_server(config, "http://localhost")
+
+    # Assert
+    assert result == "https://ntfy.example.com"
+
+
+def test_compile_route_compiles_every_target():
+    # Arrange
+    config = TopicConfig(
+        mqtt_topic="nsp/events",
+        ntfy=Ntfy(topic="main"),
+        targets=[
+            Ntfy(topic="backup", server="https://ntfy.example.com"),
+            Ntfy(topic="loud", options=NtfyOptions(title="Loud", priority=5)),
+        ],
+    )
+
+    # Act
+    route = compile_route(config, "http://localhost")
+
+    # Assert
+    assert route.config is config
+    assert route.request.url == "http://localhost/main"
+    assert [target.url for target in route.targets] == [
+        "https://ntfy.example.com/backup",
+        "http://localhost/loud",
+    ]
+    assert route.targets[1].headers == {"Title": b"Loud", "Priority": b"5"}
+
+
+def test_render_request_applies_templates():
+    # Arrange
+    config = TopicConfig(
+        mqtt_topic="nsp/events",
+        ntfy=Ntfy(
+            topic="ntfy-topic",
+            options=NtfyOptions(
+                title="Pass",
+                tags=["satellite"],
+                template=NtfyTemplate(
+                    title="{satellite} pass", message="Rises at {pass.time}"
+                ),
+            ),
+        ),
+    )
+    request = compile_request(config)
+
+    # Act
+    rendered, message = render_request(
+        request, {"satellite": "ISS", "pass": {"time": "21:04"}}, "ignored"
+    )
+
+    # Assert
+    assert message == "Rises at 21:04"
+    assert rendered.url == request.url
+    assert rendered.headers == {
+        "Title": b"ISS pass",
+        "Priority": b"3",
+        "Tags": b"satellite",
+    }
+    assert rendered.template is None
+
+
+def test_compile_request_rejects_invalid_template():
+    # Arrange
+    config = TopicConfig(
+        mqtt_topic="nsp/events",
+        ntfy=Ntfy(
+            topic="ntfy-topic",
+            options=NtfyOptions(title=None, template=NtfyTemplate(title="{")),
+        ),
+    )
+
+    # Act & Assert
+    with pytest.raises(ValueError):
+        compile_request(config)
+
+
+@pytest.mark.parametrize(
+    "options, targets, expected",
+    [
+        (None, [], 3),
+        (NtfyOptions(title=None, priority=1), [], 1),
+        (NtfyOptions(title=None, priority=None), [], 3),
+        (
+            NtfyOptions(title=None, priority=2),
+            [Ntfy(topic="t", options=NtfyOptions(title=None, priority=4))],
+            4,
+        ),
+    ],
+)
+def test_priority_of(options, targets, expected):
+    # Arrange
+    config = TopicConfig(
+        mqtt_topic="nsp/events",
+        ntfy=Ntfy(topic="ntfy-topic", options=options),
+        targets=targets,
+    )
+
+    # Act
+    result = priority_of(config)
+
+    # Assert
+    assert result == expected
+
+
+def test_requests_with_equal_options_share_headers():
+    # Arrange
+    first = TopicConfig(
+        mqtt_topic="nsp/a",
+        ntfy=Ntfy(topic="a", options=NtfyOptions(title="Sky", tags=["stars"])),
+    )
+    second = TopicConfig(
+        mqtt_topic="nsp/b",
+        ntfy=Ntfy(topic="b", options=NtfyOptions(title="Sky", tags=["stars"])),
+    )
+
+    # Act
+    requests = compile_request(first), compile_request(second)
+
+    # Assert
+    assert requests[0].headers is requests[1].headers
+    assert dict(requests[0].headers) == {
+        "Title": b"Sky",
+        "Priority": b"3",
+        "Tags": b"stars",
+    }
@@ -0,0 +1,215 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from nsp_ntfy.app.data.data_classes import RetryConfig
+from nsp_ntfy.app.retry import (
+    CircuitBreaker,
+    CircuitBreakers,
+    Outcome,
+    Result,
+    RetryPolicy,
+    classify_error,
+    classify_response,
+    classify_status,
+    parse_retry_after,
+)
+
+
+def response(status, headers=None):
+    mock_response = MagicMock()
+    mock_response.ok = status < 400
+    mock_response.status_code = status
+    mock_response.headers = headers or {}
+    return mock_response
+
+
+def test_classify_rate_limited_response_with_retry_after():
+    # Act
+    outcome = classify_response(response(429, {"Retry-After": "12"}))
+
+    # Assert
+    assert outcome == Outcome(Result.RATE_LIMITED, 429, 12.0)
+    assert outcome.retryable
+
+
+@pytest.mark.parametrize(
+    "status, expected",
+    [
+        (200, Result.SENT),
+        (302, Result.SENT),
+        (400, Result.REJECTED),
+        (429, Result.RATE_LIMITED),
+        (503, Result.SERVER_ERROR),
+    ],
+)
+def test_classify_status(status, expected):
+    # Act
+    outcome = classify_status(status, {})
+
+    # Assert
+    assert outcome.result is expected
+    assert outcome.status == status
+
+
+def test_classify_rejected_response_is_not_retryable():
+    # Act
+    outcome = classify_response(response(403))
+
+    # Assert
+    assert outcome.result is Result.REJECTED
+    assert not outcome.retryable
+
+
+@pytest.mark.parametrize(
+    "error,expected",
+    [
+        (requests.ConnectTimeout(), Result.TIMEOUT),
+        (requests.ReadTimeout(), Result.TIMEOUT),
+        (requests.ConnectionError(), Result.CONNECT_ERROR),
+        (requests.exceptions.InvalidHeader(), Result.REJECTED),
+        (requests.exceptions.InvalidURL(), Result.REJECTED),
+        (requests.exceptions.MissingSchema(), Result.REJECTED),
+        (requests.exceptions.InvalidSchema(), Result.REJECTED),
+    ],
+)
+def test_classify_error(error, expected):
+    assert classify_error(error).result is expected
+
+
+def test_parse_retry_after_http_date():
+    # Act
+    result = parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT")
+
+    # Assert
+    assert result == 0.0
+
+
+@pytest.mark.parametrize("value", [None, "", "soon"])
+def test_parse_retry_after_invalid(value):
+    assert parse_retry_after(value) is None
+
+
+def test_delay_grows_exponentially_without_jitter():
+    # Arrange
+    policy = RetryPolicy(RetryConfig(base_delay=1, max_delay=5, jitter=False))
+
+    # Act
+    delays = [policy.delay(attempt) for attempt in range(1, 5)]
+
+    # Assert
+    assert delays == [1, 2, 4, 5]
+
+
+def test_delay_respects_retry_after():
+    # Arrange
+    policy = RetryPolicy(RetryConfig(base_delay=1, max_delay=60))
+
+    # Act
+    delay = policy.delay(1, retry_after=30)
+
+    # Assert
+    assert delay == 30
+
+
+def test_should_retry_stops_after_max_attempts():
+    # Arrange
+    policy = RetryPolicy(RetryConfig(max_attempts=2))
+    outcome = Outcome(Result.SERVER_ERROR, 503)
+
+    # Assert
+    assert policy.should_retry(outcome, 1)
+    assert not policy.should_retry(outcome, 2)
+    assert not policy.should_retry(Outcome(Result.CIRCUIT_OPEN), 1)
+    assert not policy.should_retry(Outcome(Result.REJECTED, 400), 1)
+
+
+@patch("nsp_ntfy.app.retry.time.monotonic")
+def test_circuit_breaker_opens_and_recovers(mock_monotonic):
+    # Arrange
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    mock_monotonic.return_value = 100
+    failure = Outcome(Result.CONNECT_ERROR)
+
+    # Act & Assert
+    breaker.record(failure)
+    assert breaker.allow()
+    breaker.record(failure)
+    assert not breaker.allow()
+
+    mock_monotonic.return_value = 111
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record(Outcome(Result.SENT, 200))
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+@patch("nsp_ntfy.app.retry.time.monotonic")
+def test_circuit_breaker_reopens_after_failed_trial(mock_monotonic):
+    # Arrange
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    mock_monotonic.return_value = 100
+    breaker.record(Outcome(Result.TIMEOUT))
+    mock_monotonic.return_value = 111
+    breaker.allow()
+
+    # Act
+    breaker.record(Outcome(Result.TIMEOUT))
+
+    # Assert
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_rate_limit_does_not_open_circuit():
+    # Arrange
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+
+    # Act
+    breaker.record(Outcome(Result.RATE_LIMITED, 429))
+
+    # Assert
+    assert breaker.allow()
+
+
+def test_circuit_breakers_are_kept_per_target():
+    # Arrange
+    breakers = CircuitBreakers(RetryConfig(breaker_threshold=1))
+
+    # Act
+    breakers.get("https://ntfy.sh").record(Outcome(Result.CONNECT_ERROR))
+
+    # Assert
+    assert breakers.get("https://ntfy.sh") is breakers.get("https://ntfy.sh")
+    assert breakers.states() == {"https://ntfy.sh": CircuitBreaker.OPEN}
+    assert breakers.get("http://localhost").allow()
+
+
+def test_circuit_breaker_ignores_requests_rejected_before_sending():
+    # Arrange
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.0)
+    breaker.record(Outcome(Result.TIMEOUT))
+
+    # Act
+    breaker.record(Outcome(Result.REJECTED))
+    breaker.record(Outcome(Result.TIMEOUT))
+
+    # Assert
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_half_open_circuit_allows_another_trial_after_local_rejection():
+    # Arrange
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record(Outcome(Result.TIMEOUT))
+    assert breaker.allow()
+
+    # Act
+    breaker.record(Outcome(Result.REJECTED))
+
+    # Assert
+    assert breaker.allow()
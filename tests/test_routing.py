@@ -0,0 +1,100 @@
+import pytest
+
+from nsp_ntfy.app.routing import RoutingIndex, is_wildcard, validate_filter
+
+
+def test_match_literal_topic():
+    # Arrange
+    index = RoutingIndex([("nsp/events", "a"), ("nsp/other", "b")])
+
+    # Act
+    result = index.match("nsp/events")
+
+    # Assert
+    assert result == ("a",)
+
+
+def test_match_returns_every_value_for_duplicate_filters():
+    # Arrange
+    index = RoutingIndex([("nsp/events", "a"), ("nsp/events", "b")])
+
+    # Act
+    result = index.match("nsp/events")
+
+    # Assert
+    assert result == ("a", "b")
+
+
+@pytest.mark.parametrize(
+    "topic_filter,topic,matches",
+    [
+        ("nsp/+/events", "nsp/iss/events", True),
+        ("nsp/+/events", "nsp/iss/other", False),
+        ("nsp/+/events", "nsp/events", False),
+        ("nsp/#", "nsp", True),
+        ("nsp/#", "nsp/iss/events", True),
+        ("nsp/#", "other/iss", False),
+        ("#", "nsp/iss/events", True),
+        ("+/+", "nsp/iss", True),
+        ("+/+", "nsp", False),
+        ("+", "/", False),
+        ("+/+", "/", True),
+        ("#", "$SYS/broker", False),
+        ("+/broker", "$SYS/broker", False),
+        ("$SYS/#", "$SYS/broker", True),
+    ],
+)
+def test_match_wildcards(topic_filter, topic, matches):
+    # Arrange
+    index = RoutingIndex([(topic_filter, "value")])
+
+    # Act
+    result = index.match(topic)
+
+    # Assert
+    assert result == (("value",) if matches else ())
+
+
+def test_match_preserves_configured_order():
+    # Arrange
+    index = RoutingIndex(
+        [("nsp/#", "first"), ("nsp/iss", "second"), ("nsp/+", "third")]
+    )
+
+    # Act
+    result = index.match("nsp/iss")
+
+    # Assert
+    assert result == ("first", "second", "third")
+
+
+@pytest.mark.parametrize("topic_filter", ["", "nsp/#/events", "nsp/a#", "nsp/a+"])
+def test_add_rejects_invalid_filters(topic_filter):
+    with pytest.raises(ValueError):
+        validate_filter(topic_filter)
+
+
+def test_is_wildcard():
+    assert is_wildcard("nsp/+/events")
+    assert is_wildcard("nsp/#")
+    assert not is_wildcard("nsp/events")
+
+
+def test_len_counts_every_filter():
+    # Arrange
+    index = RoutingIndex([("nsp/events", "a"), ("nsp/#", "b")])
+
+    # Assert
+    assert len(index) == 2
+
+
+def test_add_invalidates_cached_matches():
+    # Arrange
+    index = RoutingIndex([("nsp/+", "a")])
+    index.match("nsp/iss")
+
+    # Act
+    index.add("nsp/#", "b")
+
+    # Assert
+    assert index.match("nsp/iss") == ("a", "b")
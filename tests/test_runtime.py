@@ -0,0 +1,150 @@
+import dataclasses
+import pickle
+import sys
+
+import pytest
+
+from nsp_ntfy.app.data.data_classes import (
+    CoalesceConfig,
+    Ntfy,
+    NtfyModuleConfig,
+    NtfyOptions,
+    NtfyTemplate,
+    TopicConfig,
+)
+from nsp_ntfy.app.data.runtime import Lowering, RuntimeTopic, lower_configuration
+from nsp_ntfy.app.reload import subscriptions_of
+from nsp_ntfy.app.request import compile_route
+
+
+def topic_config(index: int, title: str = "Night Sky Pi") -> TopicConfig:
+    return TopicConfig(
+        mqtt_topic=f"nsp/device-{index}",
+        ntfy=Ntfy(
+            topic=f"sky-{index}",
+            options=NtfyOptions(title=title, priority=4, tags=["stars"]),
+            server="https://ntfy.example.com",
+        ),
+        targets=[Ntfy(topic=f"backup-{index}", rate=0.5, burst=2)],
+        coalesce=CoalesceConfig(window_ms=5000),
+        field="event.text",
+        device="roof",
+        qos=1,
+    )
+
+
+def test_lowered_topic_compiles_to_same_route():
+    # Arrange
+    config = topic_config(1)
+
+    # Act
+    lowered = Lowering().topic(config)
+
+    # Assert
+    assert compile_route(lowered, "https://ntfy.sh")[1:] == (
+        compile_route(config, "https://ntfy.sh")[1:]
+    )
+    assert lowered.targets[0].rate == 0.5
+    assert lowered.coalesce.window_ms == 5000
+    assert (lowered.field, lowered.device, lowered.qos) == ("event.text", "roof", 1)
+
+
+def test_lowering_shares_equal_options():
+    # Arrange
+    lowering = Lowering()
+
+    # Act
+    first, second, other = (
+        lowering.topic(topic_config(1)),
+        lowering.topic(topic_config(2)),
+        lowering.topic(topic_config(3, title="Meteor")),
+    )
+
+    # Assert
+    assert first.ntfy.options is second.ntfy.options
+    assert first.coalesce is second.coalesce
+    assert first.ntfy.options is not other.ntfy.options
+    assert other.ntfy.options.tags == ("stars",)
+
+
+def test_lowering_shares_equal_templates():
+    # Arrange
+    lowering = Lowering()
+    options = [
+        NtfyOptions(title=None, template=NtfyTemplate(title="{name}", tags=["{kind}"]))
+        for _ in range(2)
+    ]
+
+    # Act
+    first, second = (lowering.options(o) for o in options)
+
+    # Assert
+    assert first is second
+    assert first.template.tags == ("{kind}",)
+
+
+def test_lowering_interns_strings():
+    # Arrange
+    topic = "".join(["nsp/", "device-", "7"])
+
+    # Act
+    lowered = Lowering().topic(TopicConfig(mqtt_topic=topic, ntfy=Ntfy(topic="sky-7")))
+
+    # Assert
+    assert lowered.mqtt_topic is sys.intern("nsp/device-7")
+
+
+def test_runtime_topic_is_compact_and_immutable():
+    # Arrange
+    lowered = Lowering().topic(topic_config(1))
+
+    # Act / Assert
+    assert not hasattr(lowered, "__dict__")
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        lowered.qos = 2
+
+
+def test_lower_configuration_replaces_topic_configurations():
+    # Arrange
+    configuration = NtfyModuleConfig.from_dict(
+        {
+            "configurations": [
+                {"mqtt_topic": "nsp/a", "ntfy": {"topic": "a"}, "qos": 1},
+                {"mqtt_topic": "nsp/b", "ntfy": {"topic": "b"}, "device": "roof"},
+            ],
+            "logging": {"file": "nsp-ntfy.log"},
+        }
+    )
+
+    # Act
+    result = lower_configuration(configuration)
+
+    # Assert
+    assert result is configuration
+    assert all(isinstance(c, RuntimeTopic) for c in configuration.configurations)
+    assert subscriptions_of(configuration, "pi") == {"nsp/a": 1}
+
+
+def test_lowered_configuration_pickles_with_shared_options():
+    # Arrange
+    configuration = NtfyModuleConfig.from_dict(
+        {
+            "configurations": [
+                {
+                    "mqtt_topic": f"nsp/{i}",
+                    "ntfy": {"topic": "a", "options": {"title": "t"}},
+                }
+                for i in range(2)
+            ],
+            "logging": {"file": "nsp-ntfy.log"},
+        }
+    )
+    lower_configuration(configuration)
+
+    # Act
+    loaded = pickle.loads(pickle.dumps(configuration))
+
+    # Assert
+    first, second = loaded.configurations
+    assert first == configuration.configurations[0]
+    assert first.ntfy.options is second.ntfy.options
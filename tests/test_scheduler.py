@@ -0,0 +1,68 @@
+import threading
+from unittest.mock import MagicMock
+
+from nsp_ntfy.app.scheduler import Scheduler
+
+
+def test_call_later_runs_in_deadline_order():
+    # Arrange
+    scheduler = Scheduler()
+    calls = []
+    done = threading.Event()
+    scheduler.start()
+
+    # Act
+    scheduler.call_later(0.05, lambda: (calls.append("second"), done.set()))
+    scheduler.call_later(0.01, calls.append, "first")
+    done.wait(1)
+    scheduler.stop()
+
+    # Assert
+    assert calls == ["first", "second"]
+
+
+def test_cancelled_timer_does_not_run():
+    # Arrange
+    scheduler = Scheduler()
+    callback = MagicMock()
+    scheduler.start()
+
+    # Act
+    timer = scheduler.call_later(0.01, callback)
+    timer.cancel()
+    pending = scheduler.pending()
+    scheduler.stop(run_pending=True)
+
+    # Assert
+    callback.assert_not_called()
+    assert pending == 0
+
+
+def test_stop_runs_pending_calls():
+    # Arrange
+    scheduler = Scheduler()
+    callback = MagicMock()
+    scheduler.start()
+    scheduler.call_later(60, callback, "message")
+
+    # Act
+    scheduler.stop(run_pending=True)
+
+    # Assert
+    callback.assert_called_once_with("message")
+
+
+def test_failed_call_does_not_stop_scheduler():
+    # Arrange
+    scheduler = Scheduler()
+    done = threading.Event()
+    scheduler.start()
+
+    # Act
+    scheduler.call_later(0, MagicMock(side_effect=RuntimeError("boom")))
+    scheduler.call_later(0.01, done.set)
+    finished = done.wait(1)
+    scheduler.stop()
+
+    # Assert
+    assert finished
@@ -0,0 +1,66 @@
+from unittest.mock import patch
+
+from nsp_ntfy.app.data.data_classes import HttpConfig
+from nsp_ntfy.app.sessions import SessionPool
+
+
+def test_session_is_reused_per_server():
+    # Arrange
+    pool = SessionPool(HttpConfig())
+
+    # Act
+    first = pool.session("https://ntfy.sh")
+    second = pool.session("https://ntfy.sh")
+    other = pool.session("http://localhost")
+
+    # Assert
+    assert first is second
+    assert first is not other
+
+
+def test_session_adapter_uses_pool_size():
+    # Arrange
+    pool = SessionPool(HttpConfig(pool_size=8))
+
+    # Act
+    adapter = pool.session("https://ntfy.sh").get_adapter("https://ntfy.sh/topic")
+
+    # Assert
+    assert adapter._pool_maxsize == 8
+
+
+def test_session_without_keep_alive_closes_connections():
+    # Arrange
+    pool = SessionPool(HttpConfig(keep_alive=False))
+
+    # Act
+    session = pool.session("https://ntfy.sh")
+
+    # Assert
+    assert session.headers["Connection"] == "close"
+
+
+@patch("nsp_ntfy.app.sessions.requests.Session.post")
+def test_post_passes_configured_timeout(mock_post):
+    # Arrange
+    pool = SessionPool(HttpConfig(connect_timeout=1.5, read_timeout=3))
+
+    # Act
+    pool.post("https://ntfy.sh", "https://ntfy.sh/topic", data="message")
+
+    # Assert
+    mock_post.assert_called_once_with(
+        "https://ntfy.sh/topic", data="message", timeout=(1.5, 3)
+    )
+
+
+def test_close_discards_sessions():
+    # Arrange
+    pool = SessionPool(HttpConfig())
+    first = pool.session("https://ntfy.sh")
+
+    # Act
+    pool.close()
+
+    # Assert
+    assert pool.session("https://ntfy.sh") is not first
@@ -0,0 +1,68 @@
+import os
+
+from nsp_ntfy.app.data.data_classes import NtfyModuleConfig
+from nsp_ntfy.app.snapshot import ConfigSnapshot
+
+CONFIGURATION = {
+    "logging": {"file": "ntfy.log"},
+    "configurations": [{"mqtt_topic": "nsp/a", "ntfy": {"topic": "a"}}],
+}
+
+
+def write_sources(tmp_path):
+    module_path = tmp_path / "module.json"
+    nsp_path = tmp_path / "nsp.json"
+    module_path.write_text('{"module": 1}')
+    nsp_path.write_text('{"nsp": 1}')
+    return str(module_path), str(nsp_path)
+
+
+def test_snapshot_round_trip(tmp_path):
+    # Arrange
+    sources = write_sources(tmp_path)
+    snapshot = ConfigSnapshot(str(tmp_path / "snapshot"))
+    configuration = NtfyModuleConfig.from_dict(CONFIGURATION)
+
+    # Act
+    snapshot.save(sources, (configuration, "nsp"))
+    loaded = snapshot.load(sources)
+
+    # Assert
+    assert loaded == (configuration, "nsp")
+
+
+def test_snapshot_missing(tmp_path):
+    # Act
+    loaded = ConfigSnapshot(str(tmp_path / "snapshot")).load(write_sources(tmp_path))
+
+    # Assert
+    assert loaded is None
+
+
+def test_snapshot_invalidated_when_source_changes(tmp_path):
+    # Arrange
+    sources = write_sources(tmp_path)
+    snapshot = ConfigSnapshot(str(tmp_path / "snapshot"))
+    snapshot.save(sources, "configurations")
+    stat = os.stat(sources[0])
+
+    # Act
+    with open(sources[0], "w") as file:
+        file.write('{"module": 2}')
+    os.utime(sources[0], ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    loaded = snapshot.load(sources)
+
+    # Assert
+    assert loaded is None
+
+
+def test_snapshot_ignores_corrupt_file(tmp_path):
+    # Arrange
+    sources = write_sources(tmp_path)
+    (tmp_path / "snapshot").write_bytes(b"not a pickle")
+
+    # Act
+    loaded = ConfigSnapshot(str(tmp_path / "snapshot")).load(sources)
+
+    # Assert
+    assert loaded is None
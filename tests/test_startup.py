@@ -0,0 +1,48 @@
+import os
+import sys
+from unittest.mock import patch
+
+from nsp_ntfy.app.startup import StartupProfile, lazy_import
+
+
+def test_lazy_import_loads_module_on_first_use(tmp_path, monkeypatch):
+    # Arrange
+    (tmp_path / "lazy_probe.py").write_text(
+        "import os\nos.environ['LAZY_PROBE'] = 'loaded'\nVALUE = 42\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setenv("LAZY_PROBE", "")
+    monkeypatch.delitem(sys.modules, "lazy_probe", raising=False)
+
+    # Act
+    module = lazy_import("lazy_probe")
+    loaded_before_use = os.environ["LAZY_PROBE"] == "loaded"
+    value = module.VALUE
+
+    # Assert
+    assert not loaded_before_use
+    assert value == 42
+    assert os.environ["LAZY_PROBE"] == "loaded"
+    monkeypatch.delitem(sys.modules, "lazy_probe")
+
+
+def test_lazy_import_returns_imported_module():
+    # Act
+    module = lazy_import("json")
+
+    # Assert
+    assert module is sys.modules["json"]
+
+
+@patch("nsp_ntfy.app.startup.time.perf_counter")
+def test_startup_profile_reports_stages(mock_perf_counter):
+    # Arrange
+    mock_perf_counter.side_effect = [0.1, 0.25]
+    profile = StartupProfile(0.0)
+
+    # Act
+    profile.mark("import")
+    profile.mark("configuration")
+
+    # Assert
+    assert profile.report() == "import 100.0ms, configuration 150.0ms, total 250.0ms"
@@ -0,0 +1,73 @@
+import threading
+import time
+from unittest.mock import patch
+
+from nsp_ntfy.app.supervisor import Supervisor, aggregate
+
+
+def report_and_exit(index, reports, code):
+    reports.put((index, {"dispatcher": {"completed": index + 1}}))
+    raise SystemExit(code)
+
+
+def report_and_wait(index, reports):
+    reports.put((index, {"payload": {"extracted": 2}, "state": "closed"}))
+    time.sleep(60)
+
+
+def test_aggregate_sums_nested_numbers():
+    # Act
+    total = aggregate(
+        [
+            {"dispatcher": {"completed": 2, "running": True}, "breaker": "open"},
+            {"dispatcher": {"completed": 3}, "rate": 0.5},
+        ]
+    )
+
+    # Assert
+    assert total == {"dispatcher": {"completed": 5}, "rate": 0.5}
+
+
+def supervise(supervisor, until, timeout=20.0):
+    thread = threading.Thread(target=supervisor.run)
+    thread.start()
+    deadline = time.monotonic() + timeout
+    try:
+        while not until() and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        supervisor.stop()
+        thread.join(timeout)
+    assert not thread.is_alive()
+
+
+@patch("nsp_ntfy.app.supervisor.logging")
+def test_supervisor_restarts_exited_workers(mock_logging):
+    # Arrange
+    supervisor = Supervisor(report_and_exit, 1, (1,))
+    supervisor.POLL_INTERVAL = 0.05
+    supervisor.RESTART_DELAY = 0.05
+
+    # Act
+    supervise(supervisor, lambda: supervisor.restarts >= 2)
+
+    # Assert
+    assert supervisor.restarts >= 2
+    assert supervisor.stats()["dispatcher"] == {"completed": 1}
+    assert mock_logging.warning.called
+
+
+@patch("nsp_ntfy.app.supervisor.logging")
+def test_supervisor_stops_workers_and_aggregates_stats(mock_logging):
+    # Arrange
+    supervisor = Supervisor(report_and_wait, 2)
+    supervisor.POLL_INTERVAL = 0.05
+
+    # Act
+    supervise(supervisor, lambda: len(supervisor._stats) == 2)
+
+    # Assert
+    stats = supervisor.stats()
+    assert stats["payload"] == {"extracted": 4}
+    assert stats["workers_alive"] == 0
+    assert supervisor.restarts == 0
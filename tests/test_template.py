@@ -0,0 +1,100 @@
+import pytest
+
+from nsp_ntfy.app.data.data_classes import NtfyTemplate
+from nsp_ntfy.app.template import NotificationTemplate, Template
+
+
+def test_template_renders_nested_fields():
+    # Arrange
+    template = Template("{satellite} passes at {pass.time}, {passes.0.max:.1f}°")
+    document = {
+        "satellite": "ISS",
+        "pass": {"time": "21:04"},
+        "passes": [{"max": 61.25}],
+    }
+
+    # Act
+    result = template.render(document)
+
+    # Assert
+    assert result == "ISS passes at 21:04, 61.2°"
+
+
+def test_template_keeps_escaped_braces():
+    # Arrange
+    template = Template("{{literal}} {name}")
+
+    # Act
+    result = template.render({"name": "value"})
+
+    # Assert
+    assert result == "{literal} value"
+
+
+@pytest.mark.parametrize(
+    "document",
+    [{}, {"name": None}, {"name": {"nested": "x"}}, {"name": "text"}],
+)
+def test_template_returns_none_when_field_unusable(document):
+    # Arrange
+    template = Template("{name.nested:d}")
+
+    # Act
+    result = template.render(document)
+
+    # Assert
+    assert result is None
+
+
+@pytest.mark.parametrize("source", ["{", "{}", "{name!r}", "{a..b}"])
+def test_template_rejects_invalid_source(source):
+    # Act & Assert
+    with pytest.raises(ValueError):
+        Template(source)
+
+
+def test_notification_template_renders_headers():
+    # Arrange
+    template = NotificationTemplate(
+        NtfyTemplate(
+            title="{satellite} pass",
+            priority="{priority}",
+            tags=["{satellite}", "{missing}", "satellite"],
+        )
+    )
+
+    # Act
+    headers = template.headers({"satellite": "ISS", "priority": 4})
+
+    # Assert
+    assert headers == {
+        "Title": b"ISS pass",
+        "Priority": b"4",
+        "Tags": b"ISS,satellite",
+    }
+
+
+def test_notification_template_leaves_out_unrendered_headers():
+    # Arrange
+    template = NotificationTemplate(NtfyTemplate(title="{missing}"))
+
+    # Act
+    headers = template.headers({})
+
+    # Assert
+    assert headers == {}
+
+
+def test_notification_template_strips_line_breaks_from_headers():
+    # Arrange
+    template = NotificationTemplate(
+        NtfyTemplate(title="{sat} pass", priority="{level}", tags=["{tag}"])
+    )
+    document = {"sat": "ISS\r\nX-Injected: 1", "level": "4\n", "tag": "\r\n"}
+
+    # Act
+    headers = template.headers(document)
+
+    # Assert
+    assert headers == {"Title": b"ISS  X-Injected: 1 pass", "Priority": b"4"}
+    assert not any(b"\r" in v or b"\n" in v for v in headers.values())